@@ -0,0 +1,14 @@
+import axios from '@/utils/axios'
+
+// Follows one order over Server-Sent Events. The first message carries the
+// current state; the browser reconnects and resumes on its own.
+// Returns a function that closes the stream.
+export function watchOrder(orderId, email, onEvent) {
+  const url = `${axios.defaults.baseURL}/orders/${orderId}/events/?email=${encodeURIComponent(email)}`
+  const source = new EventSource(url)
+  const handle = message => onEvent(JSON.parse(message.data))
+
+  source.addEventListener('snapshot', handle)
+  source.addEventListener('order', handle)
+  return () => source.close()
+}
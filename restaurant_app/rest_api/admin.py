@@ -1,5 +1,10 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
+from rest_framework import serializers
+
 from .models import OrderItem, Order, MenuItem
+from .services import OrderConflict, check_transition, update_order
 
 
 class OrderItemInline(admin.TabularInline):
@@ -8,21 +13,56 @@ class OrderItemInline(admin.TabularInline):
     can_delete = False
     extra = 0
 
+
+class OrderAdminForm(forms.ModelForm):
+    """Carries the version the page was loaded with, so saves compare-and-swap"""
+    version = forms.IntegerField(widget=forms.HiddenInput)
+
+    class Meta:
+        model = Order
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.instance.pk and cleaned_data.get('version') != self.instance.version:
+            raise ValidationError(OrderConflict.default_detail)
+        new_status = cleaned_data.get('status')
+        if self.instance.pk and new_status and new_status != self.instance.status:
+            try:
+                check_transition(self.instance.status, new_status)
+            except serializers.ValidationError as e:
+                raise ValidationError({'status': e.detail['status']})
+        return cleaned_data
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
+    form = OrderAdminForm
     list_display = ('order_number_uuid', 'customer_name', 'customer_email', 
                    'status', 'created_at', 'total_amount')
     list_filter = ('status', 'created_at')
     search_fields = ('order_number_uuid', 'customer_name', 'customer_email')
     readonly_fields = ('order_number_uuid', 'created_at', 'total_amount')
+    # Matches order_created_idx so the changelist pages by index
+    ordering = ('-created_at', '-id')
     inlines = [OrderItemInline]
     fieldsets = (
         ('Order Information', {
-            'fields': ('order_number_uuid', 'status', 'created_at', 'total_amount')
+            'fields': ('order_number_uuid', 'status', 'created_at', 'total_amount', 'version')
         }),
         ('Customer Details', {
             'fields': ('customer_name', 'customer_email', 'customer_phone', 'delivery_address')
         }),
     )
 
-admin.site.register(MenuItem)
\ No newline at end of file
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # Same path as the API: transition check, version bump, events
+        changes = {field: form.cleaned_data[field] for field in form.changed_data if field != 'version'}
+        try:
+            update_order(Order.objects.get(pk=obj.pk), changes, expected_version=form.cleaned_data['version'])
+        except OrderConflict as e:
+            messages.error(request, str(e.detail))
+
+admin.site.register(MenuItem)
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class RestApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "rest_api"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .metrics import install_query_timer
+        from .querycheck import install_query_inspector
+
+        connection_created.connect(install_query_timer)
+        connection_created.connect(install_query_inspector)
@@ -0,0 +1,50 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .cache import current_token_revision
+
+# Claims written by ClaimsTokenObtainPairSerializer
+USER_CLAIMS = ('email', 'is_staff', 'token_rev')
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that builds request.user from the token claims
+    instead of loading UserObject on every request.
+
+    request.user is a TokenUser exposing id, email and is_staff. Tokens of
+    a user that was deactivated, changed password or had its claims
+    changed are rejected: they carry the user's tokens_valid_after from
+    when they were issued, which no longer matches the row (read through
+    the shared cache).
+    Tokens issued before the claims were added fall back to the database.
+    """
+
+    def get_user(self, validated_token):
+        if any(claim not in validated_token for claim in USER_CLAIMS):
+            return super().get_user(validated_token)
+
+        # Any revocation since the token was issued changes the revision
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        if validated_token['token_rev'] != current_token_revision(user_id):
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+
+        return TokenUser(validated_token)
+
+
+class StreamJWTAuthentication(ClaimsJWTAuthentication):
+    """
+    Also accepts the access token as the ``access_token`` query parameter,
+    since browser EventSource connections cannot set headers.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        raw_token = request.GET.get('access_token')
+        if result is not None or not raw_token:
+            return result
+        validated_token = self.get_validated_token(raw_token.encode())
+        return self.get_user(validated_token), validated_token
@@ -0,0 +1,142 @@
+"""
+Scripted API scenarios for the seed_data and loadtest commands.
+
+A scenario is one virtual user's pass through the API, made with
+``session.request(endpoint, method, path, **kwargs)``. The load generator's
+session times each request over HTTP; the tests run the same scenarios
+through the test client to hold every endpoint to its query budget.
+"""
+import math
+import statistics
+from dataclasses import dataclass
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from .models import MenuItem, Order
+
+SEED_DOMAIN = 'seed.example.com'
+SEED_PASSWORD = 'benchmark-password'
+STAFF_EMAIL = f'staff@{SEED_DOMAIN}'
+
+# Most queries a single request to each endpoint may run, cold caches included
+QUERY_BUDGETS = {
+    'menu': 2,
+    'menu_item': 1,
+    'checkout': 9,
+    'order_lookup': 3,
+    'payment_status': 1,
+    'login': 2,
+    'user': 1,
+    'my_orders': 1,
+    'staff_orders': 2,
+    'staff_order': 3,
+}
+
+
+@dataclass
+class SeedData:
+    """Ids and credentials of seeded rows that the scenarios pick from"""
+    menu_ids: list
+    orders: list
+    users: list
+    staff_email: str
+
+    @classmethod
+    def load(cls, sample=1000):
+        """Returns None when nothing has been seeded"""
+        seeded = f'@{SEED_DOMAIN}'
+        menu_ids = list(MenuItem.objects.filter(is_available=True).values_list('id', flat=True)[:sample])
+        orders = [
+            (str(order_number_uuid), email)
+            for order_number_uuid, email in Order.objects.filter(
+                customer_email__endswith=seeded, payment_status__isnull=False,
+            ).order_by('-id').values_list('order_number_uuid', 'customer_email')[:sample]
+        ]
+        users = list(
+            get_user_model().objects.filter(email__endswith=seeded, is_staff=False)
+            .order_by('id').values_list('email', flat=True)[:sample]
+        )
+        if not (menu_ids and orders and users):
+            return None
+        return cls(menu_ids, orders, users, STAFF_EMAIL)
+
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def sign_in(session, email):
+    response = session.request('login', 'POST', reverse('sign_in'), json={
+        'email': email,
+        'password': SEED_PASSWORD,
+    })
+    return response.json()['access']
+
+
+def browse_menu(session, data, rng):
+    session.request('menu', 'GET', reverse('menu'))
+    session.request('menu_item', 'GET', reverse('menu_uid', args=[rng.choice(data.menu_ids)]))
+
+
+def checkout(session, data, rng):
+    lines = rng.sample(data.menu_ids, min(len(data.menu_ids), rng.randint(1, 4)))
+    session.request('checkout', 'POST', reverse('order'), json={
+        'customer_name': 'Load Test',
+        'customer_email': f'guest{rng.randrange(10 ** 6)}@{SEED_DOMAIN}',
+        'customer_phone': '000000000',
+        'delivery_address': 'Benchmark Street 1',
+        'items': [{'menu_item': pk, 'quantity': rng.randint(1, 3)} for pk in lines],
+    })
+
+
+def poll_status(session, data, rng):
+    order_number_uuid, email = rng.choice(data.orders)
+    path = reverse('order_id', args=[order_number_uuid])
+    session.request('order_lookup', 'GET', path, params={'email': email})
+    session.request('payment_status', 'GET', path, params={'email': email, 'check_payment': 'true'})
+
+
+def login(session, data, rng):
+    headers = bearer(sign_in(session, rng.choice(data.users)))
+    session.request('user', 'GET', reverse('user'), headers=headers)
+    session.request('my_orders', 'GET', reverse('order'), headers=headers)
+
+
+def staff_dashboard(session, data, rng):
+    if 'staff_token' not in session.state:
+        session.state['staff_token'] = sign_in(session, data.staff_email)
+    headers = bearer(session.state['staff_token'])
+    page = session.request('staff_orders', 'GET', reverse('order'), params={'page_size': 50}, headers=headers)
+    results = page.json()['results']
+    if results:
+        order_number_uuid = rng.choice(results)['order_number_uuid']
+        session.request('staff_order', 'GET', reverse('order_id', args=[order_number_uuid]), headers=headers)
+
+
+SCENARIOS = {
+    'browse_menu': browse_menu,
+    'checkout': checkout,
+    'poll_status': poll_status,
+    'login': login,
+    'staff_dashboard': staff_dashboard,
+}
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an already sorted list"""
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(latencies):
+    """Latency statistics in milliseconds for a list of durations in seconds"""
+    if not latencies:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'mean_ms': None, 'max_ms': None}
+    ordered = sorted(latencies)
+    return {
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 2),
+        'mean_ms': round(statistics.mean(ordered) * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
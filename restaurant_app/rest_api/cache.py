@@ -0,0 +1,231 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+MENU_VERSION_KEY = 'menu:version'
+MENU_LIST_KEY = 'menu:list:{version}'
+ORDER_PAYMENT_KEY = 'order:payment:{uuid}'
+
+
+class LocalLRU:
+    """Small thread-safe LRU kept in front of the shared cache"""
+
+    def __init__(self, size):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = LocalLRU(getattr(settings, 'MENU_LOCAL_CACHE_SIZE', 8))
+_batch = threading.local()
+
+
+def menu_cache():
+    return caches['menu']
+
+
+def get_menu_version():
+    version = menu_cache().get(MENU_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so an evicted counter never reuses an old key
+        menu_cache().add(MENU_VERSION_KEY, time.time_ns(), timeout=None)
+        version = menu_cache().get(MENU_VERSION_KEY)
+    return version
+
+
+def _bump():
+    try:
+        menu_cache().incr(MENU_VERSION_KEY)
+    except ValueError:
+        menu_cache().add(MENU_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def bump_menu_version():
+    """Invalidate the rendered menu now and again once the transaction commits"""
+    if getattr(_batch, 'depth', 0):
+        _batch.dirty = True
+        return
+    _bump()
+    # A reader racing the open transaction may cache the old rows under the
+    # new version, so bump once more after commit.
+    transaction.on_commit(_bump)
+
+
+@contextmanager
+def menu_batch():
+    """Collapse every menu change made inside the block into one bump"""
+    _batch.depth = getattr(_batch, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _batch.depth -= 1
+        if _batch.depth == 0 and getattr(_batch, 'dirty', False):
+            _batch.dirty = False
+            bump_menu_version()
+
+
+def render_menu():
+    from .models import MenuItem
+    from .serializers import MenuItemSerializer
+
+    items = MenuItem.objects.all()
+    if not items:
+        return b''
+    return JSONRenderer().render(MenuItemSerializer(items, many=True).data)
+
+
+def get_menu_payload():
+    """
+    Return (version, json bytes) for the full menu. An empty payload means
+    there are no menu items.
+    """
+    version = get_menu_version()
+    key = MENU_LIST_KEY.format(version=version)
+
+    payload = _local.get(key)
+    if payload is not None:
+        return version, payload
+
+    payload = menu_cache().get(key)
+    if payload is None:
+        payload = render_menu()
+        menu_cache().set(key, payload, settings.MENU_CACHE_TIMEOUT)
+    _local.set(key, payload)
+    return version, payload
+
+
+def clear_menu_cache():
+    _local.clear()
+    menu_cache().clear()
+
+
+def cache_order_payment(order):
+    """Publish the payment state that check_payment answers with"""
+    caches['shared'].set(ORDER_PAYMENT_KEY.format(uuid=order.order_number_uuid), {
+        'email': order.customer_email,
+        'status': order.status,
+        'payuStatus': order.payment_status,
+    }, settings.ORDER_PAYMENT_CACHE_TIMEOUT)
+
+
+def get_order_payment(order_number_uuid):
+    return caches['shared'].get(ORDER_PAYMENT_KEY.format(uuid=str(order_number_uuid).lower()))
+
+
+def forget_order_payment(order_number_uuid):
+    key = ORDER_PAYMENT_KEY.format(uuid=order_number_uuid)
+    caches['shared'].delete(key)
+    transaction.on_commit(lambda: caches['shared'].delete(key))
+
+
+USER_KEY = 'user:{id}'
+USER_REVISION_KEY = 'auth:revision:{id}'
+
+
+def get_user_data(user_id):
+    """
+    Serialized profile of ``user_id`` as returned by UserEndpoint.get,
+    cached for USER_CACHE_TIMEOUT. None if there is no such active user.
+    """
+    from .models import UserObject
+    from .serializers import UserSerializer
+
+    key = USER_KEY.format(id=user_id)
+    data = caches['shared'].get(key)
+    if data is None:
+        user = UserObject.objects.filter(pk=user_id, is_active=True).first()
+        if user is None:
+            return None
+        data = dict(UserSerializer(user).data)
+        caches['shared'].set(key, data, settings.USER_CACHE_TIMEOUT)
+    return data
+
+
+def forget_user(user_id):
+    key = USER_KEY.format(id=user_id)
+    caches['shared'].delete(key)
+    transaction.on_commit(lambda: caches['shared'].delete(key))
+
+
+# Token revision of a user who may not sign in; no token carries it
+REVOKED = -1
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def token_revision(user):
+    """
+    ``user.tokens_valid_after`` in epoch microseconds (0 if it was never
+    set), REVOKED for missing and inactive users. Tokens carry the value
+    they were issued with; any revocation changes it.
+    """
+    if user is None or not user.is_active:
+        return REVOKED
+    if user.tokens_valid_after is None:
+        return 0
+    return (user.tokens_valid_after - EPOCH) // timedelta(microseconds=1)
+
+
+def revoke_user_tokens(user_id):
+    """
+    Reject every token of ``user_id`` issued up to now. The moment is
+    stored on the user row; the cache only saves reading it per request.
+    """
+    from .models import UserObject
+
+    now = timezone.now()
+    UserObject.objects.filter(pk=user_id).update(tokens_valid_after=now)
+    key = USER_REVISION_KEY.format(id=user_id)
+    caches['shared'].set(key, (now - EPOCH) // timedelta(microseconds=1), settings.TOKEN_REVOCATION_CACHE_TIMEOUT)
+    # Re-read after commit, so a rolled back revocation is not kept
+    transaction.on_commit(lambda: caches['shared'].delete(key))
+
+
+def remember_token_revision(user):
+    """Prime the cached revision from a user row already in hand (e.g. at sign in)"""
+    caches['shared'].add(
+        USER_REVISION_KEY.format(id=user.pk), token_revision(user), settings.TOKEN_REVOCATION_CACHE_TIMEOUT
+    )
+
+
+def current_token_revision(user_id):
+    """
+    The revision tokens of ``user_id`` must carry to be accepted. A cache
+    miss reads the user row, so restarts and evictions never forget a
+    revocation.
+    """
+    from .models import UserObject
+
+    key = USER_REVISION_KEY.format(id=user_id)
+    revision = caches['shared'].get(key)
+    if revision is None:
+        revision = token_revision(
+            UserObject.objects.filter(pk=user_id).only('is_active', 'tokens_valid_after').first()
+        )
+        caches['shared'].set(key, revision, settings.TOKEN_REVOCATION_CACHE_TIMEOUT)
+    return revision
@@ -0,0 +1,283 @@
+import asyncio
+import time
+import weakref
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from .models import Order, OrderEvent
+from .serializers import FullOrderSerializer
+
+# Orders the kitchen still has to act on
+ACTIVE_STATUSES = ('pending', 'confirmed', 'preparing', 'out_for_delivery')
+
+
+@dataclass(frozen=True)
+class RenderedEvent:
+    """An event rendered once: JSON ``data`` for long-polls, ``frame`` for SSE"""
+    id: int
+    order_number_uuid: str
+    event: str
+    data: bytes
+
+    @property
+    def frame(self):
+        return b'id: %d\nevent: %s\ndata: %s\n\n' % (self.id, self.event.encode(), self.data)
+
+
+def render(event_id, event, kind, order_number_uuid, order_status, payment_status, body):
+    return RenderedEvent(event_id, str(order_number_uuid), event, JSONRenderer().render({
+        'id': event_id,
+        'kind': kind,
+        'order_number_uuid': str(order_number_uuid),
+        'status': order_status,
+        'payment_status': payment_status,
+        'order': body,
+    }))
+
+
+def render_events(events):
+    """
+    Render OrderEvent rows once, for every subscriber. Orders and their
+    items are loaded in bulk; deleted orders have no body.
+    """
+    orders = Order.objects.with_items().in_bulk({event.order_id for event in events if event.order_id})
+    bodies = {pk: FullOrderSerializer(order).data for pk, order in orders.items()}
+    return [
+        render(event.id, 'order', event.kind, event.order_number_uuid, event.status,
+               event.payment_status, bodies.get(event.order_id))
+        for event in events
+    ]
+
+
+def fetch_events(after_id, limit, until_id=None, order_number_uuid=None, ids=None):
+    events = OrderEvent.objects.order_by('id')
+    if ids is not None:
+        events = events.filter(id__in=ids)
+    else:
+        events = events.filter(id__gt=after_id)
+    if until_id is not None:
+        events = events.filter(id__lte=until_id)
+    if order_number_uuid is not None:
+        events = events.filter(order_number_uuid=order_number_uuid)
+    return render_events(list(events[:limit]))
+
+
+def render_snapshot(cursor, order_number_uuid=None):
+    """
+    Current state as 'snapshot' events stamped with ``cursor``, for clients
+    that connect without a cursor or whose cursor was purged
+    """
+    orders = Order.objects.with_items().order_by('created_at', 'id')
+    if order_number_uuid is not None:
+        orders = orders.filter(order_number_uuid=order_number_uuid)
+    else:
+        orders = orders.filter(status__in=ACTIVE_STATUSES)[:settings.ORDER_EVENTS_SNAPSHOT_SIZE]
+    return [
+        render(cursor, 'snapshot', 'snapshot', order.order_number_uuid, order.status,
+               order.payment_status, FullOrderSerializer(order).data)
+        for order in orders
+    ]
+
+
+def first_event_id():
+    return OrderEvent.objects.order_by('id').values_list('id', flat=True).first() or 0
+
+
+def last_event_id():
+    return OrderEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+class Subscription:
+    def __init__(self, order_number_uuid=None):
+        self.order_number_uuid = order_number_uuid
+        self.queue = asyncio.Queue(settings.ORDER_EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow reader: drop it, the client resumes from its cursor
+            self.overflowed = True
+
+
+class _Hub:
+    """Subscribers of one event loop, fed by a single poller task"""
+
+    def __init__(self):
+        self.everything = set()
+        self.by_order = {}
+        self.last_id = None
+        self.gaps = {}
+        self.task = None
+        self.lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self.everything) + sum(len(subs) for subs in self.by_order.values())
+
+    async def ready(self):
+        async with self.lock:
+            if self.last_id is None:
+                self.last_id = await sync_to_async(last_event_id)()
+
+    def add(self, subscription):
+        if subscription.order_number_uuid is None:
+            self.everything.add(subscription)
+        else:
+            self.by_order.setdefault(subscription.order_number_uuid, set()).add(subscription)
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def remove(self, subscription):
+        self.everything.discard(subscription)
+        subs = self.by_order.get(subscription.order_number_uuid)
+        if subs is not None:
+            subs.discard(subscription)
+            if not subs:
+                del self.by_order[subscription.order_number_uuid]
+
+    def publish(self, event):
+        for subscription in list(self.everything) + list(self.by_order.get(event.order_number_uuid, ())):
+            subscription.offer(event)
+
+    async def run(self):
+        batch = settings.ORDER_EVENTS_BATCH
+        while len(self):
+            events = await sync_to_async(fetch_events)(self.last_id, batch)
+            if self.gaps:
+                events += await sync_to_async(fetch_events)(None, batch, ids=list(self.gaps))
+            self.track_gaps(events)
+            for event in events:
+                self.publish(event)
+            if len(events) < batch:
+                await asyncio.sleep(settings.ORDER_EVENTS_POLL_INTERVAL)
+        # Idle: the next subscriber starts from the head again
+        self.task = None
+        self.last_id = None
+        self.gaps.clear()
+
+    def track_gaps(self, events):
+        """
+        Ids are handed out before commit, so on databases with concurrent
+        writers a lower id can become visible after a higher one. Missing
+        ids are re-polled for ORDER_EVENTS_GAP_TIMEOUT seconds.
+        """
+        now = time.monotonic()
+        for event in events:
+            self.gaps.pop(event.id, None)
+            if event.id > self.last_id:
+                for missing in range(self.last_id + 1, event.id):
+                    self.gaps[missing] = now
+                self.last_id = event.id
+        for missing, seen in list(self.gaps.items()):
+            if now - seen > settings.ORDER_EVENTS_GAP_TIMEOUT:
+                del self.gaps[missing]
+
+
+class OrderEventBroadcaster:
+    """
+    Fans OrderEvent rows out to streaming clients. Each event loop polls
+    the table once per ORDER_EVENTS_POLL_INTERVAL no matter how many clients
+    are connected, and every event is rendered once for all of them.
+    """
+
+    def __init__(self):
+        self._hubs = weakref.WeakKeyDictionary()
+
+    def hub(self):
+        loop = asyncio.get_running_loop()
+        hub = self._hubs.get(loop)
+        if hub is None:
+            hub = self._hubs[loop] = _Hub()
+        return hub
+
+    @asynccontextmanager
+    async def subscribe(self, order_number_uuid=None):
+        """
+        Register a Subscription for the block. Yields it with the id of the
+        last event already published: everything after that id arrives on
+        the subscription's queue.
+        """
+        hub = self.hub()
+        subscription = Subscription(order_number_uuid)
+        while hub.last_id is None:
+            await hub.ready()
+        # No await between these two, so no event can fall in between
+        hub.add(subscription)
+        snapshot = hub.last_id
+        try:
+            yield subscription, snapshot
+        finally:
+            hub.remove(subscription)
+
+    async def backlog(self, cursor, snapshot, order_number_uuid=None):
+        """
+        Events from ``cursor`` up to ``snapshot``; the current state as
+        snapshot events when there is no cursor or it was purged
+        """
+        if cursor is not None and cursor < await sync_to_async(first_event_id)() - 1:
+            cursor = None
+        if cursor is None:
+            for event in await sync_to_async(render_snapshot)(snapshot, order_number_uuid):
+                yield event
+            return
+        while cursor < snapshot:
+            replay = await sync_to_async(fetch_events)(
+                cursor, settings.ORDER_EVENTS_BATCH, until_id=snapshot,
+                order_number_uuid=order_number_uuid,
+            )
+            if not replay:
+                break
+            for event in replay:
+                yield event
+            cursor = replay[-1].id
+
+    async def frames(self, cursor=None, order_number_uuid=None):
+        """
+        SSE frames: the backlog from ``cursor``, then live events until
+        ORDER_EVENTS_STREAM_TIMEOUT, with heartbeats in between. Clients
+        reconnect with the last id they saw.
+        """
+        async with self.subscribe(order_number_uuid) as (subscription, snapshot):
+            yield f'retry: {settings.ORDER_EVENTS_RETRY_MS}\n\n'.encode()
+            async for event in self.backlog(cursor, snapshot, order_number_uuid):
+                yield event.frame
+
+            deadline = time.monotonic() + settings.ORDER_EVENTS_STREAM_TIMEOUT
+            while not subscription.overflowed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(), min(remaining, settings.ORDER_EVENTS_HEARTBEAT)
+                    )
+                except asyncio.TimeoutError:
+                    yield b': keepalive\n\n'
+                    continue
+                yield event.frame
+
+    async def poll(self, cursor, order_number_uuid, timeout):
+        """
+        Long-poll: the backlog from ``cursor`` if there is one, otherwise
+        wait up to ``timeout`` seconds for live events. Returns the events
+        and the cursor to poll with next.
+        """
+        async with self.subscribe(order_number_uuid) as (subscription, snapshot):
+            events = [event async for event in self.backlog(cursor, snapshot, order_number_uuid)]
+            if not events:
+                try:
+                    events.append(await asyncio.wait_for(subscription.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    pass
+                while not subscription.queue.empty():
+                    events.append(subscription.queue.get_nowait())
+            next_cursor = max([cursor or 0, snapshot] + [event.id for event in events])
+        return events, next_cursor
+
+
+broadcaster = OrderEventBroadcaster()
@@ -0,0 +1,43 @@
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+def parse_moment(value, end_of_day=False):
+    """Accepts an ISO datetime or a plain date (start or end of that day)"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def filter_orders(queryset, params):
+    """Staff order list filters: status, payment_status, customer_email, created_after/before"""
+    for field in ('status', 'payment_status', 'customer_email'):
+        value = params.get(field)
+        if value:
+            queryset = queryset.filter(**{field: value})
+
+    errors = {}
+    for param, lookup, end_of_day in (
+        ('created_after', 'created_at__gte', False),
+        ('created_before', 'created_at__lte', True),
+    ):
+        value = params.get(param)
+        if not value:
+            continue
+        try:
+            queryset = queryset.filter(**{lookup: parse_moment(value, end_of_day)})
+        except ValueError:
+            errors[param] = ['Expected an ISO date or datetime.']
+
+    if errors:
+        raise ValidationError(errors)
+    return queryset
@@ -0,0 +1,59 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, ScryptPasswordHasher, make_password
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """
+    scrypt with its cost taken from the PASSWORD_SCRYPT_* settings. Hashes
+    made with other parameters still verify and are rehashed on the next
+    successful login.
+    """
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_N
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT_R
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT_P
+
+    @property
+    def maxmem(self):
+        # OpenSSL caps scrypt at 32 MiB unless told otherwise; leave room
+        # for hashes made with up to twice the configured memory
+        return 2 * 128 * self.work_factor * self.block_size + 1024 * 1024
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2id with its cost taken from the PASSWORD_ARGON2_* settings; needs argon2-cffi"""
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+# Hashing releases the GIL, so a few threads keep every core busy while
+# the event loop stays free; the pool size bounds CPU spent on hashing.
+hash_pool = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash'
+)
+
+
+async def make_password_async(password):
+    """make_password on hash_pool, for async views"""
+    return await asyncio.get_running_loop().run_in_executor(hash_pool, make_password, password)
@@ -0,0 +1,218 @@
+"""
+Structured logging: JSON records written by a background thread, a
+correlation id per request, and filters that keep error bursts and busy
+endpoints from flooding the output. Wired up by LOGGING in settings.
+"""
+import contextvars
+import json
+import logging
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .metrics import view_label
+
+access_logger = logging.getLogger('rest_api.access')
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Attributes every LogRecord has; anything else was passed in ``extra``
+RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with ``extra`` fields as top-level keys"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in RECORD_ATTRS)
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestIDFilter(logging.Filter):
+    """Stamps records with the id of the request being handled"""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            # django.request logs responses after the middleware has returned
+            record.request_id = _request_id.get() or getattr(getattr(record, 'request', None), 'request_id', None)
+        return True
+
+
+class DuplicateFilter(logging.Filter):
+    """
+    Lets one of each record at ``level`` or above through per ``window``
+    seconds. Records are alike when they come from the same place with the
+    same message and exception type; the first one after the window
+    carries ``suppressed``, the count dropped meanwhile.
+    """
+
+    def __init__(self, window=60, level=logging.WARNING, max_keys=1000):
+        super().__init__()
+        self.window = window
+        self.level = level
+        self.max_keys = max_keys
+        self.seen = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.level:
+            return True
+        exc_type = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else None
+        key = (record.name, record.levelno, record.pathname, record.lineno, record.getMessage(), exc_type)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.seen.get(key)
+            if entry is not None and now - entry[0] < self.window:
+                entry[1] += 1
+                return False
+            if entry is not None and entry[1]:
+                record.suppressed = entry[1]
+            if len(self.seen) >= self.max_keys:
+                self.seen = {k: v for k, v in self.seen.items() if now - v[0] < self.window}
+            self.seen[key] = [now, 0]
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a share of the records below WARNING from the views in ``rates``
+    (view name -> share to keep), e.g. the access lines of the menu
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = rates or {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, 'view', None))
+        if rate is None:
+            return True
+        if random.random() < rate:
+            record.sample_rate = rate
+            return True
+        return False
+
+
+class QueuedStreamHandler(QueueHandler):
+    """
+    Hands records to a background thread that formats and writes them, so
+    request threads never wait on the stream. When the queue is full new
+    records are dropped and counted in ``dropped``.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        self.stopped = False
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Resolve the message now, while its arguments still hold these values
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Wait until every queued record has been written"""
+        self.queue.join()
+        self.target.flush()
+
+    def close(self):
+        # logging.shutdown() closes handlers at exit, after draining them
+        if not self.stopped:
+            self.stopped = True
+            self.listener.stop()
+        super().close()
+
+
+class RequestLogMiddleware:
+    """
+    Gives every request a correlation id (the client's X-Request-ID when it
+    sent a sane one), echoes it in the response and logs an access line
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token, request_id = self.start(request)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            self.finish(request, response, request_id, time.perf_counter() - started)
+        finally:
+            _request_id.reset(token)
+        return response
+
+    async def __acall__(self, request):
+        token, request_id = self.start(request)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+            self.finish(request, response, request_id, time.perf_counter() - started)
+        finally:
+            _request_id.reset(token)
+        return response
+
+    def start(self, request):
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        if not VALID_REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.request_id = request_id
+        return _request_id.set(request_id), request_id
+
+    def finish(self, request, response, request_id, seconds):
+        response[REQUEST_ID_HEADER] = request_id
+        if access_logger.isEnabledFor(logging.INFO):
+            access_logger.info('%s %s %s', request.method, request.path, response.status_code, extra={
+                'view': view_label(request),
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(seconds * 1000, 1),
+            })
@@ -0,0 +1,99 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from rest_api.benchmarks import summarize
+from rest_api.models import MenuItem, Order, OrderEvent
+from rest_api.services import create_order
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent checkout throughput (order + items written the "
+        "way Orders.post does, without the PayU call) on the configured database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=200,
+                            help='Orders placed by each thread')
+        parser.add_argument('--items', type=int, default=3,
+                            help='Line items per order')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the orders created by the run')
+
+    def handle(self, *args, **options):
+        menu = list(MenuItem.objects.values_list('id', flat=True)[:options['items']])
+        created_menu = []
+        while len(menu) < options['items']:
+            item = MenuItem.objects.create(
+                name=f'Benchmark item {len(menu)}',
+                description='Created by bench_checkout',
+                category='pizza',
+                price=Decimal('9.99'),
+            )
+            created_menu.append(item.id)
+            menu.append(item.id)
+
+        lines = [{'menu_item': pk, 'quantity': 2} for pk in menu]
+        order_data = {
+            'customer_name': 'Benchmark',
+            'customer_email': 'bench@example.com',
+            'customer_phone': '000000000',
+            'delivery_address': 'Benchmark Street 1',
+        }
+
+        latencies, errors, created = [], [], []
+        lock = threading.Lock()
+        barrier = threading.Barrier(options['threads'])
+
+        def worker():
+            barrier.wait()
+            mine, my_errors, my_created = [], [], []
+            for _ in range(options['orders']):
+                started = time.perf_counter()
+                try:
+                    order, _ = create_order(order_data, lines)
+                    my_created.append((order.pk, order.order_number_uuid))
+                except Exception as e:
+                    my_errors.append(type(e).__name__ + ': ' + str(e))
+                mine.append(time.perf_counter() - started)
+            connection.close()
+            with lock:
+                latencies.extend(mine)
+                errors.extend(my_errors)
+                created.extend(my_created)
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        stats = summarize(latencies)
+        if latencies:
+            latency = (f"latency ms: p50={stats['p50_ms']:.1f} p95={stats['p95_ms']:.1f} "
+                       f"p99={stats['p99_ms']:.1f} mean={stats['mean_ms']:.1f}")
+        else:
+            latency = "latency ms: no orders placed"
+        settings_dict = connections['default'].settings_dict
+        self.stdout.write(
+            f"engine={settings_dict['ENGINE'].rsplit('.', 1)[-1]} "
+            f"options={settings_dict.get('OPTIONS') or {}}\n"
+            f"threads={options['threads']} orders={len(created)} errors={len(errors)} "
+            f"elapsed={elapsed:.2f}s throughput={len(created) / elapsed:.1f} orders/s\n"
+            f"{latency}"
+        )
+        for message in sorted(set(errors))[:5]:
+            self.stderr.write(f'  {message}')
+
+        if not options['keep']:
+            Order.objects.filter(pk__in=[pk for pk, _ in created]).delete()
+            # The event log outlives its orders; deleting them added more
+            OrderEvent.objects.filter(order_number_uuid__in=[number for _, number in created]).delete()
+            MenuItem.objects.filter(pk__in=created_menu).delete()
@@ -0,0 +1,63 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure password checks per second (what a login costs) for the "
+        "configured hashers, on one thread and on --threads threads"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hasher', action='append', dest='hashers',
+                            help='Hasher algorithm to measure (repeatable); defaults to all configured')
+        parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--seconds', type=float, default=3.0,
+                            help='Approximate run time per measurement')
+
+    def handle(self, *args, **options):
+        algorithms = options['hashers'] or [
+            import_string(path).algorithm for path in settings.PASSWORD_HASHERS
+        ]
+        cores = os.cpu_count() or 1
+        for algorithm in algorithms:
+            try:
+                hasher = get_hasher(algorithm)
+                encoded = hasher.encode('correct horse battery staple', hasher.salt())
+            except (ValueError, ImportError) as e:
+                self.stderr.write(f'{algorithm}: skipped ({e})')
+                continue
+
+            single = self.measure(encoded, 1, options['seconds'])
+            threads = min(options['threads'], cores)
+            parallel = self.measure(encoded, threads, options['seconds'])
+            params = {
+                key: value for key, value in hasher.safe_summary(encoded).items()
+                if key not in ('algorithm', 'salt', 'hash')
+            }
+            self.stdout.write(
+                f"{algorithm}: {params}\n"
+                f"  1 thread: {single:.1f} logins/s ({1000 / single:.1f} ms each)\n"
+                f"  {threads} threads: {parallel:.1f} logins/s = {parallel / threads:.1f} logins/s per core"
+            )
+
+    def measure(self, encoded, threads, seconds):
+        deadline = time.perf_counter() + seconds
+
+        def worker():
+            done = 0
+            while time.perf_counter() < deadline:
+                check_password('correct horse battery staple', encoded)
+                done += 1
+            return done
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            done = sum(pool.map(lambda _: worker(), range(threads)))
+        return done / (time.perf_counter() - started)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from rest_api import schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-render the OpenAPI schema into SCHEMA_DIR for the current code "
+        "version; run at build time so no request pays for introspection"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', default=None,
+                            help='Write here instead of SCHEMA_DIR')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate even if the stored schema is current')
+
+    def handle(self, *args, **options):
+        directory = options['output_dir']
+        version = schema.code_version()
+        if not options['force'] and schema.read(version, directory) is not None:
+            self.stdout.write(f"Schema for version {version} is up to date")
+            return
+        schema.write(version, schema.generate(), directory)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote the schema for version {version} to {schema.schema_dir(version, directory)}"
+        ))
@@ -0,0 +1,247 @@
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from wsgiref.simple_server import WSGIRequestHandler
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.test import override_settings
+
+from rest_api import payu
+from rest_api.benchmarks import QUERY_BUDGETS, SCENARIOS, SeedData, summarize
+from rest_api.payu_stub import StubPayU
+
+
+class QueryCountingApplication:
+    """WSGI wrapper adding X-Query-Count: the queries the request ran"""
+
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        def counted_start_response(status, headers, exc_info=None):
+            return start_response(status, headers + [('X-Query-Count', str(queries))], exc_info)
+
+        # Django builds the whole response before calling start_response
+        with connection.execute_wrapper(count):
+            return self.application(environ, counted_start_response)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpSession:
+    """One virtual user: a keep-alive connection and its timed requests"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.http = requests.Session()
+        self.state = {}
+        self.samples = []
+        self.recording = False
+
+    def request(self, endpoint, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, timeout=30, **kwargs)
+        except requests.RequestException:
+            self.record(endpoint, time.perf_counter() - started, None, None)
+            raise
+        queries = response.headers.get('X-Query-Count')
+        self.record(endpoint, time.perf_counter() - started, response.status_code,
+                    int(queries) if queries is not None else None)
+        return response
+
+    def record(self, endpoint, seconds, status, queries):
+        if self.recording:
+            self.samples.append((endpoint, seconds, status, queries))
+
+
+class Command(BaseCommand):
+    help = (
+        "Run scripted API scenarios with concurrent virtual users against a "
+        "local server and report latency percentiles, throughput and query "
+        "counts per endpoint. Seed data first with seed_data. Without --url "
+        "the API is served in-process with a stub PayU, so no network is needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help=(
+            "Base URL of a running server, e.g. http://127.0.0.1:8000. Its PAYU_* "
+            "settings decide where checkout goes, and query counts are not reported."
+        ))
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=sorted(SCENARIOS),
+                            help='Scenario to run (repeatable); defaults to all')
+        parser.add_argument('--users', type=int, default=8, help='Concurrent virtual users per scenario')
+        parser.add_argument('--duration', type=float, default=10.0, help='Measured seconds per scenario')
+        parser.add_argument('--warmup', type=float, default=1.0, help='Unmeasured seconds before each scenario')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the virtual users')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='Results file of an earlier run to compare with')
+
+    def handle(self, *args, **options):
+        data = SeedData.load()
+        if data is None:
+            raise CommandError("No seeded data found, run 'manage.py seed_data' first")
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        with ExitStack() as stack:
+            base_url = options['url'] or self.serve(stack)
+            results = {
+                'started_at': datetime.now(timezone.utc).isoformat(),
+                'url': options['url'],
+                'database': connections['default'].settings_dict['ENGINE'].rsplit('.', 1)[-1],
+                'users': options['users'],
+                'duration': options['duration'],
+                'scenarios': {},
+            }
+            for name in options['scenarios'] or list(SCENARIOS):
+                results['scenarios'][name] = self.run_scenario(name, base_url, data, options)
+
+        over_budget = [
+            f"{endpoint} ran {stats['queries']} queries, budget {stats['query_budget']}"
+            for scenario in results['scenarios'].values()
+            for endpoint, stats in scenario['endpoints'].items()
+            if None not in (stats['queries'], stats['query_budget'])
+            and stats['queries'] > stats['query_budget']
+        ]
+        results['over_budget'] = over_budget
+
+        self.report(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if over_budget:
+            raise CommandError('Query budget exceeded: ' + '; '.join(over_budget))
+
+    def serve(self, stack):
+        """Serve the API on a free local port, with PayU replaced by a stub"""
+        stub = StubPayU().start()
+        stack.callback(stub.stop)
+        stack.enter_context(override_settings(**stub.settings()))
+        payu.token_manager.reset()
+        stack.callback(payu.token_manager.reset)
+
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=False)
+        server.set_app(QueryCountingApplication(get_wsgi_application()))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        stack.callback(server.server_close)
+        stack.callback(server.shutdown)
+        return f'http://127.0.0.1:{server.server_address[1]}'
+
+    def run_scenario(self, name, base_url, data, options):
+        scenario = SCENARIOS[name]
+        sessions = [HttpSession(base_url) for _ in range(options['users'])]
+        iterations, failures = [0], defaultdict(int)
+        lock = threading.Lock()
+        barrier = threading.Barrier(len(sessions) + 1)
+        stop = threading.Event()
+
+        def user(session, rng):
+            barrier.wait()
+            done = 0
+            while not stop.is_set():
+                try:
+                    scenario(session, data, rng)
+                except Exception as e:
+                    with lock:
+                        failures[type(e).__name__ + ': ' + str(e)[:200]] += 1
+                done += session.recording
+            with lock:
+                iterations[0] += done
+
+        threads = [
+            threading.Thread(target=user, args=(session, random.Random(f"{options['seed']}-{n}")))
+            for n, session in enumerate(sessions)
+        ]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        time.sleep(options['warmup'])
+        with lock:
+            failures.clear()
+            for session in sessions:
+                session.recording = True
+        started = time.perf_counter()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        by_endpoint = defaultdict(list)
+        for session in sessions:
+            for sample in session.samples:
+                by_endpoint[sample[0]].append(sample)
+
+        endpoints = {}
+        for endpoint, samples in sorted(by_endpoint.items()):
+            queries = [sample[3] for sample in samples if sample[3] is not None]
+            endpoints[endpoint] = {
+                'requests': len(samples),
+                'errors': sum(1 for sample in samples if sample[2] is None or sample[2] >= 400),
+                'rps': round(len(samples) / elapsed, 1),
+                **summarize([sample[1] for sample in samples]),
+                'queries': max(queries) if queries else None,
+                'query_budget': QUERY_BUDGETS.get(endpoint),
+            }
+        return {
+            'iterations': iterations[0],
+            'elapsed': round(elapsed, 2),
+            'iterations_per_second': round(iterations[0] / elapsed, 1),
+            'failures': dict(failures),
+            'endpoints': endpoints,
+        }
+
+    def report(self, results, baseline=None):
+        self.stdout.write(
+            f"database={results['database']} users={results['users']} duration={results['duration']}s"
+        )
+        for name, scenario in results['scenarios'].items():
+            self.stdout.write(
+                f"\n{name}: {scenario['iterations']} iterations, "
+                f"{scenario['iterations_per_second']} iterations/s"
+            )
+            self.stdout.write(
+                f"  {'endpoint':<16}{'requests':>9}{'errors':>7}{'rps':>8}"
+                f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}"
+            )
+            for endpoint, stats in scenario['endpoints'].items():
+                queries = '-' if stats['queries'] is None else f"{stats['queries']}/{stats['query_budget']}"
+                line = (
+                    f"  {endpoint:<16}{stats['requests']:>9}{stats['errors']:>7}{stats['rps']:>8}"
+                    f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}{queries:>9}"
+                )
+                before = (baseline or {}).get('scenarios', {}).get(name, {}).get('endpoints', {}).get(endpoint)
+                if before and before['p95_ms'] and before['rps']:
+                    line += (
+                        f"  p95 {change(before['p95_ms'], stats['p95_ms'])}"
+                        f" rps {change(before['rps'], stats['rps'])}"
+                    )
+                self.stdout.write(line)
+            for message, count in sorted(scenario['failures'].items())[:5]:
+                self.stderr.write(f"  {count} x {message}")
+
+
+def change(before, after):
+    return f'{(after - before) / before * 100:+.0f}%'
@@ -0,0 +1,49 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from rest_api.models import OrderEvent
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete order events older than --max-age in small batches; streams "
+        "resuming from a purged cursor start over from a snapshot"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=24,
+                            help='Keep events from the last N hours')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows deleted per transaction')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Repeat every N seconds; 0 runs a single pass')
+
+    def handle(self, *args, **options):
+        while True:
+            self.purge(options['max_age'], options['batch_size'])
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def purge(self, max_age, batch_size):
+        started = time.monotonic()
+        expired = OrderEvent.objects.filter(
+            created_at__lt=timezone.now() - timedelta(hours=max_age)
+        ).order_by('id')
+
+        deleted = 0
+        while True:
+            ids = list(expired.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            OrderEvent.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {deleted} order events in {elapsed:.2f}s"
+        ))
+        return deleted
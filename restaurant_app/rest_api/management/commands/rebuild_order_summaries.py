@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from rest_api.models import Order, OrderSummary
+
+
+class Command(BaseCommand):
+    help = "Rebuild the OrderSummary projection from orders (e.g. after deploying it)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        orders = Order.objects.annotate(
+            quantity=Coalesce(Sum('items__quantity'), 0)
+        ).order_by('id')
+
+        last_id, total = 0, 0
+        while True:
+            batch = list(orders.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            OrderSummary.objects.bulk_create(
+                [OrderSummary.from_order(order, order.quantity) for order in batch],
+                update_conflicts=True,
+                unique_fields=['order'],
+                update_fields=OrderSummary.SYNCED_FIELDS + ['item_count'],
+            )
+            total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} order summaries"))
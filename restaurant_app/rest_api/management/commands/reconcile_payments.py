@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from rest_api.payu import get_oauth_token, get_payu_order_status, PayUUnavailable
+from rest_api.services import open_payments, apply_payu_statuses
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token bucket shared by the worker threads: at most ``rate`` calls/second"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh PayU status for orders whose payment is not final yet, "
+        "so client reads never have to call PayU"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Orders loaded and updated per batch')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Concurrent PayU lookups')
+        parser.add_argument('--rate', type=float, default=20,
+                            help='Max PayU lookups per second (0 = unlimited)')
+        parser.add_argument('--max-age', type=int, default=72,
+                            help='Ignore orders older than this many hours')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Repeat every N seconds; 0 runs a single pass')
+
+    def handle(self, *args, **options):
+        limiter = RateLimiter(options['rate'])
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                if not options['interval']:
+                    self.reconcile(pool, limiter, options)
+                    break
+                try:
+                    self.reconcile(pool, limiter, options)
+                except Exception:
+                    # Keep the worker alive; the next pass starts over
+                    logger.exception('Payment reconciliation pass failed')
+                time.sleep(options['interval'])
+
+    def reconcile(self, pool, limiter, options):
+        started = time.monotonic()
+        stats = {'scanned': 0, 'fetched': 0, 'updated': 0, 'errors': 0}
+        since = timezone.now() - timedelta(hours=options['max_age'])
+        pending = open_payments().filter(created_at__gte=since).order_by('id')
+
+        last_id = 0
+        while True:
+            batch = list(
+                pending.filter(id__gt=last_id).values_list('id', 'payu_order_id')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            stats['scanned'] += len(batch)
+
+            try:
+                access_token = get_oauth_token()
+            except Exception as e:
+                self.stderr.write(f'Could not obtain PayU token: {e}')
+                stats['errors'] += len(batch)
+                break
+
+            def lookup(row):
+                limiter.acquire()
+                try:
+                    result = get_payu_order_status(row[1], access_token)
+                    return row[0], ((result or {}).get('orders') or [{}])[0].get('status')
+                except PayUUnavailable:
+                    return row[0], None
+                except Exception as e:
+                    # A malformed answer for one order must not end the pass
+                    logger.warning('PayU status lookup for order %s failed: %r', row[0], e)
+                    return row[0], None
+
+            statuses = {}
+            for pk, payu_order_status in pool.map(lookup, batch):
+                if payu_order_status is None:
+                    stats['errors'] += 1
+                else:
+                    statuses[pk] = payu_order_status
+            stats['fetched'] += len(statuses)
+            stats['updated'] += apply_payu_statuses(statuses)
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"scanned={stats['scanned']} fetched={stats['fetched']} "
+                f"updated={stats['updated']} errors={stats['errors']} "
+                f"rate={stats['fetched'] / elapsed if elapsed else 0:.1f}/s"
+            )
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled {stats['scanned']} open payments in {elapsed:.2f}s: "
+            f"{stats['updated']} updated, {stats['errors']} errors"
+        ))
+        return stats
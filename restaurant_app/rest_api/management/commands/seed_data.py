@@ -0,0 +1,129 @@
+import random
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rest_api.benchmarks import SEED_DOMAIN, SEED_PASSWORD, STAFF_EMAIL
+from rest_api.cache import bump_menu_version
+from rest_api.models import MenuItem, Order, OrderItem, OrderSummary
+
+# Mostly finished orders with a tail of ones still in the kitchen
+STATUS_WEIGHTS = {
+    'delivered': 60,
+    'canceled': 5,
+    'pending': 10,
+    'confirmed': 10,
+    'preparing': 10,
+    'out_for_delivery': 5,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        f"Seed menu items, users (password '{SEED_PASSWORD}', staff login "
+        f"{STAFF_EMAIL}) and orders for the loadtest command. Rows are "
+        "bulk-inserted, so order signals and events are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--menu', type=int, default=200, help='Menu items to create')
+        parser.add_argument('--users', type=int, default=1000, help='Customer accounts to create')
+        parser.add_argument('--orders', type=int, default=20000, help='Orders to create')
+        parser.add_argument('--max-items', type=int, default=5, help='Most line items per order')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for repeatable data')
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete previously seeded rows first')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        User = get_user_model()
+        if options['clear']:
+            self.clear()
+
+        menu = MenuItem.objects.bulk_create([
+            MenuItem(
+                name=f'Seed item {n}',
+                description='Created by seed_data',
+                category=rng.choice(MenuItem.CATEGORY_CHOICES)[0],
+                price=Decimal(rng.randrange(500, 6000)) / 100,
+            )
+            for n in range(options['menu'])
+        ], batch_size=options['batch_size'])
+        if menu:
+            bump_menu_version()
+        menu = list(MenuItem.objects.filter(is_available=True))
+
+        # One hash for everyone: hashing is deliberately slow
+        password = make_password(SEED_PASSWORD)
+        start = User.objects.filter(email__endswith=f'@{SEED_DOMAIN}').count()
+        users = [
+            User(email=f'user{start + n}@{SEED_DOMAIN}', password=password, name=f'Seed User {start + n}')
+            for n in range(options['users'])
+        ]
+        if users and not User.objects.filter(email=STAFF_EMAIL).exists():
+            users.append(User(email=STAFF_EMAIL, password=password, is_staff=True))
+        User.objects.bulk_create(users, batch_size=options['batch_size'])
+
+        emails = list(
+            User.objects.filter(email__endswith=f'@{SEED_DOMAIN}', is_staff=False).values_list('email', flat=True)
+        )
+        created = 0
+        if menu and emails:
+            statuses, weights = zip(*STATUS_WEIGHTS.items())
+            remaining = options['orders']
+            while remaining > 0:
+                size = min(remaining, options['batch_size'])
+                self.create_orders(size, menu, emails, statuses, weights, options['max_items'], rng)
+                remaining -= size
+                created += size
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {options['menu']} menu items, {len(users)} users, {created} orders"
+        ))
+
+    @transaction.atomic
+    def create_orders(self, count, menu, emails, statuses, weights, max_items, rng):
+        orders, lines = [], []
+        for _ in range(count):
+            picked = rng.sample(menu, min(len(menu), rng.randint(1, max_items)))
+            items = [
+                OrderItem(menu_item=item, quantity=quantity, subtotal=item.price * quantity)
+                for item, quantity in ((item, rng.randint(1, 3)) for item in picked)
+            ]
+            order_status = rng.choices(statuses, weights)[0]
+            # Mostly registered users, some guests
+            email = rng.choice(emails) if rng.random() < 0.8 else f'guest{rng.randrange(10 ** 6)}@{SEED_DOMAIN}'
+            orders.append(Order(
+                customer_name='Seed Customer',
+                customer_email=email,
+                customer_phone='000000000',
+                delivery_address='Seed Street 1',
+                status=order_status,
+                total_amount=sum(item.subtotal for item in items),
+                payu_order_id=f'SEED{rng.randrange(16 ** 12):012X}',
+                payment_status='canceled' if order_status == 'canceled' else rng.choice(['pending', 'confirmed']),
+            ))
+            lines.append(items)
+
+        Order.objects.bulk_create(orders)
+        for order, items in zip(orders, lines):
+            for item in items:
+                item.order = order
+        OrderItem.objects.bulk_create([item for items in lines for item in items])
+        OrderSummary.objects.bulk_create([
+            OrderSummary.from_order(order, sum(item.quantity for item in items))
+            for order, items in zip(orders, lines)
+        ])
+
+    def clear(self):
+        seeded = f'@{SEED_DOMAIN}'
+        orders, _ = Order.objects.filter(customer_email__endswith=seeded).delete()
+        users, _ = get_user_model().objects.filter(email__endswith=seeded).delete()
+        menu, _ = MenuItem.objects.filter(name__startswith='Seed item ').delete()
+        if menu:
+            bump_menu_version()
+        self.stdout.write(f"Cleared {orders} order rows, {users} user rows, {menu} menu rows")
@@ -0,0 +1,249 @@
+"""
+Per-request performance instrumentation.
+
+TimingMiddleware times every request. A METRICS_SAMPLE_RATE share of them
+also get a breakdown into database, serialization and PayU time, which is
+sent back in a Server-Timing header. Totals are kept per process and
+exported in the Prometheus text format by the metrics view.
+"""
+import bisect
+import contextvars
+import hmac
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+PARTS = ('db', 'serialize', 'payu')
+
+_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class Timings:
+    """Where the time of one sampled request went, in seconds"""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = dict.fromkeys(PARTS, 0.0)
+
+    def server_timing(self, total):
+        entries = [
+            f'db;dur={self.seconds["db"] * 1000:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.seconds["serialize"] * 1000:.1f}',
+            f'payu;dur={self.seconds["payu"] * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ]
+        return ', '.join(entries)
+
+
+@contextmanager
+def timed(part):
+    """Add the block's duration to ``part`` of the current request, if it is sampled"""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.seconds[part] += time.perf_counter() - started
+
+
+def time_query(execute, sql, params, many, context):
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.seconds['db'] += time.perf_counter() - started
+        timings.queries += 1
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created receiver: time the queries of every connection"""
+    # At the bottom, so execute_wrapper() blocks still pop their own wrapper
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_query)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer that counts its work as serialization time"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed('serialize'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class Registry:
+    """
+    Per-process request metrics: a request counter, a latency histogram
+    for every request and totals of the sampled breakdowns
+    """
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or settings.METRICS_BUCKETS)
+        self.lock = threading.Lock()
+        # Counters other modules keep themselves, read on every render
+        self.collectors = []
+        self.reset()
+
+    def collect(self, name, description, label, read):
+        """Export ``read()``, a {label value: count} dict, as counter ``name``"""
+        self.collectors.append((name, description, label, read))
+
+    def reset(self):
+        with self.lock:
+            self.requests = defaultdict(int)
+            # (view, method) -> bucket counts, then +Inf; sum
+            self.histograms = defaultdict(lambda: [[0] * (len(self.buckets) + 1), 0.0])
+            # view -> sampled requests, queries, seconds per part
+            self.sampled = defaultdict(lambda: [0, 0, dict.fromkeys(PARTS, 0.0)])
+
+    def observe(self, view, method, status, seconds, timings=None):
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.requests[view, method, status] += 1
+            histogram = self.histograms[view, method]
+            histogram[0][bucket] += 1
+            histogram[1] += seconds
+            if timings is not None:
+                sampled = self.sampled[view]
+                sampled[0] += 1
+                sampled[1] += timings.queries
+                for part, spent in timings.seconds.items():
+                    sampled[2][part] += spent
+
+    def render(self):
+        """Prometheus text exposition format"""
+        with self.lock:
+            requests = sorted(self.requests.items())
+            histograms = sorted((key, (list(counts), total)) for key, (counts, total) in self.histograms.items())
+            sampled = sorted((view, (n, queries, dict(parts))) for view, (n, queries, parts) in self.sampled.items())
+
+        lines = [
+            '# HELP http_requests_total Requests handled, by view, method and status.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (view, method, status), count in requests:
+            lines.append(f'http_requests_total{labels(view=view, method=method, status=status)} {count}')
+
+        lines += [
+            '# HELP http_request_duration_seconds Wall time of every request.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (view, method), (counts, total) in histograms:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(
+                    f'http_request_duration_seconds_bucket{labels(view=view, method=method, le=bound)} {cumulative}'
+                )
+            lines.append(f'http_request_duration_seconds_sum{labels(view=view, method=method)} {total}')
+            lines.append(f'http_request_duration_seconds_count{labels(view=view, method=method)} {cumulative}')
+
+        summaries = {
+            'db_queries': 'Database queries per sampled request.',
+            'db_seconds': 'Database time per sampled request.',
+            'serialize_seconds': 'Response rendering time per sampled request.',
+            'payu_seconds': 'PayU call time per sampled request.',
+        }
+        for name, description in summaries.items():
+            lines += [
+                f'# HELP http_request_{name} {description}',
+                f'# TYPE http_request_{name} summary',
+            ]
+            for view, (count, queries, parts) in sampled:
+                value = queries if name == 'db_queries' else parts[name.removesuffix('_seconds')]
+                lines.append(f'http_request_{name}_sum{labels(view=view)} {value}')
+                lines.append(f'http_request_{name}_count{labels(view=view)} {count}')
+
+        for name, description, label, read in self.collectors:
+            lines += [
+                f'# HELP {name} {description}',
+                f'# TYPE {name} counter',
+            ]
+            for value, count in sorted(read().items()):
+                lines.append(f'{name}{labels(**{label: value})} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels(**values):
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in values.items()) + '}'
+
+
+registry = Registry()
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+class TimingMiddleware:
+    """
+    Records every request in the registry. Sampled requests are broken
+    down into db/serialize/payu time and, with METRICS_SERVER_TIMING, get
+    a Server-Timing header. Streamed responses count until their headers
+    are ready.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timings = Timings() if random.random() < settings.METRICS_SAMPLE_RATE else None
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.finish(request, response, time.perf_counter() - started, timings)
+
+    async def __acall__(self, request):
+        timings = Timings() if random.random() < settings.METRICS_SAMPLE_RATE else None
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.finish(request, response, time.perf_counter() - started, timings)
+
+    def finish(self, request, response, seconds, timings):
+        registry.observe(view_label(request), request.method, response.status_code, seconds, timings)
+        if timings is not None and settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = timings.server_timing(seconds)
+        return response
+
+
+def scrape_allowed(request):
+    """
+    The METRICS_TOKEN bearer token when one is set. Without a token only
+    DEBUG servers answer, and only METRICS_ALLOWED_IPS: behind a reverse
+    proxy on the same host every client comes from 127.0.0.1.
+    """
+    if settings.METRICS_TOKEN:
+        return hmac.compare_digest(
+            request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}'
+        )
+    return settings.DEBUG and request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
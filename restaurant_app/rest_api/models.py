@@ -40,6 +40,9 @@ class UserObject(AbstractUser):
     name = models.TextField(null=True,blank=True)
     delivery_address = models.TextField(null=True,blank=True)
     phone_number = models.CharField(null=True,blank=True,max_length=20)    
+    # Tokens issued up to this moment are rejected (deactivation, password
+    # or claims change); read through the cache by ClaimsJWTAuthentication
+    tokens_valid_after = models.DateTimeField(null=True, blank=True, editable=False)
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
    
@@ -72,6 +75,16 @@ class MenuItem(models.Model):
         return f"{self.name} (${self.price})"
 
 
+class OrderQuerySet(models.QuerySet):
+    def with_items(self):
+        """Load items and their menu names/prices in two extra queries total"""
+        items = OrderItem.objects.select_related('menu_item').only(
+            'order_id', 'menu_item_id', 'quantity', 'subtotal',
+            'menu_item__name', 'menu_item__price',
+        )
+        return self.prefetch_related(models.Prefetch('items', queryset=items))
+
+
 class Order(models.Model):
     """Model representing a customer order"""
     STATUS_CHOICES = [
@@ -90,6 +103,7 @@ class Order(models.Model):
     delivery_address = models.TextField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     total_amount = models.DecimalField(
         max_digits=8, 
         decimal_places=2, 
@@ -99,15 +113,60 @@ class Order(models.Model):
     )
     payu_order_id = models.CharField(max_length=100, null=True, blank=True)
     payment_status = models.CharField(max_length=20, choices=STATUS_CHOICES, null=True, blank=True)
+    # Bumped by every status/field update made through services, which
+    # compare-and-swap on it
+    version = models.PositiveIntegerField(default=1)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        # Keyset pagination walks (created_at, id) newest first, optionally
+        # narrowed by one equality filter
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='order_status_created_idx'),
+            models.Index(fields=['payment_status', '-created_at', '-id'], name='order_payment_created_idx'),
+            models.Index(fields=['customer_email', '-created_at', '-id'], name='order_email_created_idx'),
+            models.Index(fields=['payu_order_id'], name='order_payu_id_idx'),
+            # Only payments the reconciler still has to look at
+            models.Index(
+                fields=['id'],
+                name='order_payment_open_idx',
+                condition=(
+                    models.Q(payu_order_id__isnull=False)
+                    & (models.Q(payment_status__isnull=True) | models.Q(payment_status='pending'))
+                ),
+            ),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - {self.customer_name} ({self.status})"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_status()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.remember_status()
+
+    def remember_status(self):
+        """Record the status pair as stored, so a save can tell whether it changed"""
+        self._stored_status = (self.__dict__.get('status'), self.__dict__.get('payment_status'))
+
+    def status_changed(self):
+        return getattr(self, '_stored_status', None) != (self.status, self.payment_status)
     
     def calculate_total(self):
-        """Calculate total amount from order items"""
+        """Calculate total amount from order items and store just that column"""
         total = sum(item.subtotal for item in self.items.all())
         self.total_amount = total
-        self.save()
+        # Bumped like every other write, so compare-and-swap updates notice it
+        self.version = models.F('version') + 1
+        self.save(update_fields=['total_amount', 'updated_at', 'version'])
+        self.refresh_from_db(fields=['version'])
         return total
 
 
@@ -130,3 +189,71 @@ class OrderItem(models.Model):
     def save(self, *args, **kwargs):
         self.subtotal = self.menu_item.price * self.quantity
         super().save(*args, **kwargs)
+
+
+class OrderSummary(models.Model):
+    """
+    Read-optimized projection of an Order for "my orders" listings, kept
+    in sync on every order write (see signals and services)
+    """
+    SYNCED_FIELDS = ['order_number_uuid', 'customer_email', 'status', 'total_amount', 'created_at']
+
+    order = models.OneToOneField(Order, primary_key=True, related_name='summary', on_delete=models.CASCADE)
+    order_number_uuid = models.UUIDField(unique=True)
+    customer_email = models.EmailField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    total_amount = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
+    item_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer_email', '-created_at', '-order'], name='summary_email_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Summary of order {self.order_id}"
+
+    @classmethod
+    def from_order(cls, order, item_count=0):
+        return cls(order=order, item_count=item_count, **{
+            field: getattr(order, field) for field in cls.SYNCED_FIELDS
+        })
+
+
+class OrderEvent(models.Model):
+    """
+    Append-only log of order creations, status changes and deletions. The
+    id is the cursor order streams resume from (SSE Last-Event-ID).
+    """
+    KIND_CHOICES = [
+        ('created', 'Created'),
+        ('status', 'Status changed'),
+        ('deleted', 'Deleted'),
+    ]
+
+    order = models.ForeignKey(Order, null=True, related_name='events', on_delete=models.SET_NULL)
+    order_number_uuid = models.UUIDField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    payment_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order_number_uuid', 'id'], name='event_order_idx'),
+            models.Index(fields=['created_at'], name='event_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} event of order {self.order_number_uuid}"
+
+    @classmethod
+    def for_order(cls, order, kind):
+        return cls(
+            order_id=None if kind == 'deleted' else order.pk,
+            order_number_uuid=order.order_number_uuid,
+            kind=kind,
+            status=order.status,
+            payment_status=order.payment_status,
+        )
@@ -0,0 +1,482 @@
+import asyncio
+import hashlib
+import hmac
+import random
+import threading
+import time
+import uuid
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from requests.adapters import HTTPAdapter
+
+from .logs import REQUEST_ID_HEADER, current_request_id
+from .metrics import registry, timed
+
+TOKEN_KEY = 'payu:oauth:token'
+TOKEN_LOCK_KEY = 'payu:oauth:lock'
+
+
+SIGNATURE_ALGORITHMS = {
+    'MD5': hashlib.md5,
+    'SHA': hashlib.sha1,
+    'SHA1': hashlib.sha1,
+    'SHA-256': hashlib.sha256,
+    'SHA256': hashlib.sha256,
+}
+
+
+def verify_notification_signature(body, header, second_key=None):
+    """
+    Check an ``OpenPayu-Signature`` header
+    (``sender=checkout;signature=...;algorithm=MD5;content=DOCUMENT``):
+    the signature is hash(body + second key).
+    """
+    second_key = second_key or settings.PAYU_SECOND_KEY
+    parts = dict(
+        part.split('=', 1) for part in header.split(';') if '=' in part
+    )
+    algorithm = SIGNATURE_ALGORITHMS.get(parts.get('algorithm', 'MD5').upper())
+    signature = parts.get('signature')
+    if not (algorithm and signature and second_key):
+        return False
+    expected = algorithm(body + second_key.encode()).hexdigest()
+    return hmac.compare_digest(expected, signature.lower())
+
+
+def with_request_id(kwargs):
+    """Pass the current request's correlation id on to PayU"""
+    request_id = current_request_id()
+    if request_id:
+        kwargs['headers'] = {**(kwargs.get('headers') or {}), REQUEST_ID_HEADER: request_id}
+    return kwargs
+
+
+class PayUUnavailable(Exception):
+    """PayU could not be reached, or the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Stops calling PayU after ``threshold`` consecutive failures. After
+    ``reset_timeout`` seconds one trial call is let through (half-open);
+    its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == 'open' or (state == 'half-open' and self._trial):
+                raise PayUUnavailable('PayU circuit breaker is open')
+            if state == 'half-open':
+                self._trial = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class PayUClient:
+    """
+    Shared HTTP client for every PayU call.
+
+    One pooled keep-alive session per process, connect/read timeouts on
+    every request, jittered retries for idempotent calls only, and a
+    circuit breaker so an unhealthy gateway fails fast.
+    """
+
+    def __init__(self, pool_size=None, connect_timeout=None, read_timeout=None,
+                 max_retries=None, backoff=None, breaker=None):
+        self.pool_size = pool_size or settings.PAYU_POOL_SIZE
+        self.timeout = (
+            connect_timeout or settings.PAYU_CONNECT_TIMEOUT,
+            read_timeout or settings.PAYU_READ_TIMEOUT,
+        )
+        self.max_retries = settings.PAYU_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = settings.PAYU_RETRY_BACKOFF if backoff is None else backoff
+        self.breaker = breaker or CircuitBreaker(
+            settings.PAYU_BREAKER_THRESHOLD, settings.PAYU_BREAKER_RESET_TIMEOUT
+        )
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def backoff_delay(self, attempt):
+        # Full jitter: spread retries from many workers over the whole window
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    def request(self, method, url, idempotent=False, **kwargs):
+        """
+        Send a request to PayU. 5xx responses and connection errors count
+        as failures and are retried when ``idempotent``. Raises
+        PayUUnavailable if no response could be obtained.
+        """
+        self.breaker.before_call()
+        kwargs = with_request_id(kwargs)
+        kwargs.setdefault('timeout', self.timeout)
+        attempts = self.max_retries + 1 if idempotent else 1
+
+        response, error = None, None
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(self.backoff_delay(attempt - 1))
+            try:
+                with timed('payu'):
+                    response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                response, error = None, e
+                continue
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            if response.status_code < 500:
+                self.breaker.record_success()
+                return response
+
+        self.breaker.record_failure()
+        if response is not None:
+            return response
+        raise PayUUnavailable(f'PayU request failed: {error}') from error
+
+    def fetch_oauth_token(self):
+        """Ask PayU for a new client_credentials token. Returns (token, expires_in)"""
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded'
+        }
+
+        response = self.request(
+            'POST',
+            settings.PAYU_OAUTH_URL,
+            idempotent=True,
+            headers=headers,
+            data={
+                'grant_type': 'client_credentials',
+                'client_id': settings.PAYU_CLIENT_ID,
+                'client_secret': settings.PAYU_CLIENT_SECRET}
+        )
+        if response.status_code != 200:
+            raise Exception('Failed to obtain PayU OAuth token')
+
+        data = response.json()
+        return data['access_token'], int(data.get('expires_in', 0))
+
+    def get_order_status(self, payu_order_id, access_token):
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
+
+        response = self.request(
+            'GET',
+            f"{settings.PAYU_API_URL}/orders/{payu_order_id}",
+            idempotent=True,
+            headers=headers
+        )
+
+        if response.status_code == 200:
+            return response.json()
+        return None
+
+    def create_order(self, payu_data, access_token):
+        """Register a payment. Not retried: PayU could create it twice"""
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json',
+        }
+
+        response = self.request(
+            'POST',
+            settings.PAYU_ORDER_URL,
+            json=payu_data,
+            headers=headers,
+            allow_redirects=False
+        )
+        return response.json()
+
+
+class AsyncPayUClient:
+    """
+    asyncio counterpart of PayUClient for ASGI views, so an outstanding
+    gateway call holds a coroutine instead of a worker thread.
+
+    httpx pools are bound to the event loop that created them, so one
+    AsyncClient is kept per running loop. The circuit breaker is shared
+    with the sync client: both talk to the same gateway.
+    """
+
+    def __init__(self, breaker, pool_size=None, connect_timeout=None, read_timeout=None):
+        self.breaker = breaker
+        self.pool_size = pool_size or settings.PAYU_ASYNC_POOL_SIZE
+        self.timeout = httpx.Timeout(
+            read_timeout or settings.PAYU_READ_TIMEOUT,
+            connect=connect_timeout or settings.PAYU_CONNECT_TIMEOUT,
+        )
+        self._clients = weakref.WeakKeyDictionary()
+
+    @property
+    def http(self):
+        loop = asyncio.get_running_loop()
+        http = self._clients.get(loop)
+        if http is None:
+            http = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                ),
+            )
+            self._clients[loop] = http
+        return http
+
+    async def request(self, method, url, **kwargs):
+        self.breaker.before_call()
+        kwargs = with_request_id(kwargs)
+        try:
+            with timed('payu'):
+                response = await self.http.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            self.breaker.record_failure()
+            raise PayUUnavailable(f'PayU request failed: {e}') from e
+        except Exception:
+            self.breaker.record_failure()
+            raise
+
+        if response.status_code < 500:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        return response
+
+    async def create_order(self, payu_data, access_token):
+        """Register a payment. Not retried: PayU could create it twice"""
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json',
+        }
+
+        response = await self.request(
+            'POST',
+            settings.PAYU_ORDER_URL,
+            json=payu_data,
+            headers=headers,
+            follow_redirects=False
+        )
+        return response.json()
+
+
+client = PayUClient()
+async_client = AsyncPayUClient(breaker=client.breaker)
+
+
+def fetch_oauth_token():
+    return client.fetch_oauth_token()
+
+
+def get_payu_order_status(payu_order_id, access_token):
+    return client.get_order_status(payu_order_id, access_token)
+
+
+class PayUTokenManager:
+    """
+    Keeps one PayU access token per deployment.
+
+    Lookups go process memory -> shared cache -> PayU. A refresh is
+    single-flight: one thread per process (threading lock) and one process
+    per deployment (lock key in the shared cache) talks to PayU, everybody
+    else waits for the token it publishes. Tokens nearing expiry are
+    refreshed in a background thread while the current one is still served.
+    """
+
+    def __init__(self, fetch=fetch_oauth_token, cache_alias='shared',
+                 expiry_margin=None, refresh_ahead=None, lock_timeout=10):
+        self.fetch = fetch
+        self.cache_alias = cache_alias
+        self.expiry_margin = (
+            settings.PAYU_TOKEN_EXPIRY_MARGIN if expiry_margin is None else expiry_margin
+        )
+        self.refresh_ahead = (
+            settings.PAYU_TOKEN_REFRESH_AHEAD if refresh_ahead is None else refresh_ahead
+        )
+        self.lock_timeout = lock_timeout
+
+        self._current = (None, 0)
+        self._lock = threading.Lock()
+        self._flight = threading.Lock()
+        self._refreshing = False
+        self._metrics = {
+            'hits': 0,
+            'shared_hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'background_refreshes': 0,
+            'failures': 0,
+        }
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _count(self, name):
+        with self._lock:
+            self._metrics[name] += 1
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._metrics)
+
+    def _usable(self, expires_at, now):
+        return now < expires_at - self.expiry_margin
+
+    def _remember(self, token, expires_at):
+        self._current = (token, expires_at)
+
+    def get_token(self):
+        now = time.time()
+        token, expires_at = self._current
+        if token and self._usable(expires_at, now):
+            self._count('hits')
+            if now >= expires_at - self.refresh_ahead:
+                self._refresh_in_background()
+            return token
+
+        shared = self.cache.get(TOKEN_KEY)
+        if shared and self._usable(shared[1], now):
+            self._count('shared_hits')
+            self._remember(*shared)
+            return shared[0]
+
+        self._count('misses')
+        return self.refresh()
+
+    def _fresh(self, expires_at, now):
+        """Usable and not yet due for a proactive refresh"""
+        return now < expires_at - max(self.refresh_ahead, self.expiry_margin)
+
+    def refresh(self):
+        """Fetch a new token, unless another thread or process just did"""
+        with self._flight:
+            now = time.time()
+            token, expires_at = self._current
+            if token and self._fresh(expires_at, now):
+                return token
+
+            shared = self.cache.get(TOKEN_KEY)
+            if shared and self._fresh(shared[1], now):
+                self._remember(*shared)
+                return shared[0]
+
+            owner = uuid.uuid4().hex
+            deadline = time.time() + 2 * self.lock_timeout
+            while not self.cache.add(TOKEN_LOCK_KEY, owner, timeout=self.lock_timeout):
+                token = self._wait_for_peer()
+                if token:
+                    return token
+                # The holder failed or its lock expired: take the lock, never fetch without it
+                if time.time() >= deadline:
+                    self._count('failures')
+                    raise PayUUnavailable('Timed out waiting for the PayU token refresh lock')
+
+            try:
+                token, expires_in = self.fetch()
+            except Exception:
+                self._count('failures')
+                raise
+            finally:
+                self._release(owner)
+
+            expires_at = time.time() + expires_in
+            self.cache.set(TOKEN_KEY, (token, expires_at),
+                           timeout=max(int(expires_in - self.expiry_margin), 1))
+            self._remember(token, expires_at)
+            self._count('refreshes')
+            return token
+
+    def _release(self, owner):
+        # Only our own lock: it may have expired and been taken by another process
+        if self.cache.get(TOKEN_LOCK_KEY) == owner:
+            self.cache.delete(TOKEN_LOCK_KEY)
+
+    def _wait_for_peer(self):
+        """Another process holds the refresh lock; wait for the token it publishes"""
+        deadline = time.time() + self.lock_timeout
+        while time.time() < deadline:
+            shared = self.cache.get(TOKEN_KEY)
+            if shared and self._fresh(shared[1], time.time()):
+                self._remember(*shared)
+                return shared[0]
+            if self.cache.get(TOKEN_LOCK_KEY) is None:
+                return None
+            time.sleep(0.05)
+        return None
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+                self._count('background_refreshes')
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name='payu-token-refresh', daemon=True).start()
+
+    def reset(self):
+        self._remember(None, 0)
+        self.cache.delete(TOKEN_KEY)
+
+
+token_manager = PayUTokenManager()
+registry.collect(
+    'payu_token_events_total', 'PayU access token lookups, refreshes and failures in this process.',
+    'event', token_manager.metrics,
+)
+
+
+def get_oauth_token():
+    return token_manager.get_token()
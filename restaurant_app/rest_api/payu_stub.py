@@ -0,0 +1,126 @@
+"""
+Minimal local stand-in for the PayU sandbox, for tests and benchmarks.
+
+    stub = StubPayU().start()
+    with override_settings(**stub.settings()):
+        ...
+    stub.stop()
+"""
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubPayUHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length)
+
+    def handle_request(self):
+        stub = self.server.stub
+        body = self.read_body()
+        with stub.lock:
+            stub.requests.append((self.command, self.path))
+            stub.headers.append(dict(self.headers))
+            fail = stub.fail_next > 0
+            if fail:
+                stub.fail_next -= 1
+        if stub.delay:
+            stub.sleep(stub.delay)
+        if fail:
+            return self.send_json(503, {'status': {'statusCode': 'SERVICE_UNAVAILABLE'}})
+
+        if self.command == 'POST' and self.path == '/oauth':
+            return self.send_json(200, {
+                'access_token': f'stub-token-{uuid.uuid4().hex}',
+                'token_type': 'bearer',
+                'expires_in': stub.token_expires_in,
+            })
+
+        if self.command == 'POST' and self.path == '/orders':
+            order_id = uuid.uuid4().hex.upper()
+            data = json.loads(body or b'{}')
+            with stub.lock:
+                stub.orders[order_id] = {'status': 'PENDING', 'extOrderId': data.get('extOrderId')}
+            return self.send_json(200, {
+                'status': {'statusCode': 'SUCCESS'},
+                'redirectUri': f'http://{self.headers["Host"]}/pay/{order_id}',
+                'orderId': order_id,
+                'extOrderId': data.get('extOrderId'),
+            })
+
+        if self.command == 'GET' and self.path.startswith('/orders/'):
+            order_id = self.path.rsplit('/', 1)[-1]
+            order = stub.orders.get(order_id)
+            if order is None:
+                return self.send_json(404, {'status': {'statusCode': 'DATA_NOT_FOUND'}})
+            return self.send_json(200, {
+                'orders': [{'orderId': order_id, **order}],
+                'status': {'statusCode': 'SUCCESS'},
+            })
+
+        self.send_json(404, {'status': {'statusCode': 'DATA_NOT_FOUND'}})
+
+    do_GET = handle_request
+    do_POST = handle_request
+
+
+class StubPayU:
+    def __init__(self, host='127.0.0.1', port=0, token_expires_in=43199, delay=0):
+        self.host = host
+        self.port = port
+        self.token_expires_in = token_expires_in
+        self.delay = delay
+        self.fail_next = 0
+        self.orders = {}
+        self.requests = []
+        self.headers = []
+        self.lock = threading.Lock()
+        self.server = None
+        self._stopped = threading.Event()
+
+    def sleep(self, seconds):
+        self._stopped.wait(seconds)
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.host, self.port), StubPayUHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def settings(self):
+        """PAYU_* settings pointing at this stub"""
+        return {
+            'PAYU_OAUTH_URL': f'{self.url}/oauth',
+            'PAYU_ORDER_URL': f'{self.url}/orders',
+            'PAYU_API_URL': self.url,
+        }
+
+    def set_status(self, order_id, payu_status):
+        with self.lock:
+            self.orders[order_id]['status'] = payu_status
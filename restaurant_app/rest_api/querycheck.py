@@ -0,0 +1,186 @@
+"""
+Opt-in detector for repeated (N+1) and slow queries, for development and CI.
+
+Queries are grouped by shape: the SQL with its placeholders, IN lists of
+any length folded into one. A shape run more than QUERY_CHECK_MAX_REPEATS
+times in one request is usually a loop issuing a query per row; a query
+slower than QUERY_CHECK_SLOW_MS is reported on its own. Every finding names
+the view and the innermost stack frame in project code.
+
+With QUERY_CHECK='warn' QueryCheckMiddleware logs findings, with 'strict'
+it raises QueryBudgetExceeded (so test runs fail). query_budget() checks a
+block of code whatever the setting.
+"""
+import contextvars
+import logging
+import os
+import re
+import time
+import traceback
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+from .metrics import view_label
+
+logger = logging.getLogger(__name__)
+
+_log = contextvars.ContextVar('query_log', default=None)
+
+IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in strict mode and by query_budget(); fails the test that caused it"""
+
+
+def shape(sql):
+    return WHITESPACE.sub(' ', IN_LIST.sub('(%s, ...)', sql)).strip()
+
+
+def project_frame():
+    """'path:line in function' of the innermost caller in project code"""
+    base = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()):
+        if (frame.filename.startswith(base) and 'site-packages' not in frame.filename
+                and frame.filename != __file__):
+            return f'{os.path.relpath(frame.filename, base)}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+@dataclass
+class Query:
+    shape: str
+    seconds: float
+    frame: str
+
+
+class QueryLog:
+    """Queries of one request or block; nested logs also feed their parents"""
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.queries = []
+
+    def add(self, query):
+        log = self
+        while log is not None:
+            log.queries.append(query)
+            log = log.parent
+
+    def findings(self, max_repeats=None, slow_ms=None, max_queries=None):
+        max_repeats = settings.QUERY_CHECK_MAX_REPEATS if max_repeats is None else max_repeats
+        slow_ms = settings.QUERY_CHECK_SLOW_MS if slow_ms is None else slow_ms
+        max_queries = settings.QUERY_CHECK_MAX_QUERIES if max_queries is None else max_queries
+
+        findings = []
+        if len(self.queries) > max_queries:
+            findings.append(f'{len(self.queries)} queries, budget {max_queries}')
+
+        groups = {}
+        for query in self.queries:
+            groups.setdefault(query.shape, []).append(query)
+        for sql, queries in groups.items():
+            if len(queries) > max_repeats:
+                findings.append(
+                    f'{len(queries)} x {sql[:200]} (repeated, first from {queries[0].frame})'
+                )
+        for query in self.queries:
+            if query.seconds * 1000 > slow_ms:
+                findings.append(
+                    f'slow query {query.seconds * 1000:.1f} ms: {query.shape[:200]} (from {query.frame})'
+                )
+        return findings
+
+
+def inspect_query(execute, sql, params, many, context):
+    log = _log.get()
+    if log is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        log.add(Query(shape(sql), time.perf_counter() - started, project_frame()))
+
+
+def install_query_inspector(sender, connection, **kwargs):
+    """connection_created receiver; a no-op per query unless a QueryLog is active"""
+    if inspect_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, inspect_query)
+
+
+@contextmanager
+def recording():
+    log = QueryLog(parent=_log.get())
+    token = _log.set(log)
+    try:
+        yield log
+    finally:
+        _log.reset(token)
+
+
+@contextmanager
+def query_budget(max_queries=None, max_repeats=None, slow_ms=None):
+    """
+    Raise QueryBudgetExceeded if the block breaks a budget; unset ones come
+    from the QUERY_CHECK_* settings. Covers queries made on this thread and
+    through sync_to_async from it.
+
+        with query_budget(max_queries=3, max_repeats=1):
+            self.client.get(url)
+    """
+    with recording() as log:
+        # Connections opened before the app was ready have no inspector
+        if inspect_query in connection.execute_wrappers:
+            yield log
+        else:
+            with connection.execute_wrapper(inspect_query):
+                yield log
+    findings = log.findings(max_repeats, slow_ms, max_queries)
+    if findings:
+        raise QueryBudgetExceeded('Query budget exceeded:\n  ' + '\n  '.join(findings))
+
+
+class QueryCheckMiddleware:
+    """Checks each request's queries when QUERY_CHECK is 'warn' or 'strict'"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if settings.QUERY_CHECK not in ('warn', 'strict'):
+            return self.get_response(request)
+        with recording() as log:
+            response = self.get_response(request)
+        self.check(request, log)
+        return response
+
+    async def __acall__(self, request):
+        if settings.QUERY_CHECK not in ('warn', 'strict'):
+            return await self.get_response(request)
+        with recording() as log:
+            response = await self.get_response(request)
+        self.check(request, log)
+        return response
+
+    def check(self, request, log):
+        findings = log.findings()
+        if not findings:
+            return
+        where = f'{request.method} {request.path} ({view_label(request)})'
+        if settings.QUERY_CHECK == 'strict':
+            raise QueryBudgetExceeded(f'{where}:\n  ' + '\n  '.join(findings))
+        for finding in findings:
+            logger.warning('%s: %s', where, finding)
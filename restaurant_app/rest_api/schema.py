@@ -0,0 +1,152 @@
+"""
+Pre-rendered OpenAPI schema.
+
+drf_yasg builds the schema by introspecting every view and serializer, so
+it is generated once per code version, by the generate_schema command at
+build time or by the first request after a deploy, and written to a
+directory per version in SCHEMA_DIR. Requests are answered from memory.
+"""
+import functools
+import hashlib
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+import drf_yasg
+import rest_framework
+from django.apps import apps
+from django.conf import settings
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.generators import OpenAPISchemaGenerator
+
+logger = logging.getLogger(__name__)
+
+API_INFO = openapi.Info(
+    title="Restaurant API",
+    default_version='v1',
+    description="API for Restaurant Application",
+    terms_of_service="https://www.restaurant.com/terms/",
+    contact=openapi.Contact(email="contact@restaurant.com"),
+    license=openapi.License(name="BSD License"),
+)
+
+# format -> (codec, content type)
+FORMATS = {
+    '.json': (OpenAPICodecJson, 'application/json'),
+    '.yaml': (OpenAPICodecYaml, 'application/yaml'),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """
+    CODE_VERSION when set (e.g. the commit the image was built from),
+    otherwise a hash of the project's Python sources and the versions of
+    the libraries that shape the schema
+    """
+    if settings.CODE_VERSION:
+        return settings.CODE_VERSION
+    base = Path(settings.BASE_DIR).resolve()
+    roots = {Path(sys.modules[settings.ROOT_URLCONF].__file__).resolve().parent}
+    roots.update(
+        Path(app.path).resolve() for app in apps.get_app_configs()
+        if Path(app.path).resolve().is_relative_to(base)
+    )
+    digest = hashlib.sha256(f'{drf_yasg.__version__} {rest_framework.VERSION}'.encode())
+    for path in sorted(path for root in roots for path in root.rglob('*.py')):
+        digest.update(str(path.relative_to(base)).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def generate():
+    """Introspect the API; returns {format: bytes}"""
+    schema = OpenAPISchemaGenerator(API_INFO).get_schema(request=None, public=True)
+    return {fmt: codec([]).encode(schema) for fmt, (codec, _) in FORMATS.items()}
+
+
+def schema_dir(version, directory=None):
+    """One directory per code version, so a reader never mixes generations"""
+    safe = re.sub(r'[^A-Za-z0-9._-]', '_', version)
+    return Path(directory or settings.SCHEMA_DIR) / safe
+
+
+def read(version, directory=None):
+    """The documents stored for ``version``, or None"""
+    path = schema_dir(version, directory)
+    try:
+        return {fmt: (path / f'openapi{fmt}').read_bytes() for fmt in FORMATS}
+    except OSError:
+        return None
+
+
+def write(version, documents, directory=None):
+    """
+    Write the documents next to their final place and rename the whole
+    directory in, so the version's directory is complete or absent.
+    Other versions' schema directories are removed.
+    """
+    target = schema_dir(version, directory)
+    root = target.parent
+    root.mkdir(parents=True, exist_ok=True)
+    temporary = Path(tempfile.mkdtemp(prefix=f'.{target.name}.', dir=root))
+    # mkdtemp is private to its creator; the server may run as another user
+    temporary.chmod(0o755)
+    for fmt, content in documents.items():
+        (temporary / f'openapi{fmt}').write_bytes(content)
+    if target.exists():
+        # --force: move the old generation out of the way first
+        stale = Path(tempfile.mkdtemp(prefix=f'.{target.name}.', dir=root))
+        os.replace(target, stale / 'old')
+        shutil.rmtree(stale, ignore_errors=True)
+    try:
+        os.replace(temporary, target)
+    except OSError:
+        # Another process published the same version first
+        shutil.rmtree(temporary, ignore_errors=True)
+    for path in root.iterdir():
+        if path != target and not path.name.startswith('.') and (path / 'openapi.json').is_file():
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class SchemaCache:
+    """The current version's documents, loaded from SCHEMA_DIR or generated once"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = None
+
+    def get(self, fmt):
+        """Returns (version, document bytes)"""
+        version = code_version()
+        loaded = self.loaded
+        if loaded is None or loaded[0] != version:
+            with self.lock:
+                if self.loaded is None or self.loaded[0] != version:
+                    self.loaded = (version, self.load(version))
+                loaded = self.loaded
+        return loaded[0], loaded[1][fmt]
+
+    def load(self, version):
+        documents = read(version)
+        if documents is None:
+            documents = generate()
+            try:
+                write(version, documents)
+            except OSError as e:
+                # Read-only image: keep serving from memory
+                logger.warning('Could not store the OpenAPI schema in %s: %s', settings.SCHEMA_DIR, e)
+        return documents
+
+    def clear(self):
+        with self.lock:
+            self.loaded = None
+
+
+cache = SchemaCache()
@@ -1,5 +1,12 @@
 from rest_framework import serializers
-from .models import MenuItem, Order, OrderItem, UserObject
+from rest_framework_simplejwt.serializers import (
+    TokenBlacklistSerializer,
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+from .models import MenuItem, Order, OrderItem, OrderSummary, UserObject
+from .cache import remember_token_revision, token_revision
+from .tokens import CachedRefreshToken
 
 
 class MenuItemSerializer(serializers.ModelSerializer):
@@ -8,16 +15,48 @@ class MenuItemSerializer(serializers.ModelSerializer):
     fields = '__all__'
 
 
+class MenuItemUpdateSerializer(serializers.ModelSerializer):
+    """Partial update of an existing item, addressed by id"""
+    id = serializers.IntegerField()
+
+    class Meta:
+        model = MenuItem
+        fields = '__all__'
+
+    def validate(self, attrs):
+        # Partial validation skips required fields, id included
+        if 'id' not in attrs:
+            raise serializers.ValidationError({'id': ['This field is required.']})
+        return attrs
+
+
+class MenuBatchSerializer(serializers.Serializer):
+    """
+    Envelope of a bulk menu change; each section is validated item by
+    item in services.apply_menu_batch
+    """
+    create = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+    update = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+    upsert = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+    delete = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+
 class OrderSerializer(serializers.ModelSerializer):
   class Meta:
     model = Order
     fields = '__all__'
+    read_only_fields = ['version']
 
 class OrderItemSerializer(serializers.ModelSerializer):
   class Meta:
     model = OrderItem
     fields = '__all__'
 
+class OrderLineSerializer(serializers.Serializer):
+    """Checkout line item, validated without touching the database"""
+    menu_item = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
 class OrderUserSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
@@ -47,9 +86,19 @@ class FullOrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['order_number_uuid', 'customer_name', 'customer_email', 
                  'customer_phone', 'delivery_address', 'status', 'created_at', 
-                 'total_amount', 'items']
+                 'total_amount', 'version', 'items']
         
+class OrderTransitionSerializer(serializers.Serializer):
+    """Bulk status change: every listed order moves to ``status``"""
+    orders = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=200)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+
 
+class OrderSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderSummary
+        fields = ['order_number_uuid', 'status', 'total_amount', 'item_count', 'created_at']
+        
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -78,4 +127,26 @@ class UserSerializer(serializers.ModelSerializer):
         if password is not None:
             instance.set_password(password)
         instance.save()
-        return instance
\ No newline at end of file
+        return instance
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Adds the claims ClaimsJWTAuthentication builds request.user from"""
+    token_class = CachedRefreshToken
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['email'] = user.email
+        token['is_staff'] = user.is_staff
+        token['token_rev'] = token_revision(user)
+        remember_token_revision(user)
+        return token
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = CachedRefreshToken
+
+
+class CachedTokenBlacklistSerializer(TokenBlacklistSerializer):
+    token_class = CachedRefreshToken
@@ -0,0 +1,433 @@
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+from .cache import bump_menu_version, cache_order_payment, forget_order_payment, menu_batch
+from .models import MenuItem, Order, OrderEvent, OrderItem, OrderSummary
+from .serializers import (
+    MenuItemSerializer,
+    MenuItemUpdateSerializer,
+    OrderSerializer,
+    OrderLineSerializer,
+)
+
+
+def parse_order_items(items_buffor):
+    """
+    Line items arrive either as a list or, from form posts, as a single
+    JSON string. Raises ValueError when they cannot be read.
+    """
+    if items_buffor and isinstance(items_buffor[0], str):
+        items_buffor = items_buffor[0].replace('\t', '').replace('\n', '')
+        return json.loads(items_buffor)
+    return items_buffor
+
+
+def create_order(order_data, order_items):
+    """
+    Validate the order and all of its lines up front, then write the order
+    and its items in one transaction.
+
+    Menu items are fetched with a single query and subtotals/total are
+    computed in memory, so the cost does not grow with the number of lines.
+    Raises serializers.ValidationError on bad input.
+    """
+    order_serializer = OrderSerializer(data=order_data)
+    order_serializer.is_valid(raise_exception=True)
+
+    line_serializer = OrderLineSerializer(data=order_items, many=True)
+    line_serializer.is_valid(raise_exception=True)
+    lines = line_serializer.validated_data
+
+    menu_items = MenuItem.objects.only('id', 'name', 'price').in_bulk(
+        {line['menu_item'] for line in lines}
+    )
+    for line in lines:
+        if line['menu_item'] not in menu_items:
+            raise serializers.ValidationError({
+                'menu_item': [f'Invalid pk "{line["menu_item"]}" - object does not exist.']
+            })
+
+    items = [
+        OrderItem(
+            menu_item=menu_items[line['menu_item']],
+            quantity=line['quantity'],
+            subtotal=menu_items[line['menu_item']].price * line['quantity'],
+        )
+        for line in lines
+    ]
+
+    order = Order(**order_serializer.validated_data)
+    order.total_amount = sum(item.subtotal for item in items)
+    # Lets the post_save summary upsert include the items written below
+    order._summary_item_count = sum(item.quantity for item in items)
+
+    with transaction.atomic():
+        order.save()
+        for item in items:
+            item.order = order
+        # bulk_create skips OrderItem.save, subtotals are already set above
+        OrderItem.objects.bulk_create(items)
+
+    return order, items
+
+
+def apply_menu_batch(batch):
+    """
+    Apply a bulk menu change: ``create`` new items, partially ``update``
+    items by id, ``upsert`` full items keyed by name, ``delete`` ids.
+
+    Every section is validated before anything is written; the writes are
+    bulk queries in one transaction and the menu version is bumped once.
+    Raises serializers.ValidationError with errors keyed by section.
+    Returns the number of items created, updated and deleted.
+    """
+    if sum(len(batch[section]) for section in ('create', 'update', 'upsert', 'delete')) > settings.MENU_BATCH_MAX_ITEMS:
+        raise serializers.ValidationError({
+            'non_field_errors': [f'A batch may change at most {settings.MENU_BATCH_MAX_ITEMS} items.']
+        })
+
+    sections = {
+        'create': MenuItemSerializer(data=batch['create'], many=True),
+        'update': MenuItemUpdateSerializer(data=batch['update'], many=True, partial=True),
+        'upsert': MenuItemSerializer(data=batch['upsert'], many=True),
+    }
+    errors = {name: serializer.errors for name, serializer in sections.items() if not serializer.is_valid()}
+    if errors:
+        raise serializers.ValidationError(errors)
+    create, update, upsert = (sections[name].validated_data for name in ('create', 'update', 'upsert'))
+    delete = set(batch['delete'])
+
+    update_ids = [item['id'] for item in update]
+    names = [item['name'] for item in upsert]
+    existing = MenuItem.objects.in_bulk(update_ids)
+    by_name = {}
+    for item in MenuItem.objects.filter(name__in=names):
+        by_name.setdefault(item.name, []).append(item)
+
+    missing = sorted(set(update_ids) - set(existing))
+    if missing:
+        errors['update'] = [f'Invalid pk "{pk}" - object does not exist.' for pk in missing]
+    ambiguous = sorted({name for name in names if len(by_name.get(name, ())) > 1 or names.count(name) > 1})
+    if ambiguous:
+        errors['upsert'] = [f'Name "{name}" does not identify a single item.' for name in ambiguous]
+    if errors:
+        raise serializers.ValidationError(errors)
+
+    # Upserts of existing names address rows by id too
+    upsert_ids = [by_name[name][0].pk for name in names if name in by_name]
+    addressed = Counter(update_ids + upsert_ids + list(delete))
+    repeated = sorted(pk for pk, count in addressed.items() if count > 1)
+    if repeated:
+        raise serializers.ValidationError({
+            'non_field_errors': [f'Item {pk} is changed more than once in this batch.' for pk in repeated]
+        })
+
+    new_items = [MenuItem(**item) for item in create]
+    changed, fields = [], set()
+    for item in update:
+        instance = existing[item['id']]
+        for field, value in item.items():
+            setattr(instance, field, value)
+        fields.update(field for field in item if field != 'id')
+        changed.append(instance)
+    for item in upsert:
+        if item['name'] in by_name:
+            instance = by_name[item['name']][0]
+            for field, value in item.items():
+                setattr(instance, field, value)
+            fields.update(item)
+            changed.append(instance)
+        else:
+            new_items.append(MenuItem(**item))
+
+    with transaction.atomic(), menu_batch():
+        MenuItem.objects.bulk_create(new_items)
+        if changed and fields:
+            MenuItem.objects.bulk_update(changed, sorted(fields), batch_size=500)
+        deleted = MenuItem.objects.filter(pk__in=delete).delete()[1].get(MenuItem._meta.label, 0) if delete else 0
+        # bulk_create/bulk_update send no signals
+        bump_menu_version()
+
+    return {
+        'created': len(new_items),
+        'updated': len(changed),
+        'deleted': deleted,
+    }
+
+
+PAYU_STATUS_MAPPING = {
+    'COMPLETED': 'confirmed',
+    'PENDING': 'pending',
+    'CANCELED': 'canceled',
+    'REJECTED': 'canceled'
+}
+
+# Payment outcomes that a late or replayed PayU message must not undo
+FINAL_PAYMENT_STATUSES = ('confirmed', 'canceled')
+
+# Order status state machine; pending -> confirmed/canceled also happens
+# when the payment settles (payment_update)
+ALLOWED_TRANSITIONS = {
+    'pending': ('confirmed', 'canceled'),
+    'confirmed': ('preparing', 'canceled'),
+    'preparing': ('out_for_delivery', 'canceled'),
+    'out_for_delivery': ('delivered',),
+    'delivered': (),
+    'canceled': (),
+}
+
+
+class OrderConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The order was changed by someone else, reload it and try again.'
+    default_code = 'conflict'
+
+
+def check_transition(current, new_status):
+    if new_status not in ALLOWED_TRANSITIONS.get(current, ()):
+        raise serializers.ValidationError({
+            'status': [f'Cannot change status from "{current}" to "{new_status}".']
+        })
+
+
+def update_order(order, changes, expected_version=None):
+    """
+    Apply a partial update to ``order`` as one compare-and-swap UPDATE of
+    just the changed columns. A status change must follow
+    ALLOWED_TRANSITIONS. Raises OrderConflict if the order changed since
+    ``expected_version`` (default: the version ``order`` was loaded with).
+    """
+    changes = {field: value for field, value in changes.items() if getattr(order, field) != value}
+    if 'status' in changes:
+        check_transition(order.status, changes['status'])
+    if not changes:
+        return order
+
+    version = order.version if expected_version is None else expected_version
+    with transaction.atomic():
+        updated = Order.objects.filter(pk=order.pk, version=version).update(
+            **changes, version=F('version') + 1, updated_at=timezone.now()
+        )
+        if not updated:
+            raise OrderConflict()
+        order.refresh_from_db(fields=[*changes, 'status', 'payment_status', 'version', 'updated_at'])
+        sync_order_summaries([order.pk])
+        if 'status' in changes:
+            record_order_events([order], 'status')
+    forget_order_payment(order.order_number_uuid)
+    return order
+
+
+def transition_orders(order_numbers, new_status):
+    """
+    Move every order in ``order_numbers`` (uuids) that may go to
+    ``new_status`` there with a single UPDATE. Returns (moved uuids,
+    [{order_number_uuid, status}] of the ones left alone).
+    """
+    sources = [current for current, targets in ALLOWED_TRANSITIONS.items() if new_status in targets]
+    with transaction.atomic():
+        rows = list(Order.objects.select_for_update().filter(
+            order_number_uuid__in=order_numbers
+        ).values_list('id', 'order_number_uuid', 'status'))
+        ids = [pk for pk, _, current in rows if current in sources]
+        orders = []
+        if ids:
+            Order.objects.filter(pk__in=ids, status__in=sources).update(
+                status=new_status, version=F('version') + 1, updated_at=timezone.now()
+            )
+            sync_order_summaries(ids)
+            orders = list(Order.objects.filter(pk__in=ids).only('order_number_uuid', 'status', 'payment_status'))
+            record_order_events(orders, 'status')
+
+    for order in orders:
+        forget_order_payment(order.order_number_uuid)
+    found = {str(number): current for _, number, current in rows}
+    skipped = [
+        {'order_number_uuid': str(number), 'status': found.get(str(number))}
+        for number in order_numbers
+        if found.get(str(number)) not in sources
+    ]
+    return [str(order.order_number_uuid) for order in orders], skipped
+
+
+def upsert_order_summary(order, item_count=None):
+    """Insert or refresh the OrderSummary row of ``order`` in one query"""
+    update_fields = list(OrderSummary.SYNCED_FIELDS)
+    if item_count is not None:
+        update_fields.append('item_count')
+    OrderSummary.objects.bulk_create(
+        [OrderSummary.from_order(order, item_count or 0)],
+        update_conflicts=True,
+        unique_fields=['order'],
+        update_fields=update_fields,
+    )
+
+
+def sync_order_summaries(order_ids):
+    """Re-project orders that were changed with queryset.update()"""
+    source = Order.objects.filter(pk=OuterRef('order_id'))
+    OrderSummary.objects.filter(order_id__in=order_ids).update(
+        status=Subquery(source.values('status')[:1]),
+        total_amount=Subquery(source.values('total_amount')[:1]),
+        customer_email=Subquery(source.values('customer_email')[:1]),
+    )
+
+
+def sync_item_count(order_id):
+    quantities = OrderItem.objects.filter(order_id=OuterRef('order_id')).values('order_id').annotate(
+        total=Sum('quantity')
+    ).values('total')
+    OrderSummary.objects.filter(order_id=order_id).update(
+        item_count=Coalesce(Subquery(quantities), 0)
+    )
+
+
+def record_order_events(orders, kind):
+    """Append one OrderEvent per order (order streams pick them up)"""
+    OrderEvent.objects.bulk_create([OrderEvent.for_order(order, kind) for order in orders])
+    for order in orders:
+        order.remember_status()
+
+
+def payu_order_payload(order, items, currency, customer_ip):
+    payload = {
+        "extOrderId": str(order.order_number_uuid),
+        "merchantPosId": settings.PAYU_POS_ID,
+        "description": f"Order {order.order_number_uuid}",
+        "currencyCode": currency,
+        "totalAmount": str(int(float(order.total_amount) * 100)),
+        "buyer": {
+            "email": order.customer_email,
+            "phone": order.customer_phone,
+            "firstName": order.customer_name,
+            "language": "pl"
+        },
+        "products": [
+            {
+                "name": item.menu_item.name,
+                "unitPrice": str(int(float(item.menu_item.price) * 100)),
+                "quantity": item.quantity
+            } for item in items
+        ],
+
+        "continueUrl": f"{settings.FRONT_BASE_URL}/payment-redirect/{order.order_number_uuid}?email={order.customer_email}",
+        "customerIp": customer_ip,
+    }
+    if settings.PAYU_NOTIFY_URL:
+        payload["notifyUrl"] = settings.PAYU_NOTIFY_URL
+    return payload
+
+
+def apply_payu_registration(order, response_data):
+    """
+    Turn PayU's answer to an order registration into (body, http status)
+    for the client, storing the PayU order id on success.
+    """
+    if response_data.get('status', {}).get('statusCode') == 'SUCCESS':
+        redirect_uri = response_data.get('redirectUri')
+        order_id = response_data.get('orderId')
+
+        if not redirect_uri:
+            return {'error': 'No redirect URL in PayU response'}, status.HTTP_502_BAD_GATEWAY
+
+        order.payu_order_id = order_id
+        order.save(update_fields=['payu_order_id', 'updated_at'])
+
+        return {
+            'redirectUri': redirect_uri,
+            'orderId': order_id,
+            'status': 'success'
+        }, status.HTTP_200_OK
+
+    error_message = response_data.get('status', {}).get('statusDesc', 'Unknown error')
+    return {'error': f'PayU error: {error_message}'}, status.HTTP_400_BAD_REQUEST
+
+
+def payment_update(new_status):
+    """UPDATE kwargs recording payment status ``new_status``"""
+    new_order_status = F('status')
+    if new_status in FINAL_PAYMENT_STATUSES:
+        new_order_status = Case(When(status='pending', then=Value(new_status)), default=F('status'))
+    return {
+        'payment_status': new_status,
+        'status': new_order_status,
+        'version': F('version') + 1,
+        'updated_at': timezone.now(),
+    }
+
+
+def open_payments():
+    """
+    Orders registered with PayU whose payment outcome is not final;
+    backed by the partial index order_payment_open_idx.
+    """
+    return Order.objects.filter(payu_order_id__isnull=False).filter(
+        Q(payment_status__isnull=True) | Q(payment_status='pending')
+    )
+
+
+def apply_payu_status(order, payu_order_status):
+    """
+    Record a PayU order status on ``order``. Safe to call repeatedly and
+    out of order: final payment outcomes are never overwritten, and a
+    still-pending order follows its payment to confirmed/canceled.
+    Returns True if anything changed.
+    """
+    new_status = PAYU_STATUS_MAPPING.get(payu_order_status)
+    if new_status is None or new_status == order.payment_status:
+        return False
+
+    # Conditional UPDATE so concurrent notifications/polls cannot regress it
+    updated = Order.objects.filter(pk=order.pk).exclude(
+        payment_status__in=FINAL_PAYMENT_STATUSES
+    ).update(**payment_update(new_status))
+    order.refresh_from_db(fields=['status', 'payment_status', 'version', 'updated_at'])
+    if not updated:
+        return False
+
+    sync_order_summaries([order.pk])
+    record_order_events([order], 'status')
+    cache_order_payment(order)
+    return True
+
+
+def apply_payu_statuses(payu_statuses):
+    """
+    Bulk form of apply_payu_status for {order pk: PayU status}: one UPDATE
+    per resulting payment status, then one read to log events and refresh
+    the cache.
+    Returns the number of orders changed.
+    """
+    groups = {}
+    for pk, payu_order_status in payu_statuses.items():
+        new_status = PAYU_STATUS_MAPPING.get(payu_order_status)
+        if new_status is not None:
+            groups.setdefault(new_status, []).append(pk)
+
+    changed, count = [], 0
+    with transaction.atomic():
+        for new_status, pks in groups.items():
+            candidates = Order.objects.filter(pk__in=pks).exclude(
+                payment_status__in=FINAL_PAYMENT_STATUSES
+            ).exclude(payment_status=new_status)
+            ids = list(candidates.values_list('pk', flat=True))
+            if ids:
+                count += candidates.update(**payment_update(new_status))
+                changed.extend(ids)
+        sync_order_summaries(changed)
+        orders = list(Order.objects.filter(pk__in=changed).only(
+            'order_number_uuid', 'customer_email', 'status', 'payment_status'
+        ))
+        record_order_events(orders, 'status')
+
+    for order in orders:
+        cache_order_payment(order)
+    return count
@@ -0,0 +1,73 @@
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_menu_version, forget_order_payment, forget_user, revoke_user_tokens
+from .models import MenuItem, Order, OrderItem, UserObject
+from .services import record_order_events, upsert_order_summary, sync_item_count
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def menu_item_changed(sender, **kwargs):
+    bump_menu_version()
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def order_changed(sender, instance, **kwargs):
+    forget_order_payment(instance.order_number_uuid)
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, **kwargs):
+    upsert_order_summary(instance, getattr(instance, '_summary_item_count', None))
+
+
+@receiver(post_save, sender=Order)
+def order_event(sender, instance, created, update_fields, **kwargs):
+    if created:
+        record_order_events([instance], 'created')
+    elif (update_fields is None or {'status', 'payment_status'} & set(update_fields)) and instance.status_changed():
+        record_order_events([instance], 'status')
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    record_order_events([instance], 'deleted')
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def order_item_changed(sender, instance, **kwargs):
+    sync_item_count(instance.order_id)
+
+
+@receiver(pre_save, sender=UserObject)
+def user_saving(sender, instance, **kwargs):
+    # Remember what the token claims were built from
+    instance._claims_before = None
+    if instance.pk:
+        before = UserObject.objects.filter(pk=instance.pk).values_list(
+            'email', 'is_staff', 'tokens_valid_after'
+        ).first()
+        if before is not None:
+            instance._claims_before = before[:2]
+            # A stale instance must not write an older revocation back
+            if before[2] is not None and (instance.tokens_valid_after or before[2]) <= before[2]:
+                instance.tokens_valid_after = before[2]
+
+
+@receiver(post_save, sender=UserObject)
+def user_saved(sender, instance, created, **kwargs):
+    forget_user(instance.pk)
+    if created:
+        return
+    claims_changed = instance._claims_before != (instance.email, instance.is_staff)
+    if not instance.is_active or instance._password is not None or claims_changed:
+        revoke_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=UserObject)
+def user_deleted(sender, instance, **kwargs):
+    forget_user(instance.pk)
+    revoke_user_tokens(instance.pk)
@@ -1,10 +1,47 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from .models import MenuItem, Order, UserObject, OrderItem
+from .models import MenuItem, Order, UserObject, OrderItem, OrderSummary
 from decimal import Decimal
 from rest_framework.test import APIClient
+from .cache import clear_menu_cache, get_menu_version, get_user_data
+from django.core.cache import caches
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from .tokens import BloomFilter, CachedRefreshToken, blacklist
+from .serializers import ClaimsTokenObtainPairSerializer
+from .models import OrderEvent
+from asgiref.sync import sync_to_async
+import asyncio
+from datetime import timedelta
+from django.utils import timezone
+from .services import create_order, open_payments, apply_payu_status, update_order, OrderConflict
+from .filters import filter_orders
+from django.db import connection
+from .payu import TOKEN_LOCK_KEY, PayUTokenManager, PayUClient, CircuitBreaker, PayUUnavailable, token_manager
+from .payu_stub import StubPayU
+from .metrics import registry
+from .logs import DuplicateFilter, JSONFormatter, QueuedStreamHandler, RequestIDFilter, SamplingFilter
+from .utils import custom_exception_handler
+from .views import MenuItems
+from .querycheck import QueryBudgetExceeded, query_budget, shape
+from . import schema
+from .benchmarks import QUERY_BUDGETS, SCENARIOS, STAFF_EMAIL, SeedData, summarize
+from django.test.utils import CaptureQueriesContext
+from django.test import override_settings
+from django.core.management import call_command
+from io import StringIO
+from pathlib import Path
+import hashlib
+import json
+import logging
+import random
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
 
 SKIP_OLD_TESTS = False
 
@@ -220,6 +257,224 @@ class MenuItemTests(TestCase):
 
 
 
+class MenuCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.menu_url = reverse('menu')
+        cls.admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='admin123',
+            name='mike'
+        )
+
+    def setUp(self):
+        clear_menu_cache()
+        self.client = APIClient()
+        self.item = MenuItem.objects.create(
+            name='Cached Pizza',
+            description='Served from cache',
+            price='12.50',
+            category='pizza'
+        )
+
+    def test_menu_served_from_cache(self):
+        response = self.client.get(self.menu_url)
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.menu_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['name'], 'Cached Pizza')
+
+    def test_menu_invalidated_by_api_write(self):
+        self.client.get(self.menu_url)
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.post(self.menu_url, {
+            'name': 'New Salad',
+            'description': 'Fresh',
+            'price': '7.00',
+            'category': 'salad'
+        })
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get(self.menu_url)
+        self.assertEqual(len(response.data), 2)
+
+    def test_menu_invalidated_by_model_save(self):
+        # Admin edits go through Model.save and must invalidate too
+        self.client.get(self.menu_url)
+        self.item.price = Decimal('14.00')
+        self.item.save()
+
+        response = self.client.get(self.menu_url)
+        self.assertEqual(response.data[0]['price'], '14.00')
+
+        self.item.delete()
+        response = self.client.get(self.menu_url)
+        self.assertEqual(response.status_code, 404)
+
+
+
+
+class MenuBulkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bulk_url = reverse('menu_bulk')
+        cls.admin_user = get_user_model().objects.create_superuser(
+            email='pos@example.com',
+            password='admin123',
+            name='pos'
+        )
+
+    def setUp(self):
+        clear_menu_cache()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin_user)
+        self.items = [
+            MenuItem.objects.create(name=f'Pizza {i}', description='Test', price=Decimal('10.00'), category='pizza')
+            for i in range(3)
+        ]
+
+    def test_batch_applied_with_one_version_bump(self):
+        version = get_menu_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.bulk_url, {
+                'create': [{'name': 'Cola', 'description': 'Cold', 'price': '3.00', 'category': 'drink'}],
+                'update': [{'id': self.items[0].id, 'price': '11.00'},
+                           {'id': self.items[1].id, 'is_available': False}],
+                'upsert': [
+                    {'name': 'Pizza 2', 'description': 'Seasonal', 'price': '12.00', 'category': 'pizza'},
+                    {'name': 'Caesar', 'description': 'Crisp', 'price': '8.00', 'category': 'salad'},
+                ],
+                'delete': [],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'created': 2, 'updated': 3, 'deleted': 0})
+        # Once now and once after commit, instead of once per item
+        self.assertEqual(get_menu_version(), version + 2)
+
+        self.assertEqual(MenuItem.objects.get(pk=self.items[0].pk).price, Decimal('11.00'))
+        self.assertFalse(MenuItem.objects.get(pk=self.items[1].pk).is_available)
+        self.assertEqual(MenuItem.objects.get(pk=self.items[2].pk).description, 'Seasonal')
+        self.assertEqual(MenuItem.objects.count(), 5)
+
+        response = self.client.post(self.bulk_url, {'delete': [self.items[0].id, self.items[1].id]}, format='json')
+        self.assertEqual(response.data['deleted'], 2)
+        self.assertEqual(len(self.client.get(reverse('menu')).data), 3)
+
+    def test_invalid_batch_changes_nothing(self):
+        response = self.client.post(self.bulk_url, {
+            'create': [{'name': 'Cola', 'description': 'Cold', 'price': '3.00', 'category': 'drink'}],
+            'update': [{'id': 999999, 'price': '1.00'}, {'id': self.items[0].id, 'price': '-1'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('update', response.data)
+        self.assertEqual(MenuItem.objects.count(), 3)
+
+        response = self.client.post(self.bulk_url, {
+            'update': [{'id': 999999, 'price': '1.00'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('999999', str(response.data['update']))
+
+    def test_update_requires_id(self):
+        response = self.client.post(self.bulk_url, {'update': [{'price': '2.00'}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('id', response.data['update'][0])
+
+    def test_item_changed_once_per_batch(self):
+        target = self.items[0]
+        upsert = {'name': target.name, 'description': 'New', 'price': '5.00', 'category': 'pizza'}
+        for batch in (
+            {'update': [{'id': target.id, 'price': '2.00'}], 'upsert': [upsert]},
+            {'upsert': [upsert], 'delete': [target.id]},
+            {'update': [{'id': target.id, 'price': '2.00'}], 'delete': [target.id]},
+            {'update': [{'id': target.id, 'price': '2.00'}, {'id': target.id, 'price': '3.00'}]},
+        ):
+            response = self.client.post(self.bulk_url, batch, format='json')
+            self.assertEqual(response.status_code, 400, batch)
+            self.assertIn(str(target.id), str(response.data['non_field_errors']))
+        target.refresh_from_db()
+        self.assertEqual((target.price, target.description), (Decimal('10.00'), 'Test'))
+
+    def test_query_count_independent_of_batch_size(self):
+        for count in (1, 3):
+            update = [{'id': item.id, 'price': '9.00'} for item in self.items[:count]]
+            create = [{'name': f'Drink {i}', 'description': 'Cold', 'price': '3.00', 'category': 'drink'}
+                      for i in range(count)]
+            # Lookup by id, savepoint, insert, update, release
+            with self.assertNumQueries(5):
+                self.client.post(self.bulk_url, {'create': create, 'update': update}, format='json')
+
+    def test_staff_only(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.post(self.bulk_url, {'delete': [self.items[0].id]}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.menu_url = reverse('menu')
+        cls.orders_url = reverse('order')
+        cls.menu_item = MenuItem.objects.create(
+            name='Test Pizza',
+            description='Delicious test pizza',
+            price=Decimal('10.99'),
+            category='pizza'
+        )
+
+    def setUp(self):
+        clear_menu_cache()
+        self.client = APIClient()
+        self.order = Order.objects.create(
+            customer_name='Polling Customer',
+            customer_email='poll@example.com',
+            customer_phone='123456789',
+            delivery_address='Poll Street 1',
+        )
+        OrderItem.objects.create(order=self.order, menu_item=self.menu_item, quantity=2)
+        self.order.calculate_total()
+
+    def test_menu_not_modified(self):
+        response = self.client.get(self.menu_url)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.menu_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+        self.menu_item.save()
+        response = self.client.get(self.menu_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_order_not_modified(self):
+        url = f"{self.orders_url}{self.order.order_number_uuid}"
+        params = {'email': 'poll@example.com'}
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        # Only the version lookup runs, the order is never serialized
+        with self.assertNumQueries(1):
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertIn('Last-Modified', response)
+
+        self.order.status = 'confirmed'
+        self.order.save()
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'confirmed')
+
+
+
+
 class UserEndpointTests(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -271,6 +526,220 @@ class UserEndpointTests(TestCase):
 
 
 
+class ClaimsAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_url = reverse('user')
+        cls.orders_url = reverse('order')
+        cls.user = get_user_model().objects.create_user(
+            email="claims@example.com",
+            name="claims",
+            password="testpass"
+        )
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.client = APIClient()
+        response = self.client.post(reverse('sign_in'), {
+            'email': 'claims@example.com',
+            'password': 'testpass'
+        })
+        self.access = response.data['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    def test_token_carries_user_claims(self):
+        token = AccessToken(self.access)
+        self.assertEqual(token['email'], 'claims@example.com')
+        self.assertFalse(token['is_staff'])
+
+    def test_no_user_query_per_request(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.user_url)
+        self.assertEqual(response.data['email'], 'claims@example.com')
+        with self.assertNumQueries(0):
+            self.client.get(self.user_url)
+        # Only the OrderSummary page is read
+        with self.assertNumQueries(1):
+            response = self.client.get(self.orders_url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_deactivation_revokes_tokens(self):
+        response = self.client.delete(self.user_url)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.user_url)
+        self.assertEqual(response.status_code, 401)
+
+    def test_revocation_survives_cache_loss(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.user_url).status_code, 401)
+        # Restart, eviction or another worker's cache
+        caches['shared'].clear()
+        self.assertEqual(self.client.get(self.user_url).status_code, 401)
+        self.assertEqual(self.client.get(self.orders_url).status_code, 401)
+
+        self.user.is_active = True
+        self.user.save()
+        caches['shared'].clear()
+        self.assertEqual(self.client.get(self.user_url).status_code, 401)
+
+    def test_sign_in_right_after_revocation(self):
+        response = self.client.put(self.user_url, {'email': 'renamed@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.user_url).status_code, 401)
+
+        # Same second as the revocation
+        response = self.client.post(reverse('sign_in'), {'email': 'renamed@example.com', 'password': 'testpass'})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(self.client.get(self.user_url).status_code, 200)
+        access = self.client.post(reverse('ref_token'), {'refresh': response.data['refresh']}).data['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get(self.user_url).status_code, 200)
+
+        caches['shared'].clear()
+        self.assertEqual(self.client.get(self.user_url).status_code, 200)
+
+    def test_inactive_profile_is_not_served(self):
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(get_user_data(self.user.pk))
+
+    def test_claims_change_revokes_tokens(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(self.user_url).status_code, 401)
+
+    def test_profile_update_keeps_session(self):
+        self.client.get(self.user_url)
+        response = self.client.put(self.user_url, {'name': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.user_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Renamed')
+
+    def test_token_without_claims_falls_back_to_database(self):
+        token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.client.get(self.user_url).status_code, 200)
+
+
+class TokenBlacklistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email="logout@example.com",
+            name="logout",
+            password="testpass"
+        )
+
+    def setUp(self):
+        caches['shared'].clear()
+        blacklist.reset()
+        self.client = APIClient()
+        response = self.client.post(reverse('sign_in'), {
+            'email': 'logout@example.com',
+            'password': 'testpass'
+        })
+        self.refresh = response.data['refresh']
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        keys = [f'jti-{i}' for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f'other-{i}' in bloom for i in range(1000))
+        self.assertLess(false_positives, 50)
+
+    @override_settings(TOKEN_BLACKLIST_BLOOM=True)
+    def test_refresh_skips_blacklist_tables(self):
+        self.client.post(reverse('ref_token'), {'refresh': self.refresh})
+        # Only the active-user check is left on the warm path
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('ref_token'), {'refresh': self.refresh})
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout_blocks_refresh(self):
+        response = self.client.post(reverse('logout'), {'refresh': self.refresh})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse('ref_token'), {'refresh': self.refresh})
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(TOKEN_BLACKLIST_BLOOM=True)
+    def test_blacklist_from_other_process_is_picked_up(self):
+        self.client.post(reverse('ref_token'), {'refresh': self.refresh})
+        token = CachedRefreshToken(self.refresh)
+        # Written behind this process' back: only the shared generation moves
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token['jti']))
+        caches['shared'].set('auth:blacklist:generation', 1, None)
+        response = self.client.post(reverse('ref_token'), {'refresh': self.refresh})
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(TOKEN_BLACKLIST_BLOOM=False)
+    def test_process_local_cache_checks_database(self):
+        self.client.post(reverse('ref_token'), {'refresh': self.refresh})
+        token = CachedRefreshToken(self.refresh)
+        # Another worker's logout, which a per-process cache never hears of
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token['jti']))
+        response = self.client.post(reverse('ref_token'), {'refresh': self.refresh})
+        self.assertEqual(response.status_code, 401)
+
+    def test_purge_removes_expired_tokens_only(self):
+        expired = OutstandingToken.objects.create(
+            jti='expired', token='x', expires_at=timezone.now() - timedelta(days=1)
+        )
+        BlacklistedToken.objects.create(token=expired)
+        out = StringIO()
+        call_command('purge_tokens', '--batch-size', '1', stdout=out)
+        self.assertIn('Purged 1 expired tokens', out.getvalue())
+        self.assertFalse(BlacklistedToken.objects.exists())
+        self.assertTrue(OutstandingToken.objects.filter(user=self.user).exists())
+
+
+class PasswordHashingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email="hash@example.com",
+            name="hash",
+            password="testpass"
+        )
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.client = APIClient()
+
+    def test_new_hashes_use_configured_hasher(self):
+        self.assertTrue(self.user.password.startswith('scrypt$32768$'))
+
+    def test_old_hash_upgraded_on_login(self):
+        from django.contrib.auth.hashers import make_password
+        UserObject.objects.filter(pk=self.user.pk).update(
+            password=make_password('testpass', hasher='pbkdf2_sha256')
+        )
+        response = self.client.post(reverse('sign_in'), {
+            'email': 'hash@example.com', 'password': 'testpass'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(UserObject.objects.get(pk=self.user.pk).password.startswith('scrypt$'))
+
+        # The upgrade is not a password change, the new token stays valid
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(self.client.get(reverse('user')).status_code, 200)
+
+    def test_async_register(self):
+        url = reverse('sign_up_async')
+        response = self.client.post(url, {
+            'email': 'async@example.com', 'name': 'async', 'password': 'testpass'
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(UserObject.objects.get(email='async@example.com').check_password('testpass'))
+
+        response = self.client.post(url, {
+            'email': 'async@example.com', 'name': 'async', 'password': 'testpass'
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
 class OrdersTests(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -384,5 +853,1401 @@ class OrdersTests(TestCase):
 
 
 
+class OrderQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.orders_url = reverse('order')
+        cls.admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='admin123',
+            name='mike'
+        )
+        cls.customer = get_user_model().objects.create_user(
+            email="customer@example.com",
+            name="customer",
+            password="testpass"
+        )
+        cls.menu_items = [
+            MenuItem.objects.create(
+                name=f'Item {i}',
+                description='Test item',
+                price=Decimal('5.50'),
+                category='pizza'
+            ) for i in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def create_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(
+                customer_name='Customer',
+                customer_email='customer@example.com',
+                customer_phone='123456789',
+                delivery_address='Test Address 123',
+            )
+            for menu_item in self.menu_items:
+                OrderItem.objects.create(order=order, menu_item=menu_item, quantity=2)
+            order.calculate_total()
+
+    def list_orders(self):
+        response = self.client.get(self.orders_url)
+        if isinstance(response.data, dict):
+            return response.data['results']
+        return response.data
+
+    def assert_list_queries_flat(self, user):
+        self.client.force_authenticate(user=user)
+        self.create_orders(1)
+        with self.assertNumQueries(2):
+            orders = self.list_orders()
+        self.assertEqual(len(orders), 1)
+
+        self.create_orders(10)
+        with self.assertNumQueries(2):
+            orders = self.list_orders()
+        self.assertEqual(len(orders), 11)
+        self.assertEqual(len(orders[0]['items']), 3)
+        self.assertEqual(orders[0]['items'][0]['menu_item_name'], 'Item 0')
+
+    def test_staff_order_list_query_count(self):
+        self.assert_list_queries_flat(self.admin_user)
+
+    def test_customer_order_list_query_count(self):
+        # Customers get summaries from the projection, a single query
+        self.client.force_authenticate(user=self.customer)
+        self.create_orders(1)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.list_orders()), 1)
+
+        self.create_orders(10)
+        with self.assertNumQueries(1):
+            orders = self.list_orders()
+        self.assertEqual(len(orders), 11)
+        self.assertEqual(orders[0]['item_count'], 6)
+
+    def test_order_detail_query_count(self):
+        self.create_orders(1)
+        order = Order.objects.get()
+        # Version lookup, the order, its items with menu items
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                f"{self.orders_url}{order.order_number_uuid}",
+                {'email': 'customer@example.com'}
+            )
+        self.assertEqual(len(response.data['items']), 3)
+
+
+
+class StaffOrderListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.orders_url = reverse('order')
+        cls.admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='admin123',
+            name='mike'
+        )
+        for i in range(7):
+            Order.objects.create(
+                customer_name=f'Customer {i}',
+                customer_email=f'customer{i % 2}@example.com',
+                customer_phone='123456789',
+                delivery_address='Test Address 123',
+                status='pending' if i % 3 else 'delivered',
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin_user)
+
+    def test_cursor_walks_all_orders_once(self):
+        seen = []
+        url, params = self.orders_url, {'page_size': 3}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 3)
+            seen.extend(order['order_number_uuid'] for order in response.data['results'])
+            url, params = response.data['next'], None
+
+        expected = Order.objects.order_by('-created_at', '-id').values_list('order_number_uuid', flat=True)
+        self.assertEqual(seen, [str(uuid) for uuid in expected])
+
+    def test_filters(self):
+        response = self.client.get(self.orders_url, {
+            'status': 'pending',
+            'customer_email': 'customer1@example.com',
+        })
+        expected = Order.objects.filter(status='pending', customer_email='customer1@example.com')
+        self.assertEqual(len(response.data['results']), expected.count())
+
+        response = self.client.get(self.orders_url, {'created_after': '2000-01-01', 'created_before': '2000-01-02'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_invalid_params(self):
+        response = self.client.get(self.orders_url, {'created_after': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(self.orders_url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+
+class CreateOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.orders_url = reverse('order')
+        cls.menu_items = [
+            MenuItem.objects.create(
+                name=f'Item {i}',
+                description='Test item',
+                price=Decimal('4.25'),
+                category='pasta'
+            ) for i in range(20)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.order_data = {
+            'customer_name': 'Test Customer',
+            'customer_email': 'customer@example.com',
+            'customer_phone': '123456789',
+            'delivery_address': 'Test Address 123',
+        }
+
+    def test_query_count_independent_of_items(self):
+        # Menu lookup, savepoint, order insert, summary upsert, event insert,
+        # items bulk insert, release
+        for count in (1, 20):
+            lines = [{'menu_item': item.id, 'quantity': 2} for item in self.menu_items[:count]]
+            with self.assertNumQueries(7):
+                order, items = create_order(self.order_data, lines)
+            self.assertEqual(order.items.count(), count)
+            self.assertEqual(order.total_amount, Decimal('8.50') * count)
+
+    def test_invalid_item_creates_nothing(self):
+        response = self.client.post(self.orders_url, {
+            **self.order_data,
+            'items': [
+                {'menu_item': self.menu_items[0].id, 'quantity': 1},
+                {'menu_item': 999999, 'quantity': 1},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('menu_item', response.data)
+        self.assertFalse(Order.objects.exists())
+
+        response = self.client.post(self.orders_url, {
+            **self.order_data,
+            'items': [{'menu_item': self.menu_items[0].id, 'quantity': 0}]
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+
+class PayUTokenManagerTests(TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.manager = self.make_manager()
+        self.manager.reset()
+
+    def make_manager(self, expires_in=3600, delay=0):
+        def fetch():
+            time.sleep(delay)
+            self.calls += 1
+            return f'token-{self.calls}', expires_in
+        return PayUTokenManager(fetch=fetch, expiry_margin=30, refresh_ahead=300)
+
+    def test_token_is_cached(self):
+        self.assertEqual(self.manager.get_token(), 'token-1')
+        self.assertEqual(self.manager.get_token(), 'token-1')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.manager.metrics()['hits'], 1)
+        self.assertEqual(self.manager.metrics()['misses'], 1)
+
+    def test_token_shared_between_managers(self):
+        self.manager.get_token()
+        other = self.make_manager()
+        self.assertEqual(other.get_token(), 'token-1')
+        self.assertEqual(other.metrics()['shared_hits'], 1)
+        self.assertEqual(self.calls, 1)
+
+    def test_concurrent_misses_fetch_once(self):
+        manager = self.make_manager(delay=0.1)
+        tokens = []
+        threads = [threading.Thread(target=lambda: tokens.append(manager.get_token())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(set(tokens), {'token-1'})
+
+    def test_expiring_token_refreshed_in_background(self):
+        manager = self.make_manager(expires_in=200)
+        self.assertEqual(manager.get_token(), 'token-1')
+        # Still usable, but inside the refresh-ahead window
+        self.assertEqual(manager.get_token(), 'token-1')
+        for _ in range(50):
+            if manager.metrics()['background_refreshes']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(manager.metrics()['background_refreshes'], 1)
+        self.assertEqual(manager.get_token(), 'token-2')
+        # That read is inside the window again; let its refresh finish before the next test
+        for _ in range(50):
+            if manager.metrics()['background_refreshes'] == 2:
+                break
+            time.sleep(0.01)
+
+    def test_peer_lock_is_never_bypassed_or_released(self):
+        manager = PayUTokenManager(fetch=lambda: ('token', 3600), expiry_margin=30, refresh_ahead=300,
+                                   lock_timeout=0.2)
+        caches['shared'].set(TOKEN_LOCK_KEY, 'peer', 10)
+        with self.assertRaises(PayUUnavailable):
+            manager.get_token()
+        self.assertEqual(caches['shared'].get(TOKEN_LOCK_KEY), 'peer')
+        caches['shared'].delete(TOKEN_LOCK_KEY)
+
+    def test_lock_taken_over_when_peer_gives_up(self):
+        caches['shared'].set(TOKEN_LOCK_KEY, 'peer', 10)
+        # The peer's fetch failed: it releases without publishing a token
+        threading.Timer(0.1, caches['shared'].delete, [TOKEN_LOCK_KEY]).start()
+        self.assertEqual(self.manager.get_token(), 'token-1')
+        self.assertEqual(self.calls, 1)
+        self.assertIsNone(caches['shared'].get(TOKEN_LOCK_KEY))
+
+
+
+class PayUClientTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = StubPayU().start()
+        cls.settings_override = override_settings(**cls.stub.settings())
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.stub.stop()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.orders_url = reverse('order')
+        cls.menu_item = MenuItem.objects.create(
+            name='Test Pizza',
+            description='Delicious test pizza',
+            price=Decimal('10.99'),
+            category='pizza'
+        )
+
+    def setUp(self):
+        self.stub.requests.clear()
+        self.stub.fail_next = 0
+        token_manager.reset()
+        self.client = APIClient()
+        self.payu = PayUClient(backoff=0, breaker=CircuitBreaker(threshold=2, reset_timeout=60))
+
+    def test_checkout_against_stub(self):
+        for _ in range(2):
+            response = self.client.post(self.orders_url, {
+                'customer_name': 'Test Customer',
+                'customer_email': 'customer@example.com',
+                'customer_phone': '123456789',
+                'delivery_address': 'Test Address 123',
+                'items': [{'menu_item': self.menu_item.id, 'quantity': 2}]
+            }, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('redirectUri', response.data)
+
+        # The OAuth token is fetched once and reused by the second checkout
+        self.assertEqual(self.stub.requests, [('POST', '/oauth'), ('POST', '/orders'), ('POST', '/orders')])
+        order = Order.objects.get(payu_order_id=response.data['orderId'])
+        self.assertEqual(order.total_amount, Decimal('21.98'))
+
+    async def test_async_checkout_against_stub(self):
+        response = await self.async_client.post(reverse('order_async'), {
+            'customer_name': 'Async Customer',
+            'customer_email': 'async@example.com',
+            'customer_phone': '123456789',
+            'delivery_address': 'Test Address 123',
+            'items': [{'menu_item': self.menu_item.id, 'quantity': 3}]
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIn('redirectUri', data)
+
+        order = await Order.objects.aget(payu_order_id=data['orderId'])
+        self.assertEqual(order.total_amount, Decimal('32.97'))
+
+    async def test_async_checkout_invalid_items(self):
+        response = await self.async_client.post(reverse('order_async'), {
+            'customer_name': 'Async Customer',
+            'customer_email': 'async@example.com',
+            'customer_phone': '123456789',
+            'delivery_address': 'Test Address 123',
+            'items': []
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(await Order.objects.aexists())
+
+    def test_reconcile_payments(self):
+        token, _ = self.payu.fetch_oauth_token()
+        orders = {}
+        for payu_status in ('COMPLETED', 'CANCELED', 'PENDING'):
+            payu_order_id = self.payu.create_order({}, token)['orderId']
+            self.stub.set_status(payu_order_id, payu_status)
+            orders[payu_status] = Order.objects.create(
+                customer_name='Customer',
+                customer_email='customer@example.com',
+                customer_phone='123456789',
+                delivery_address='Test Address 123',
+                payu_order_id=payu_order_id,
+            )
+
+        call_command('reconcile_payments', workers=2, rate=0, batch_size=2, stdout=StringIO())
+
+        for payu_status, expected in (('COMPLETED', 'confirmed'), ('CANCELED', 'canceled'), ('PENDING', 'pending')):
+            orders[payu_status].refresh_from_db()
+            self.assertEqual(orders[payu_status].payment_status, expected)
+        self.assertEqual(orders['COMPLETED'].status, 'confirmed')
+
+        # Final outcomes drop out of the scan, only the pending one is asked again
+        self.stub.requests.clear()
+        call_command('reconcile_payments', rate=0, stdout=StringIO())
+        self.assertEqual(len([r for r in self.stub.requests if r[0] == 'GET']), 1)
+
+    def test_reconcile_payments_survives_bad_answers(self):
+        answers = {
+            'EMPTY': {'orders': []},
+            'BROKEN': ValueError('Expecting value: line 1 column 1 (char 0)'),
+            'DONE': {'orders': [{'status': 'COMPLETED'}]},
+        }
+        orders = {
+            payu_order_id: Order.objects.create(
+                customer_name='Customer',
+                customer_email='customer@example.com',
+                customer_phone='123456789',
+                delivery_address='Test Address 123',
+                payu_order_id=payu_order_id,
+            )
+            for payu_order_id in answers
+        }
+
+        def get_status(payu_order_id, access_token):
+            if isinstance(answers[payu_order_id], Exception):
+                raise answers[payu_order_id]
+            return answers[payu_order_id]
+
+        out = StringIO()
+        with mock.patch('rest_api.management.commands.reconcile_payments.get_payu_order_status', get_status):
+            call_command('reconcile_payments', rate=0, stdout=out)
+        self.assertIn('1 updated, 2 errors', out.getvalue())
+        orders['DONE'].refresh_from_db()
+        self.assertEqual(orders['DONE'].payment_status, 'confirmed')
+
+    def test_idempotent_calls_are_retried(self):
+        token, _ = self.payu.fetch_oauth_token()
+        order_id = self.payu.create_order({'extOrderId': 'x'}, token)['orderId']
+
+        self.stub.fail_next = 2
+        result = self.payu.get_order_status(order_id, token)
+        self.assertEqual(result['orders'][0]['status'], 'PENDING')
+        self.assertEqual(len(self.stub.requests), 5)
+
+    def test_order_creation_is_not_retried(self):
+        self.stub.fail_next = 1
+        result = self.payu.create_order({'extOrderId': 'x'}, 'token')
+        self.assertEqual(result['status']['statusCode'], 'SERVICE_UNAVAILABLE')
+        self.assertEqual(len(self.stub.requests), 1)
+
+    def test_circuit_breaker_opens(self):
+        self.stub.fail_next = 100
+        for _ in range(2):
+            self.assertIsNone(self.payu.get_order_status('missing', 'token'))
+        requests_sent = len(self.stub.requests)
+
+        with self.assertRaises(PayUUnavailable):
+            self.payu.get_order_status('missing', 'token')
+        self.assertEqual(len(self.stub.requests), requests_sent)
+        self.assertEqual(self.payu.breaker.state, 'open')
+
+    def test_timeout_raises_unavailable(self):
+        self.stub.delay = 0.5
+        try:
+            payu = PayUClient(read_timeout=0.1, max_retries=0)
+            with self.assertRaises(PayUUnavailable):
+                payu.get_order_status('missing', 'token')
+        finally:
+            self.stub.delay = 0
+
+
+
+@override_settings(PAYU_SECOND_KEY='test-second-key', PAYU_NOTIFY_URL='http://testserver/api/v1/payments/payu/notify/')
+class PayuNotificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.notify_url = reverse('payu_notify')
+        cls.orders_url = reverse('order')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.order = Order.objects.create(
+            customer_name='Paying Customer',
+            customer_email='pay@example.com',
+            customer_phone='123456789',
+            delivery_address='Pay Street 1',
+            total_amount=Decimal('20.00'),
+            payu_order_id='PAYU123',
+        )
+
+    def notify(self, payu_status, key='test-second-key'):
+        body = json.dumps({'order': {
+            'orderId': 'PAYU123',
+            'extOrderId': str(self.order.order_number_uuid),
+            'status': payu_status,
+        }}).encode()
+        signature = hashlib.md5(body + key.encode()).hexdigest()
+        return self.client.generic(
+            'POST', self.notify_url, body, content_type='application/json',
+            HTTP_OPENPAYU_SIGNATURE=f'sender=checkout;signature={signature};algorithm=MD5;content=DOCUMENT'
+        )
+
+    def check_payment(self):
+        return self.client.get(
+            f"{self.orders_url}{self.order.order_number_uuid}",
+            {'check_payment': 'true', 'email': 'pay@example.com'}
+        )
+
+    def test_completed_notification_confirms_order(self):
+        response = self.check_payment()
+        self.assertEqual(response.data['payuStatus'], 'pending')
+
+        self.assertEqual(self.notify('COMPLETED').status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'confirmed')
+        self.assertEqual(self.order.status, 'confirmed')
+
+        # Served from the pushed cache entry, no database access
+        with self.assertNumQueries(0):
+            response = self.check_payment()
+        self.assertEqual(response.data['payuStatus'], 'confirmed')
+        self.assertEqual(response.data['status'], 'confirmed')
+
+    def test_cached_status_returns_canonical_order_number(self):
+        url = f"{self.orders_url}{str(self.order.order_number_uuid).upper()}"
+        params = {'check_payment': 'true', 'email': 'pay@example.com'}
+        from_database = self.client.get(url, params)
+        with self.assertNumQueries(0):
+            from_cache = self.client.get(url, params)
+        self.assertEqual(from_cache.json(), from_database.json())
+        self.assertEqual(from_cache.json()['orderNumber'], str(self.order.order_number_uuid))
+
+    def test_replayed_and_late_notifications_are_ignored(self):
+        self.notify('COMPLETED')
+        self.assertEqual(self.notify('COMPLETED').status_code, 200)
+        self.assertEqual(self.notify('PENDING').status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'confirmed')
+
+    def test_invalid_signature_rejected(self):
+        response = self.notify('COMPLETED', key='wrong-key')
+        self.assertEqual(response.status_code, 403)
+        self.order.refresh_from_db()
+        self.assertIsNone(self.order.payment_status)
+
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN every hot Order query from views.py on a seeded table and fail
+    if one of them falls back to a full table scan.
+    """
+    SEED_ORDERS = 3000
+
+    @classmethod
+    def setUpTestData(cls):
+        statuses = [choice for choice, _ in Order.STATUS_CHOICES]
+        orders = Order.objects.bulk_create([
+            Order(
+                customer_name=f'Customer {i}',
+                customer_email=f'customer{i % 300}@example.com',
+                customer_phone='123456789',
+                delivery_address='Test Address 123',
+                status=statuses[i % len(statuses)],
+                payment_status=None if i % 4 else 'confirmed',
+                payu_order_id=f'PAYU{i}' if i % 2 else None,
+                total_amount=Decimal('10.00'),
+            ) for i in range(cls.SEED_ORDERS)
+        ])
+        cls.sample = orders[123]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def hot_queries(self):
+        sample = self.sample
+        staff_list = lambda **params: filter_orders(
+            Order.objects.all(), params
+        ).order_by('-created_at', '-id')[:51]
+        return {
+            'guest/customer detail': Order.objects.filter(
+                order_number_uuid=sample.order_number_uuid, customer_email=sample.customer_email
+            ),
+            'detail etag lookup': Order.objects.filter(
+                order_number_uuid=sample.order_number_uuid
+            ).values_list('order_number_uuid', 'updated_at'),
+            'customer order list': Order.objects.filter(
+                customer_email=sample.customer_email
+            ).order_by('-created_at', '-id'),
+            'staff list': staff_list(),
+            'staff list by status': staff_list(status='pending'),
+            'staff list by payment status': staff_list(payment_status='confirmed'),
+            'staff list by email': staff_list(customer_email=sample.customer_email),
+            'staff list by date': staff_list(created_after='2000-01-01', created_before='2100-01-01'),
+            'payu order lookup': Order.objects.filter(payu_order_id=sample.payu_order_id),
+            'open payments': open_payments().filter(id__gt=0).order_by('id')[:200],
+            'order items prefetch': OrderItem.objects.filter(order_id__in=[sample.pk]),
+        }
+
+    def full_table_scan(self, plan):
+        if connection.vendor == 'postgresql':
+            return 'Seq Scan' in plan
+        # SQLite: "SCAN <table>" without an index is a full scan, while
+        # "SEARCH ..." and "SCAN ... USING [COVERING] INDEX" are not
+        return any(
+            ' SCAN ' in f' {line} ' and 'USING' not in line
+            for line in plan.splitlines()
+        )
+
+    def test_hot_queries_use_indexes(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest(f'No plan checks for {connection.vendor}')
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(query=name):
+                plan = queryset.explain()
+                self.assertFalse(
+                    self.full_table_scan(plan),
+                    f'{name} does a full table scan:\n{queryset.query}\n{plan}'
+                )
+
+
+
+class OrderSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.orders_url = reverse('order')
+        cls.customer = get_user_model().objects.create_user(
+            email="loyal@example.com",
+            name="loyal",
+            password="testpass"
+        )
+        cls.menu_item = MenuItem.objects.create(
+            name='Test Pizza',
+            description='Delicious test pizza',
+            price=Decimal('10.00'),
+            category='pizza'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+        self.order_data = {
+            'customer_name': 'Loyal Customer',
+            'customer_email': 'loyal@example.com',
+            'customer_phone': '123456789',
+            'delivery_address': 'Test Address 123',
+        }
+
+    def test_summary_follows_order_writes(self):
+        order, _ = create_order(self.order_data, [{'menu_item': self.menu_item.id, 'quantity': 3}])
+        summary = OrderSummary.objects.get(order=order)
+        self.assertEqual(summary.item_count, 3)
+        self.assertEqual(summary.total_amount, Decimal('30.00'))
+
+        order.payu_order_id = 'PAYU1'
+        order.save()
+        apply_payu_status(order, 'COMPLETED')
+        summary.refresh_from_db()
+        self.assertEqual(summary.status, 'confirmed')
+
+        order.status = 'preparing'
+        order.save()
+        OrderItem.objects.create(order=order, menu_item=self.menu_item, quantity=2)
+        summary.refresh_from_db()
+        self.assertEqual(summary.status, 'preparing')
+        self.assertEqual(summary.item_count, 5)
+
+    def test_my_orders_paginated(self):
+        for _ in range(5):
+            create_order(self.order_data, [{'menu_item': self.menu_item.id, 'quantity': 1}])
+        create_order({**self.order_data, 'customer_email': 'other@example.com'},
+                     [{'menu_item': self.menu_item.id, 'quantity': 1}])
+
+        response = self.client.get(self.orders_url, {'page_size': 3})
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertNotIn('items', response.data['results'][0])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+
+        # Full detail is still served on drill-down
+        uuid = response.data['results'][0]['order_number_uuid']
+        response = self.client.get(f"{self.orders_url}{uuid}")
+        self.assertEqual(len(response.data['items']), 1)
+
+    def test_rebuild_command(self):
+        order, _ = create_order(self.order_data, [{'menu_item': self.menu_item.id, 'quantity': 4}])
+        OrderSummary.objects.all().delete()
+        call_command('rebuild_order_summaries', stdout=StringIO())
+        self.assertEqual(OrderSummary.objects.get(order=order).item_count, 4)
+
+
+@override_settings(ORDER_EVENTS_POLL_INTERVAL=0.02, ORDER_EVENTS_STREAM_TIMEOUT=0.5)
+class KitchenStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.stream_url = reverse('kitchen_stream')
+        cls.staff = get_user_model().objects.create_user(
+            email="kitchen@example.com",
+            name="kitchen",
+            password="testpass",
+            is_staff=True
+        )
+        cls.customer = get_user_model().objects.create_user(
+            email="hungry@example.com",
+            name="hungry",
+            password="testpass"
+        )
+        cls.menu_item = MenuItem.objects.create(
+            name='Test Pizza',
+            description='Delicious test pizza',
+            price=Decimal('10.00'),
+            category='pizza'
+        )
+        cls.order_data = {
+            'customer_name': 'Hungry Customer',
+            'customer_email': 'hungry@example.com',
+            'customer_phone': '123456789',
+            'delivery_address': 'Test Address 123',
+        }
+
+    def setUp(self):
+        caches['shared'].clear()
+
+    async def token(self, user):
+        refresh = await sync_to_async(ClaimsTokenObtainPairSerializer.get_token)(user)
+        return str(refresh.access_token)
+
+    def events(self, body):
+        frames = [frame for frame in body.decode().split('\n\n') if frame.startswith('id:')]
+        parsed = []
+        for frame in frames:
+            fields = dict(line.split(': ', 1) for line in frame.split('\n'))
+            parsed.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+        return parsed
+
+    async def read(self, response):
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    def test_events_recorded_for_order_lifecycle(self):
+        order, _ = create_order(self.order_data, [{'menu_item': self.menu_item.id, 'quantity': 1}])
+        order.payu_order_id = 'PAYU1'
+        order.save(update_fields=['payu_order_id', 'updated_at'])
+        apply_payu_status(order, 'COMPLETED')
+        order.status = 'preparing'
+        order.save()
+        order.save()
+        order.delete()
+        self.assertEqual(
+            list(OrderEvent.objects.order_by('id').values_list('kind', 'status')),
+            [('created', 'pending'), ('status', 'confirmed'), ('status', 'preparing'), ('deleted', 'preparing')]
+        )
+
+    async def test_staff_only(self):
+        response = await self.async_client.get(self.stream_url)
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(
+            self.stream_url, headers={'Authorization': f'Bearer {await self.token(self.customer)}'}
+        )
+        self.assertEqual(response.status_code, 403)
+
+    async def test_snapshot_then_live_events(self):
+        order, _ = await sync_to_async(create_order)(
+            self.order_data, [{'menu_item': self.menu_item.id, 'quantity': 2}]
+        )
+        response = await self.async_client.get(
+            self.stream_url, {'access_token': await self.token(self.staff)}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        reader = asyncio.ensure_future(self.read(response))
+        await asyncio.sleep(0.1)
+
+        def prepare():
+            order.status = 'preparing'
+            order.save()
+        await sync_to_async(prepare)()
+        events = self.events(await reader)
+
+        self.assertEqual(events[0][1], 'snapshot')
+        self.assertEqual(events[0][2]['order_number_uuid'], str(order.order_number_uuid))
+        self.assertEqual(len(events[0][2]['order']['items']), 1)
+        self.assertEqual(events[-1][1], 'order')
+        self.assertEqual(events[-1][2]['status'], 'preparing')
+
+    async def test_resume_from_last_event_id(self):
+        first, _ = await sync_to_async(create_order)(
+            self.order_data, [{'menu_item': self.menu_item.id, 'quantity': 1}]
+        )
+        second, _ = await sync_to_async(create_order)(
+            self.order_data, [{'menu_item': self.menu_item.id, 'quantity': 1}]
+        )
+        cursor = await OrderEvent.objects.filter(order=first).values_list('id', flat=True).aget()
+        response = await self.async_client.get(
+            self.stream_url,
+            headers={
+                'Authorization': f'Bearer {await self.token(self.staff)}',
+                'Last-Event-ID': str(cursor),
+            },
+        )
+        events = self.events(await self.read(response))
+        self.assertEqual([event[2]['order_number_uuid'] for event in events], [str(second.order_number_uuid)])
+        self.assertEqual(events[0][2]['kind'], 'created')
+
+
+@override_settings(ORDER_EVENTS_POLL_INTERVAL=0.02, ORDER_EVENTS_STREAM_TIMEOUT=0.3)
+class OrderWatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.menu_item = MenuItem.objects.create(
+            name='Test Pizza',
+            description='Delicious test pizza',
+            price=Decimal('10.00'),
+            category='pizza'
+        )
+        cls.order_data = {
+            'customer_name': 'Watching Customer',
+            'customer_email': 'watch@example.com',
+            'customer_phone': '123456789',
+            'delivery_address': 'Test Address 123',
+        }
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.order, _ = create_order(self.order_data, [{'menu_item': self.menu_item.id, 'quantity': 1}])
+        self.other, _ = create_order(self.order_data, [{'menu_item': self.menu_item.id, 'quantity': 1}])
+        self.poll_url = reverse('order_poll', args=[self.order.order_number_uuid])
+        self.stream_url = reverse('order_stream', args=[self.order.order_number_uuid])
+
+    def set_status(self, order, new_status):
+        order.status = new_status
+        order.save()
+
+    async def test_requires_matching_email(self):
+        response = await self.async_client.get(self.poll_url, {'email': 'someone@example.com'})
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(self.poll_url)
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get(
+            reverse('order_poll', args=['not-a-uuid']), {'email': 'watch@example.com'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    async def test_long_poll(self):
+        response = await self.async_client.get(self.poll_url, {'email': 'watch@example.com'})
+        body = json.loads(response.content)
+        self.assertEqual([event['kind'] for event in body['events']], ['snapshot'])
+        self.assertEqual(body['events'][0]['status'], 'pending')
+        cursor = body['cursor']
+
+        # Nothing new: waits for the timeout and keeps the cursor
+        response = await self.async_client.get(
+            self.poll_url, {'email': 'watch@example.com', 'cursor': cursor, 'timeout': 0.05}
+        )
+        self.assertEqual(json.loads(response.content), {'cursor': cursor, 'events': []})
+
+        poll = asyncio.ensure_future(self.async_client.get(
+            self.poll_url, {'email': 'watch@example.com', 'cursor': cursor, 'timeout': 2}
+        ))
+        await asyncio.sleep(0.1)
+        await sync_to_async(self.set_status)(self.other, 'preparing')
+        await sync_to_async(self.set_status)(self.order, 'preparing')
+        body = json.loads((await poll).content)
+        self.assertEqual([event['status'] for event in body['events']], ['preparing'])
+        self.assertEqual(body['events'][0]['order_number_uuid'], str(self.order.order_number_uuid))
+        self.assertGreater(body['cursor'], cursor)
+
+    async def test_stream_only_carries_the_order(self):
+        await sync_to_async(self.set_status)(self.other, 'preparing')
+        await sync_to_async(self.set_status)(self.order, 'preparing')
+        response = await self.async_client.get(self.stream_url, {'email': 'watch@example.com', 'cursor': 0})
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        data = [json.loads(line[6:]) for line in body.split('\n') if line.startswith('data: ')]
+        self.assertEqual([(event['kind'], event['status']) for event in data],
+                         [('created', 'pending'), ('status', 'preparing')])
+
+
+class OrderTransitionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = get_user_model().objects.create_superuser(
+            email="dispatch@example.com",
+            name="dispatch",
+            password="testpass"
+        )
+        cls.menu_item = MenuItem.objects.create(
+            name='Test Pizza',
+            description='Delicious test pizza',
+            price=Decimal('10.00'),
+            category='pizza'
+        )
+        cls.order_data = {
+            'customer_name': 'Test Customer',
+            'customer_email': 'customer@example.com',
+            'customer_phone': '123456789',
+            'delivery_address': 'Test Address 123',
+        }
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin_user)
+
+    def new_order(self, order_status='pending'):
+        order, _ = create_order(self.order_data, [{'menu_item': self.menu_item.id, 'quantity': 1}])
+        if order_status != 'pending':
+            Order.objects.filter(pk=order.pk).update(status=order_status)
+            order.refresh_from_db()
+        return order
+
+    def test_put_follows_state_machine(self):
+        order = self.new_order('confirmed')
+        url = reverse('order_id', args=[order.pk])
+
+        response = self.client.put(url, {'status': 'delivered'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.put(url, {'status': 'preparing', 'version': order.version}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'preparing')
+        self.assertEqual(response.data['version'], order.version + 1)
+        self.assertEqual(OrderSummary.objects.get(order=order).status, 'preparing')
+        self.assertEqual(OrderEvent.objects.filter(order=order).last().status, 'preparing')
+
+        # A second editor still holding the old version loses
+        response = self.client.put(url, {'status': 'canceled', 'version': order.version}, format='json')
+        self.assertEqual(response.status_code, 409)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'preparing')
+
+    def test_update_writes_only_changed_columns(self):
+        order = self.new_order()
+        stale = Order.objects.get(pk=order.pk)
+        order.payu_order_id = 'PAYU1'
+        order.save(update_fields=['payu_order_id', 'updated_at'])
+        apply_payu_status(order, 'COMPLETED')
+
+        # The payment bumped the version, so the stale copy cannot clobber it
+        with self.assertRaises(OrderConflict):
+            update_order(stale, {'delivery_address': 'Elsewhere 1'})
+        update_order(order, {'delivery_address': 'Elsewhere 1'})
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.payment_status, order.delivery_address),
+                         ('confirmed', 'confirmed', 'Elsewhere 1'))
+
+    def test_bulk_transition(self):
+        preparing = [self.new_order('preparing') for _ in range(3)]
+        pending = self.new_order()
+        url = reverse('order_transitions')
+        numbers = [str(order.order_number_uuid) for order in preparing + [pending]]
+
+        with self.assertNumQueries(7):
+            response = self.client.post(url, {'orders': numbers, 'status': 'out_for_delivery'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.data['updated']), sorted(numbers[:3]))
+        self.assertEqual(response.data['skipped'], [{'order_number_uuid': numbers[3], 'status': 'pending'}])
+        self.assertEqual(Order.objects.filter(status='out_for_delivery', version=2).count(), 3)
+        self.assertEqual(OrderSummary.objects.filter(status='out_for_delivery').count(), 3)
+
+        self.client.force_authenticate(user=None)
+        response = self.client.post(url, {'orders': numbers, 'status': 'delivered'}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def admin_change(self, order, **fields):
+        client = Client()
+        client.force_login(self.admin_user)
+        data = {
+            **self.order_data,
+            'status': order.status,
+            'version': order.version,
+            'items-TOTAL_FORMS': 0,
+            'items-INITIAL_FORMS': 0,
+            '_save': 'Save',
+            **fields,
+        }
+        return client.post(reverse('admin:rest_api_order_change', args=[order.pk]), data)
+
+    def test_admin_follows_state_machine(self):
+        order = self.new_order()
+        response = self.admin_change(order, status='delivered')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Cannot change status', response.content.decode())
+
+        response = self.admin_change(order, status='confirmed')
+        self.assertEqual(response.status_code, 302)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.version), ('confirmed', 2))
+        self.assertTrue(OrderEvent.objects.filter(order=order, kind='status', status='confirmed').exists())
+
+        # Edited from a page loaded before that change
+        response = self.admin_change(order, status='canceled', version=1)
+        self.assertEqual(response.status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'confirmed')
+
+    def test_calculate_total_writes_only_the_total(self):
+        order = self.new_order()
+        stale = Order.objects.get(pk=order.pk)
+        update_order(order, {'status': 'confirmed'})
+        stale.calculate_total()
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.version, order.total_amount), ('confirmed', 3, Decimal('10.00')))
+
+
+
+def server_timing(response):
+    """Server-Timing header as {name: (milliseconds, description)}"""
+    entries = {}
+    for entry in response['Server-Timing'].split(', '):
+        name, *params = entry.split(';')
+        params = dict(param.split('=', 1) for param in params)
+        entries[name] = (float(params['dur']), params.get('desc', '').strip('"'))
+    return entries
+
+
+@override_settings(METRICS_SAMPLE_RATE=1.0, METRICS_SERVER_TIMING=True, METRICS_TOKEN=None)
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = StubPayU().start()
+        cls.settings_override = override_settings(**cls.stub.settings())
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.stub.stop()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.menu_item = MenuItem.objects.create(
+            name='Test Pizza',
+            description='Delicious test pizza',
+            price=Decimal('10.00'),
+            category='pizza'
+        )
+        cls.order_data = {
+            'customer_name': 'Test Customer',
+            'customer_email': 'customer@example.com',
+            'customer_phone': '123456789',
+            'delivery_address': 'Test Address 123',
+        }
+
+    def setUp(self):
+        clear_menu_cache()
+        caches['shared'].clear()
+        token_manager.reset()
+        registry.reset()
+        self.order, _ = create_order(self.order_data, [{'menu_item': self.menu_item.id, 'quantity': 2}])
+
+    def test_server_timing_breakdown(self):
+        url = reverse('order_id', args=[self.order.order_number_uuid])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'email': 'customer@example.com'})
+        self.assertEqual(response.status_code, 200)
+        timing = server_timing(response)
+        self.assertEqual(set(timing), {'db', 'serialize', 'payu', 'total'})
+        self.assertEqual(timing['db'][1], f'{len(queries)} queries')
+        self.assertEqual(timing['payu'][0], 0)
+        self.assertGreaterEqual(timing['total'][0], timing['db'][0] + timing['serialize'][0])
+
+        response = self.client.post(reverse('order'), {
+            **self.order_data, 'items': [{'menu_item': self.menu_item.id, 'quantity': 1}],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(server_timing(response)['payu'][0], 0)
+
+    async def test_async_views_are_measured(self):
+        response = await self.async_client.get(
+            reverse('order_poll', args=[self.order.order_number_uuid]), {'email': 'customer@example.com'}
+        )
+        self.assertEqual(response.status_code, 200)
+        # Queries made through sync_to_async count towards the request
+        self.assertNotEqual(server_timing(response)['db'][1], '0 queries')
+
+    def test_unsampled_requests_are_only_counted(self):
+        with override_settings(METRICS_SAMPLE_RATE=0):
+            response = self.client.get(reverse('menu'))
+        self.assertNotIn('Server-Timing', response)
+        with override_settings(DEBUG=True):
+            metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('http_requests_total{view="menu",method="GET",status="200"} 1', metrics)
+        self.assertIn('http_request_duration_seconds_count{view="menu",method="GET"} 1', metrics)
+        self.assertIn('http_request_duration_seconds_bucket{view="menu",method="GET",le="+Inf"} 1', metrics)
+        self.assertNotIn('http_request_db_queries_count{view="menu"}', metrics)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('order_id', args=[self.order.order_number_uuid]), {'email': 'customer@example.com'})
+        with override_settings(DEBUG=True):
+            response = self.client.get(reverse('metrics'))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+            metrics = response.content.decode()
+            self.assertIn('# TYPE http_request_duration_seconds histogram', metrics)
+            self.assertIn('http_request_db_queries_count{view="order_id"} 1', metrics)
+            self.assertIn('# TYPE payu_token_events_total counter', metrics)
+            self.assertIn(f'payu_token_events_total{{event="misses"}} {token_manager.metrics()["misses"]}', metrics)
+
+            response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.5')
+            self.assertEqual(response.status_code, 404)
+
+        # In production a proxy on the same host makes every client local
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 404)
+        with override_settings(METRICS_TOKEN='scrape-secret'):
+            response = self.client.get(reverse('metrics'))
+            self.assertEqual(response.status_code, 404)
+            response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer scrape-secret'})
+            self.assertEqual(response.status_code, 200)
+
+
+class QueryCheckTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='admin123',
+        )
+        menu = [
+            MenuItem.objects.create(name=f'Pizza {n}', description='Test', price=Decimal('10.00'), category='pizza')
+            for n in range(3)
+        ]
+        for n in range(6):
+            create_order({
+                'customer_name': 'Test Customer',
+                'customer_email': 'customer@example.com',
+                'customer_phone': '123456789',
+                'delivery_address': 'Test Address 123',
+            }, [{'menu_item': item.id, 'quantity': 1} for item in menu])
+
+    def test_shape_folds_parameters_and_in_lists(self):
+        self.assertEqual(
+            shape('SELECT "id" FROM "t" WHERE "id" IN (%s, %s)\n AND "a" = %s'),
+            shape('SELECT "id" FROM "t" WHERE "id" IN (%s,%s,%s) AND "a" = %s'),
+        )
+
+    def test_repeated_queries_name_their_origin(self):
+        with self.assertRaises(QueryBudgetExceeded) as raised:
+            with query_budget(max_repeats=2):
+                [str(item) for item in OrderItem.objects.all()]
+        message = str(raised.exception)
+        self.assertIn('18 x SELECT', message)
+        self.assertIn('rest_api/models.py', message)
+        self.assertIn('in __str__', message)
+
+        with query_budget(max_queries=1, max_repeats=1):
+            [str(item) for item in OrderItem.objects.select_related('menu_item')]
+
+    def test_slow_queries(self):
+        with self.assertRaisesRegex(QueryBudgetExceeded, 'slow query'):
+            with query_budget(slow_ms=0):
+                list(Order.objects.all())
+
+    def test_staff_order_list_has_no_n_plus_one(self):
+        client = APIClient()
+        client.force_authenticate(user=self.admin_user)
+        with query_budget(max_repeats=1):
+            response = client.get(reverse('order'))
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_middleware_modes(self):
+        url = reverse('order_id', args=[Order.objects.first().order_number_uuid])
+        params = {'email': 'customer@example.com'}
+        with override_settings(QUERY_CHECK='strict', QUERY_CHECK_MAX_QUERIES=1):
+            with self.assertRaisesRegex(QueryBudgetExceeded, r'GET .* \(order_id\):\n  3 queries, budget 1'):
+                self.client.get(url, params)
+        with override_settings(QUERY_CHECK='warn', QUERY_CHECK_MAX_QUERIES=1):
+            with self.assertLogs('rest_api.querycheck', 'WARNING') as logs:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('3 queries, budget 1', logs.output[0])
+        with override_settings(QUERY_CHECK='off', QUERY_CHECK_MAX_QUERIES=1):
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+
+
+def log_record(msg, *args, level=logging.ERROR, exc_info=None, **extra):
+    return logging.getLogger('rest_api.tests').makeRecord(
+        'rest_api.tests', level, __file__, 1, msg, args, exc_info, extra=extra
+    )
+
+
+class LoggingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = StubPayU().start()
+        cls.settings_override = override_settings(**cls.stub.settings())
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.stub.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        token_manager.reset()
+        self.stub.headers.clear()
+
+    def test_request_id_reaches_response_logs_and_payu(self):
+        menu_item = MenuItem.objects.create(name='Pizza', description='Test', price=Decimal('10.00'), category='pizza')
+        with self.assertLogs('rest_api.access', 'INFO') as logs:
+            response = self.client.post(reverse('order'), {
+                'customer_name': 'Test Customer',
+                'customer_email': 'customer@example.com',
+                'customer_phone': '123456789',
+                'delivery_address': 'Test Address 123',
+                'items': [{'menu_item': menu_item.id, 'quantity': 1}],
+            }, content_type='application/json', headers={'X-Request-ID': 'checkout-42'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Request-ID'], 'checkout-42')
+        self.assertEqual([headers.get('X-Request-ID') for headers in self.stub.headers], ['checkout-42'] * 2)
+        self.assertEqual((logs.records[0].view, logs.records[0].status), ('order', 200))
+
+        # Made-up ids are not trusted
+        response = self.client.get(reverse('menu'), headers={'X-Request-ID': 'bad id\n' * 3})
+        self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{32}$')
+
+    def test_json_formatter(self):
+        try:
+            raise ValueError('broken')
+        except ValueError:
+            record = log_record('Order %s failed', 'abc', exc_info=sys.exc_info(), order='abc')
+        RequestIDFilter().filter(record)
+        entry = json.loads(JSONFormatter().format(record))
+        self.assertEqual(entry['message'], 'Order abc failed')
+        self.assertEqual((entry['level'], entry['order'], entry['request_id']), ('ERROR', 'abc', None))
+        self.assertIn('ValueError: broken', entry['exc_info'])
+
+    def test_duplicates_are_suppressed_per_window(self):
+        dedup = DuplicateFilter(window=0.05)
+        passed = [dedup.filter(log_record('PayU down')) for _ in range(5)]
+        self.assertEqual(passed, [True, False, False, False, False])
+        self.assertTrue(dedup.filter(log_record('Other error')))
+        self.assertTrue(dedup.filter(log_record('PayU down', level=logging.INFO)))
+
+        time.sleep(0.06)
+        record = log_record('PayU down')
+        self.assertTrue(dedup.filter(record))
+        self.assertEqual(record.suppressed, 4)
+
+    def test_sampling(self):
+        sampling = SamplingFilter({'menu': 0.0, 'order': 1.0})
+        self.assertFalse(sampling.filter(log_record('GET', level=logging.INFO, view='menu')))
+        self.assertTrue(sampling.filter(log_record('GET', level=logging.WARNING, view='menu')))
+        self.assertTrue(sampling.filter(log_record('GET', level=logging.INFO, view='order')))
+        self.assertTrue(sampling.filter(log_record('GET', level=logging.INFO)))
+
+    def test_queued_handler_writes_in_background(self):
+        stream = StringIO()
+        handler = QueuedStreamHandler(stream)
+        handler.setFormatter(JSONFormatter())
+        try:
+            items = ['pizza']
+            handler.handle(log_record('Items %s', items, level=logging.INFO))
+            # Formatted with the arguments as they were when logged
+            items.append('pasta')
+            handler.flush()
+        finally:
+            handler.close()
+        self.assertEqual(json.loads(stream.getvalue())['message'], "Items ['pizza']")
+
+    def test_unhandled_api_errors_are_logged(self):
+        try:
+            raise RuntimeError('kaput')
+        except RuntimeError as e:
+            with self.assertLogs('rest_api.utils', 'ERROR') as logs:
+                response = custom_exception_handler(e, {'view': MenuItems()})
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('Unhandled error in MenuItems', logs.output[0])
+        self.assertIn('RuntimeError: kaput', logs.output[0])
+
+
+class SchemaTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.schema_dir = Path(directory.name)
+        settings_override = override_settings(SCHEMA_DIR=self.schema_dir, CODE_VERSION='build-1')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for reset in (schema.code_version.cache_clear, schema.cache.clear):
+            reset()
+            self.addCleanup(reset)
+        self.url = reverse('schema-json', kwargs={'format': '.json'})
+
+    def test_serves_cacheable_schema(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('/menu/', json.loads(response.content)['paths'])
+        self.assertEqual(response['ETag'], '"schema-build-1-json"')
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=86400', response['Cache-Control'])
+
+        response = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], '"schema-build-1-json"')
+
+        response = self.client.get(reverse('schema-json', kwargs={'format': '.yaml'}))
+        self.assertEqual(response['Content-Type'], 'application/yaml')
+        self.assertIn(b'/menu/:', response.content)
+
+    def test_generated_once_per_version(self):
+        self.client.get(self.url)
+        self.assertTrue((self.schema_dir / 'build-1' / 'openapi.json').exists())
+
+        # A fresh process reads the stored file instead of introspecting
+        schema.write('build-1', {'.json': b'{"stored": true}', '.yaml': b'stored: true'})
+        schema.cache.clear()
+        self.assertEqual(json.loads(self.client.get(self.url).content), {'stored': True})
+
+        with override_settings(CODE_VERSION='build-2'):
+            schema.code_version.cache_clear()
+            response = self.client.get(self.url)
+        self.assertIn('paths', json.loads(response.content))
+        self.assertEqual(response['ETag'], '"schema-build-2-json"')
+        self.assertTrue((self.schema_dir / 'build-2' / 'openapi.json').exists())
+        # Only the current generation is kept
+        self.assertFalse((self.schema_dir / 'build-1').exists())
+
+    def test_generate_schema_command(self):
+        out = StringIO()
+        call_command('generate_schema', stdout=out)
+        self.assertIn('Wrote the schema for version build-1', out.getvalue())
+        self.assertIn('paths', json.loads((self.schema_dir / 'build-1' / 'openapi.json').read_bytes()))
+
+        out = StringIO()
+        call_command('generate_schema', stdout=out)
+        self.assertIn('up to date', out.getvalue())
+
+        call_command('generate_schema', force=True, output_dir=self.schema_dir / 'build', stdout=StringIO())
+        self.assertTrue((self.schema_dir / 'build' / 'build-1' / 'openapi.yaml').exists())
+
+    def test_code_version_follows_sources(self):
+        with override_settings(CODE_VERSION=None):
+            schema.code_version.cache_clear()
+            version = schema.code_version()
+            schema.code_version.cache_clear()
+            self.assertEqual(schema.code_version(), version)
+        self.assertEqual(len(version), 16)
+
+
+class BenchCheckoutTests(TransactionTestCase):
+    """The command writes from its own threads, so no wrapping transaction"""
+
+    def test_cleanup_removes_orders_and_events(self):
+        out = StringIO()
+        # One writer: the in-memory test database does not wait on locks
+        call_command('bench_checkout', threads=1, orders=3, items=2, stdout=out)
+        self.assertIn('orders=3 errors=0', out.getvalue())
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderEvent.objects.exists())
+        self.assertFalse(MenuItem.objects.exists())
+
+    def test_no_orders(self):
+        out = StringIO()
+        call_command('bench_checkout', threads=1, orders=0, stdout=out)
+        self.assertIn('no orders placed', out.getvalue())
+
+
+class ClientSession:
+    """benchmarks session over the test client, recording queries per endpoint"""
+
+    def __init__(self):
+        self.client = Client()
+        self.state = {}
+        self.queries = {}
+
+    def request(self, endpoint, method, path, **kwargs):
+        body = kwargs.get('json')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.generic(
+                method, path,
+                data='' if body is None else json.dumps(body),
+                content_type='application/json',
+                query_params=kwargs.get('params'),
+                headers=kwargs.get('headers'),
+            )
+        assert response.status_code < 400, (endpoint, response.status_code, response.content)
+        self.queries[endpoint] = max(self.queries.get(endpoint, 0), len(queries))
+        return response
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = StubPayU().start()
+        cls.settings_override = override_settings(**cls.stub.settings())
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.stub.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        clear_menu_cache()
+        caches['shared'].clear()
+        token_manager.reset()
+        call_command('seed_data', menu=10, users=3, orders=20, stdout=StringIO())
+
+    def test_seed_data(self):
+        self.assertEqual(MenuItem.objects.count(), 10)
+        self.assertEqual(UserObject.objects.filter(email__endswith='@seed.example.com').count(), 4)
+        self.assertTrue(UserObject.objects.get(email=STAFF_EMAIL).is_staff)
+        self.assertEqual(Order.objects.count(), 20)
+        self.assertEqual(OrderSummary.objects.count(), 20)
+        for order in Order.objects.with_items():
+            self.assertEqual(order.total_amount, sum(item.subtotal for item in order.items.all()))
+
+        call_command('seed_data', menu=0, users=0, orders=0, clear=True, stdout=StringIO())
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(UserObject.objects.exists())
+        self.assertFalse(MenuItem.objects.exists())
+
+    def test_scenarios_stay_within_query_budgets(self):
+        data = SeedData.load()
+        session = ClientSession()
+        rng = random.Random(0)
+        # Twice: cold caches first, then warm
+        for _ in range(2):
+            for scenario in SCENARIOS.values():
+                scenario(session, data, rng)
 
+        self.assertEqual(set(session.queries), set(QUERY_BUDGETS))
+        for endpoint, queries in session.queries.items():
+            self.assertLessEqual(queries, QUERY_BUDGETS[endpoint], endpoint)
 
+    def test_summarize(self):
+        stats = summarize([n / 1000 for n in range(100, 0, -1)])
+        self.assertEqual((stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['max_ms']),
+                         (50.0, 95.0, 99.0, 100.0))
+        self.assertEqual(summarize([0.25])['p99_ms'], 250.0)
@@ -0,0 +1,145 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+BLACKLIST_KEY = 'auth:blacklist:{jti}'
+BLACKLIST_GENERATION_KEY = 'auth:blacklist:generation'
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter; membership tests never return false negatives"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.count = 0
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class TokenBlacklist:
+    """
+    Constant-time blacklist lookups in front of the BlacklistedToken table.
+
+    Each process keeps a Bloom filter of blacklisted jtis, so the common
+    case (a token that was never blacklisted) is answered from memory. The
+    filter picks up new rows by primary key whenever the shared generation
+    counter moves or TOKEN_BLACKLIST_SYNC_INTERVAL passes. Possible hits are
+    confirmed against a shared-cache marker that expires with the token,
+    and only then against the database.
+
+    The filter is only as fresh as the generation counter, so it is used
+    only with TOKEN_BLACKLIST_BLOOM (a cache every worker shares);
+    otherwise every lookup goes to the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._filter = None
+            self._last_id = 0
+            self._generation = None
+            self._synced_at = 0.0
+
+    def _cache(self):
+        return caches['shared']
+
+    def _rebuild(self):
+        # Expired tokens fail signature checks anyway, leave them out
+        capacity = settings.TOKEN_BLACKLIST_BLOOM_CAPACITY
+        rows = BlacklistedToken.objects.filter(token__expires_at__gt=aware_utcnow())
+        count = rows.count()
+        while capacity < count * 2:
+            capacity *= 2
+        self._filter = BloomFilter(capacity)
+        self._last_id = 0
+        self._load(rows)
+
+    def _load(self, rows):
+        for pk, jti in rows.filter(id__gt=self._last_id).order_by('id').values_list('id', 'token__jti').iterator():
+            self._filter.add(jti)
+            self._last_id = pk
+
+    def _sync(self):
+        generation = self._cache().get(BLACKLIST_GENERATION_KEY)
+        if generation is None:
+            # Never set, or lost to an eviction or restart: start a new
+            # generation so no process keeps trusting its old filter
+            self._cache().add(BLACKLIST_GENERATION_KEY, time.time_ns(), timeout=None)
+            generation = self._cache().get(BLACKLIST_GENERATION_KEY)
+        now = time.monotonic()
+        if (self._filter is not None and generation == self._generation
+                and now - self._synced_at < settings.TOKEN_BLACKLIST_SYNC_INTERVAL):
+            return
+        with self._lock:
+            if self._filter is None or self._filter.count >= self._filter.capacity:
+                self._rebuild()
+            else:
+                self._load(BlacklistedToken.objects.all())
+            self._generation = generation
+            self._synced_at = now
+
+    def contains(self, jti):
+        if not settings.TOKEN_BLACKLIST_BLOOM:
+            return BlacklistedToken.objects.filter(token__jti=jti).exists()
+        self._sync()
+        if jti not in self._filter:
+            return False
+        if self._cache().get(BLACKLIST_KEY.format(jti=jti)):
+            return True
+        return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+    def add(self, jti, exp):
+        ttl = int(exp - time.time())
+        if ttl > 0:
+            self._cache().set(BLACKLIST_KEY.format(jti=jti), True, ttl)
+        try:
+            self._cache().incr(BLACKLIST_GENERATION_KEY)
+        except ValueError:
+            self._cache().add(BLACKLIST_GENERATION_KEY, time.time_ns(), timeout=None)
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+
+
+blacklist = TokenBlacklist()
+
+
+class CachedRefreshToken(RefreshToken):
+    """RefreshToken whose blacklist checks go through ``blacklist``"""
+
+    def check_blacklist(self):
+        if blacklist.contains(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklist.add(self.payload[api_settings.JTI_CLAIM], self.payload['exp'])
+        return result
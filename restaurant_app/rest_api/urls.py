@@ -11,6 +11,7 @@ from rest_framework_simplejwt.views import (
 
 urlpatterns = [
     path("auth/register/", views.RegisterEndpoint.as_view(), name="sign_up"),
+    path("auth/register/async/", views.async_register, name="sign_up_async"),
     path("auth/login/", TokenObtainPairView.as_view(), name="sign_in"),
     path("auth/refresh/", TokenRefreshView.as_view(), name="ref_token"),
     path("auth/logout/", TokenBlacklistView.as_view(), name="logout"),
@@ -18,7 +19,18 @@ urlpatterns = [
     path("user/", views.UserEndpoint.as_view(), name="user"),
 
     path("menu/",views.MenuItems.as_view(),name="menu"),
+    path("menu/bulk/",views.MenuBulk.as_view(),name="menu_bulk"),
     path("menu/<str:pk>",views.MenuItems.as_view(),name="menu_uid"),
     path("orders/",views.Orders.as_view(),name="order"),
-    path("orders/<str:pk>",views.Orders.as_view(),name="order_id")
+    path("orders/async/",views.async_checkout,name="order_async"),
+    path("orders/transitions/",views.OrderTransitions.as_view(),name="order_transitions"),
+    path("orders/<str:pk>/events/",views.order_stream,name="order_stream"),
+    path("orders/<str:pk>/events/poll/",views.order_poll,name="order_poll"),
+    path("orders/<str:pk>",views.Orders.as_view(),name="order_id"),
+
+    path("kitchen/stream/",views.kitchen_stream,name="kitchen_stream"),
+
+    path("payments/payu/notify/",views.PayuNotification.as_view(),name="payu_notify"),
+
+    path("internal/metrics/",views.metrics,name="metrics"),
 ]
\ No newline at end of file
@@ -1,59 +1,76 @@
 from rest_framework.response import Response
 from rest_framework.views import exception_handler
-from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import cached_property
+from django.utils.http import http_date
 from base64 import b64encode
-import requests
-import traceback
+import json
+import logging
 
-RED = "\033[31m"
-RESET = "\033[0m"
+logger = logging.getLogger(__name__)
 
 
 def custom_exception_handler(exc, context):
-    if settings.DEBUG == True:
-        print(f"{RED}####### WARNING! CRITICAL ERROR! ######{RESET}\n")
-        print(f"{RED}Context:{RESET} {context}\n{RED}Error:{RESET} {exc}\n")
-        print(f"{RED}Traceback (most recent call last):{RESET}")
-        print(traceback.format_exc())
-        print(f"{RED}#######################################{RESET}\n")
-
     response = exception_handler(exc, context)
+    view = type(context.get('view')).__name__
     if response is None:
+        logger.error('Unhandled error in %s', view, exc_info=(type(exc), exc, exc.__traceback__),
+                     extra={'view_class': view})
         return Response({"error": "An unexpected error occurred"}, status=500)
+    logger.debug('%s in %s: %s', type(exc).__name__, view, exc,
+                 extra={'view_class': view, 'status': response.status_code})
+    return response
+
+
+
+class PrerenderedJSONResponse(HttpResponse):
+    """
+    Response for JSON that was rendered ahead of time (e.g. from a cache).
+    ``data`` is decoded lazily so it mirrors DRF's Response for callers
+    that inspect it, without paying for it on the hot path.
+    """
+
+    def __init__(self, content=b'', **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content, **kwargs)
+
+    @cached_property
+    def data(self):
+        return json.loads(self.content)
+
+
+def menu_etag(version):
+    return f'"menu-{version}"'
+
+
+def order_etag(order_number_uuid, updated_at):
+    return f'"order-{order_number_uuid}-{int(updated_at.timestamp() * 1000000)}"'
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    Returns a 304 response when the client's validators still match,
+    otherwise None. ``last_modified`` is a datetime.
+    """
+    if last_modified is not None:
+        last_modified = int(last_modified.timestamp())
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, etag, last_modified=None):
+    """Attach validators so clients revalidate instead of refetching"""
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, no_cache=True)
     return response
 
 
+class EventStreamResponse(StreamingHttpResponse):
+    """Server-Sent Events response that proxies must not buffer or cache"""
 
-def get_oauth_token():        
-        headers = {
-            'Content-Type': 'application/x-www-form-urlencoded'
-        }
-        
-        response = requests.post(
-            settings.PAYU_OAUTH_URL,
-            headers=headers,
-            data={
-                'grant_type': 'client_credentials',
-                'client_id':settings.PAYU_CLIENT_ID, 
-                'client_secret': settings.PAYU_CLIENT_SECRET }
-        )
-        if response.status_code != 200:
-            raise Exception('Failed to obtain PayU OAuth token')
-            
-        return response.json()['access_token']
-
-
-def get_payu_order_status(payu_order_id, access_token):
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json'
-    }
-    
-    response = requests.get(
-        f"{settings.PAYU_API_URL}/orders/{payu_order_id}",
-        headers=headers
-    )
-    
-    if response.status_code == 200:
-        return response.json()
-    return None
+    def __init__(self, frames, **kwargs):
+        super().__init__(frames, content_type='text/event-stream', **kwargs)
+        self['Cache-Control'] = 'no-cache'
+        self['X-Accel-Buffering'] = 'no'
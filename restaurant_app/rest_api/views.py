@@ -1,20 +1,58 @@
 from django.shortcuts import render
 from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from django.utils.cache import patch_cache_control
+from django.db import IntegrityError
+from asgiref.sync import sync_to_async
 import hashlib
 import json
+import logging
+import uuid
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
 from django.shortcuts import get_object_or_404, get_list_or_404
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 import requests
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from .models import Order
+from .models import Order, OrderSummary
 from .serializers import *
 from .permissions import IsAdminOrReadOnly
-from .utils import get_oauth_token, get_payu_order_status
+from .utils import (
+    PrerenderedJSONResponse,
+    menu_etag,
+    order_etag,
+    not_modified,
+    set_validators,
+    EventStreamResponse,
+)
+from .cache import get_menu_payload, get_menu_version, get_order_payment, cache_order_payment, get_user_data
+from .filters import filter_orders
+from .pagination import KeysetPagination
+from .services import (
+    parse_order_items,
+    create_order,
+    payu_order_payload,
+    apply_payu_registration,
+    apply_payu_status,
+    update_order,
+    transition_orders,
+    apply_menu_batch,
+)
+from .payu import get_oauth_token, get_payu_order_status, verify_notification_signature, PayUUnavailable
+from .hashers import make_password_async
+from .authentication import StreamJWTAuthentication
+from .events import broadcaster
+from .metrics import registry, scrape_allowed
+from . import schema
+from . import payu
+
+logger = logging.getLogger(__name__)
 
 
 
@@ -27,7 +65,6 @@ class MenuItems(APIView):
     
     @swagger_auto_schema(
         operation_description="Get list of menu items",
-        request_body=MenuItemSerializer,
         responses={200: MenuItemSerializer(many=True)}
     )
     def get(self, request, pk=None):
@@ -35,11 +72,20 @@ class MenuItems(APIView):
         if pk:        
             item = get_object_or_404(MenuItem,pk=pk)
             serializer = MenuItemSerializer(item)
-        else:                    
-            items = get_list_or_404(MenuItem)
-            serializer = MenuItemSerializer(items, many=True)
+            return Response(serializer.data, status=status.HTTP_200_OK)
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Full menu is served pre-rendered from the versioned menu cache
+        etag = menu_etag(get_menu_version())
+        cached = not_modified(request, etag)
+        if cached:
+            # A 304 carries the validators and caching rules of the 200
+            return set_validators(cached, etag)
+
+        version, payload = get_menu_payload()
+        if not payload:
+            raise Http404('No MenuItem matches the given query.')
+        response = PrerenderedJSONResponse(payload, status=status.HTTP_200_OK)
+        return set_validators(response, menu_etag(version))
         
 
     @swagger_auto_schema(
@@ -84,6 +130,25 @@ class MenuItems(APIView):
 
 
 
+class MenuBulk(APIView):
+    """
+    Batch menu changes for POS synchronisation (staff only): create,
+    update, upsert (by name) and delete in one validated transaction,
+    invalidating the cached menu once.
+    """
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        request_body=MenuBatchSerializer,
+        responses={200: 'Counts of created, updated and deleted items', 400: 'Bad Request'}
+    )
+    def post(self, request):
+        serializer = MenuBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = apply_menu_batch(serializer.validated_data)
+        return Response(result, status=status.HTTP_200_OK)
+
+
 class Orders(APIView):
     """
     API endpoint for managing orders
@@ -105,6 +170,55 @@ class Orders(APIView):
                 description="Check payment status",
                 type=openapi.TYPE_BOOLEAN,
                 required=False
+            ),
+            openapi.Parameter(
+                'cursor',
+                openapi.IN_QUERY,
+                description="Staff list: cursor from the previous page's 'next' link",
+                type=openapi.TYPE_STRING,
+                required=False
+            ),
+            openapi.Parameter(
+                'page_size',
+                openapi.IN_QUERY,
+                description="Staff list: orders per page (max 200)",
+                type=openapi.TYPE_INTEGER,
+                required=False
+            ),
+            openapi.Parameter(
+                'status',
+                openapi.IN_QUERY,
+                description="Staff list: filter by order status",
+                type=openapi.TYPE_STRING,
+                required=False
+            ),
+            openapi.Parameter(
+                'payment_status',
+                openapi.IN_QUERY,
+                description="Staff list: filter by payment status",
+                type=openapi.TYPE_STRING,
+                required=False
+            ),
+            openapi.Parameter(
+                'customer_email',
+                openapi.IN_QUERY,
+                description="Staff list: filter by customer email",
+                type=openapi.TYPE_STRING,
+                required=False
+            ),
+            openapi.Parameter(
+                'created_after',
+                openapi.IN_QUERY,
+                description="Staff list: ISO date/datetime lower bound",
+                type=openapi.TYPE_STRING,
+                required=False
+            ),
+            openapi.Parameter(
+                'created_before',
+                openapi.IN_QUERY,
+                description="Staff list: ISO date/datetime upper bound",
+                type=openapi.TYPE_STRING,
+                required=False
             )
         ],
         responses={
@@ -118,6 +232,16 @@ class Orders(APIView):
         
         if check_payment and pk:
             email = request.query_params.get('email')
+
+            # Pushed by PayuNotification / the reconciler, no DB or PayU call
+            cached = get_order_payment(pk)
+            if cached and cached['email'] == email:
+                return Response({
+                    'status': cached['status'],
+                    'payuStatus': cached['payuStatus'],
+                    # Same form as the database branch, whatever case pk came in
+                    'orderNumber': str(uuid.UUID(pk))
+                }, status=status.HTTP_200_OK)
             
             order = get_object_or_404(Order, order_number_uuid=pk, customer_email=email)
                 
@@ -126,8 +250,14 @@ class Orders(APIView):
                         {'error': 'No payment information for this order'}, 
                         status=status.HTTP_400_BAD_REQUEST
                     )
+
+            # With notifications enabled PayU tells us about every change,
+            # so an unset status simply means the payment is still pending
+            if order.payment_status is None and settings.PAYU_NOTIFY_URL:
+                    order.payment_status = 'pending'
                 
             if order.payment_status != None:
+                    cache_order_payment(order)
                     return Response({
                         'status': order.status,
                         'payuStatus': order.payment_status,
@@ -138,19 +268,8 @@ class Orders(APIView):
             payu_status = get_payu_order_status(order.payu_order_id, access_token)
                 
             if payu_status:
-                status_mapping = {
-                        'COMPLETED': 'confirmed',
-                        'PENDING': 'pending',
-                        'CANCELED': 'canceled',
-                        'REJECTED': 'canceled'
-                    }
-                    
                 payu_order_status = payu_status.get('orders', [{}])[0].get('status')
-                new_status = status_mapping.get(payu_order_status)
-                    
-                if new_status != order.payment_status:
-                        order.payment_status = new_status
-                        order.save()
+                apply_payu_status(order, payu_order_status)
                     
                 return Response({
                         'status': order.status,
@@ -169,9 +288,7 @@ class Orders(APIView):
             email = request.query_params.get('email')
             if pk and email:
                 try:
-                    order = get_object_or_404(Order, order_number_uuid=pk, customer_email=email)
-                    serializer = FullOrderSerializer(order)
-                    return Response(serializer.data, status=status.HTTP_200_OK)
+                    return self.order_detail(request, order_number_uuid=pk, customer_email=email)
                 except Order.DoesNotExist:
                     return Response(
                         {'error': 'Order not found with provided email'}, 
@@ -185,26 +302,46 @@ class Orders(APIView):
         # Case 2: Authenticated admin user
         if request.user.is_staff:
             if pk:
-                order = get_object_or_404(Order, order_number_uuid=pk)
-                serializer = FullOrderSerializer(order)
+                return self.order_detail(request, order_number_uuid=pk)
             else:
-                orders = Order.objects.all()
-                serializer = FullOrderSerializer(orders, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+                paginator = KeysetPagination()
+                orders = filter_orders(Order.objects.with_items(), request.query_params)
+                page = paginator.paginate_queryset(orders, request, view=self)
+                serializer = FullOrderSerializer(page, many=True)
+                return paginator.get_paginated_response(serializer.data)
 
         # Case 3: Authenticated regular user
         if pk:
-            order = get_object_or_404(
-                Order, 
+            return self.order_detail(
+                request,
                 order_number_uuid=pk, 
                 customer_email=request.user.email
             )
-            serializer = FullOrderSerializer(order)
-            return Response(serializer.data, status=status.HTTP_200_OK)
         else:
-            orders = Order.objects.filter(customer_email=request.user.email)
-            serializer = FullOrderSerializer(orders, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            # Lists come from the summary projection, items only on drill-down
+            paginator = KeysetPagination()
+            summaries = OrderSummary.objects.filter(customer_email=request.user.email)
+            page = paginator.paginate_queryset(summaries, request, view=self)
+            serializer = OrderSummarySerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+
+    def order_detail(self, request, **lookup):
+        """
+        Single order response. The ETag comes from updated_at alone, so a
+        matching If-None-Match returns 304 without loading the order.
+        """
+        version = Order.objects.filter(**lookup).values_list('order_number_uuid', 'updated_at').first()
+        if version is None:
+            raise Http404('No Order matches the given query.')
+
+        cached = not_modified(request, order_etag(*version), version[1])
+        if cached:
+            return set_validators(cached, order_etag(*version), version[1])
+
+        order = get_object_or_404(Order.objects.with_items(), **lookup)
+        serializer = FullOrderSerializer(order)
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+        return set_validators(response, order_etag(order.order_number_uuid, order.updated_at), order.updated_at)
 
 
     def put(self, request, pk=None):
@@ -224,23 +361,25 @@ class Orders(APIView):
             order = get_object_or_404(Order, pk=pk)
             serializer = OrderSerializer(order, data=request.data, partial=True)
             
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        else:
+        if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+        # Optimistic concurrency: pass back the version the client edited
+        expected_version = request.data.get('version')
+        try:
+            expected_version = int(expected_version) if expected_version is not None else None
+        except (TypeError, ValueError):
+            return Response({'version': ['A valid integer is required.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        order = update_order(order, serializer.validated_data, expected_version)
+        return Response(type(serializer)(order).data, status=status.HTTP_200_OK)
+
     def post(self, request, pk=None):
         order_data = request.data.copy()
         items_buffor = order_data.pop('items', [])
 
         try:
-            if isinstance(items_buffor[0], str):
-                items_buffor = items_buffor[0].replace('\t', '').replace('\n', '')
-                order_items = json.loads(items_buffor)
-                
-            else:
-                order_items = items_buffor
+            order_items = parse_order_items(items_buffor)
         except json.JSONDecodeError:
             return Response(
                 {'error': 'Invalid items format'}, 
@@ -253,103 +392,33 @@ class Orders(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        order_serializer = OrderSerializer(data=order_data)
-        if order_serializer.is_valid():
-            order = order_serializer.save()
-            
-            for item_data in order_items:
-                order_item = {
-                    'order': order.id,
-                    'menu_item': item_data.get('menu_item'),  
-                    'quantity': item_data.get('quantity', 1)  
-                }
-                item_serializer = OrderItemSerializer(data=order_item)
-                if item_serializer.is_valid():
-                    item_serializer.save()
-                else:
-                    order.delete()
-                    return Response(item_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-            
-            
-            order.calculate_total()
-
-            
-            
-            try:
-                access_token = get_oauth_token()
-
-                payu_data = {
-                    "extOrderId": str(order.order_number_uuid),
-                    "merchantPosId": settings.PAYU_POS_ID,
-                    "description": f"Order {order.order_number_uuid}",
-                    "currencyCode": request.data.get('currency', 'PLN'),
-                    "totalAmount": str(int(float(order.total_amount) * 100)),
-                    "buyer": {
-                        "email": order.customer_email,
-                        "phone": order.customer_phone,
-                        "firstName": order.customer_name,
-                        "language": "pl"
-                    },
-                    "products": [
-                        {
-                            "name": item.menu_item.name,
-                            "unitPrice": str(int(float(item.menu_item.price) * 100)),
-                            "quantity": item.quantity
-                        } for item in order.items.all()
-                    ],
-               
-                    "continueUrl": f"{settings.FRONT_BASE_URL}/payment-redirect/{order.order_number_uuid}?email={order.customer_email}",
-                    "customerIp": request.META.get('REMOTE_ADDR'),
-                }
-
-                headers = {
-                    'Authorization': f'Bearer {access_token}',
-                    'Content-Type': 'application/json',
-                }
-
-                response = requests.post(
-                    settings.PAYU_ORDER_URL,
-                    json=payu_data,
-                    headers=headers,
-                    allow_redirects=False 
-                )
-
-                response_data = response.json()
-            
-                if response_data.get('status', {}).get('statusCode') == 'SUCCESS':
-                    redirect_uri = response_data.get('redirectUri')
-                    order_id = response_data.get('orderId')
-
-                    if not redirect_uri:
-                        return Response(
-                            {'error': 'No redirect URL in PayU response'},
-                            status=status.HTTP_502_BAD_GATEWAY
-                        )
-
-                    
-                    order.payu_order_id = order_id
-                    order.save()
+        try:
+            order, items = create_order(order_data, order_items)
+        except ValidationError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
 
-                    return Response({
-                        'redirectUri': redirect_uri,
-                        'orderId': order_id,
-                        'status': 'success'
-                    }, status=status.HTTP_200_OK)
-            
-                else:
-                    error_message = response_data.get('status', {}).get('statusDesc', 'Unknown error')
-                    return Response(
-                        {'error': f'PayU error: {error_message}'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
+        try:
+            access_token = get_oauth_token()
+            payu_data = payu_order_payload(
+                order, items,
+                currency=request.data.get('currency', 'PLN'),
+                customer_ip=request.META.get('REMOTE_ADDR'),
+            )
+            response_data = payu.client.create_order(payu_data, access_token)
+            body, status_code = apply_payu_registration(order, response_data)
+            return Response(body, status=status_code)
 
-            except Exception as e:
-                return Response(
-                    {'error': str(e)},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+        except PayUUnavailable as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
 
-        return Response(order_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
 
 
@@ -372,13 +441,109 @@ class Orders(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
     
 
+class OrderTransitions(APIView):
+    """
+    Move many orders to one status at once (staff only), e.g. a whole
+    batch to out_for_delivery. Orders whose current status does not allow
+    the move are reported back untouched.
+    """
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        request_body=OrderTransitionSerializer,
+        responses={200: 'Moved and skipped orders', 400: 'Bad Request'}
+    )
+    def post(self, request):
+        serializer = OrderTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        updated, skipped = transition_orders(
+            serializer.validated_data['orders'], serializer.validated_data['status']
+        )
+        return Response({'updated': updated, 'skipped': skipped}, status=status.HTTP_200_OK)
+
+
+@csrf_exempt
+@require_POST
+async def async_checkout(request):
+    """
+    Same contract as Orders.post, for ASGI deployments. The database work
+    runs in Django's sync thread, while the PayU round-trip is awaited on
+    the event loop, so slow gateway calls don't pin a worker each.
+    """
+    try:
+        if request.content_type == 'application/json':
+            order_data = json.loads(request.body or b'{}')
+        else:
+            order_data = request.POST.dict()
+            order_data['items'] = request.POST.getlist('items')
+        order_items = parse_order_items(order_data.pop('items', []))
+    except (json.JSONDecodeError, AttributeError):
+        return JsonResponse({'error': 'Invalid items format'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not order_items:
+        return JsonResponse({'error': 'Invalid items format'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        order, items = await sync_to_async(create_order)(order_data, order_items)
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=status.HTTP_400_BAD_REQUEST, safe=False)
+
+    try:
+        access_token = await sync_to_async(get_oauth_token, thread_sensitive=False)()
+        payu_data = payu_order_payload(
+            order, items,
+            currency=order_data.get('currency', 'PLN'),
+            customer_ip=request.META.get('REMOTE_ADDR'),
+        )
+        response_data = await payu.async_client.create_order(payu_data, access_token)
+        body, status_code = await sync_to_async(apply_payu_registration)(order, response_data)
+        return JsonResponse(body, status=status_code)
+
+    except PayUUnavailable as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class PayuNotification(APIView):
+    """
+    PayU pushes order status changes here (notifyUrl). The body is signed
+    with the second key; the order is updated idempotently and the new
+    payment state is published to the cache check_payment reads from.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(auto_schema=None)
+    def post(self, request):
+        body = request.body
+        if not verify_notification_signature(body, request.headers.get('OpenPayu-Signature', '')):
+            return Response({'error': 'Invalid signature'}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            payu_order = json.loads(body)['order']
+            ext_order_id = payu_order['extOrderId']
+            payu_order_status = payu_order['status']
+        except (ValueError, KeyError, TypeError):
+            return Response({'error': 'Invalid notification'}, status=status.HTTP_400_BAD_REQUEST)
+
+        order = Order.objects.filter(order_number_uuid=ext_order_id).first()
+        if order is None or order.payu_order_id != payu_order.get('orderId'):
+            return Response({'error': 'Unknown order'}, status=status.HTTP_404_NOT_FOUND)
+
+        apply_payu_status(order, payu_order_status)
+        return Response(status=status.HTTP_200_OK)
+
+
 class UserEndpoint(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        user_ = get_object_or_404(UserObject, id=request.user.id)
-        serializer = UserSerializer(user_)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        data = get_user_data(request.user.id)
+        if data is None:
+            raise Http404
+        return Response(data, status=status.HTTP_200_OK)
 
     def delete(self, request):
         user_ = get_object_or_404(UserObject, id=request.user.id)
@@ -387,7 +552,7 @@ class UserEndpoint(APIView):
         return Response({"message": "User deactivated"}, status=status.HTTP_200_OK)
 
     def put(self, request):
-        print(request)
+        logger.debug('Profile update by user %s', request.user.id, extra={'fields': sorted(request.data)})
         user_instance = get_object_or_404(UserObject, id=request.user.id)
         serializer = UserSerializer(user_instance, data=request.data, partial=True)
         if serializer.is_valid():
@@ -409,3 +574,168 @@ class RegisterEndpoint(APIView):
             )
         else:
             return Response(serializer_.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@csrf_exempt
+@require_POST
+async def async_register(request):
+    """
+    Same contract as RegisterEndpoint.post, for ASGI deployments. The
+    password is hashed on the bounded hash pool instead of the request
+    thread, so registration spikes queue up rather than starve other requests.
+    """
+    try:
+        if request.content_type == 'application/json':
+            data = json.loads(request.body or b'{}')
+        else:
+            data = request.POST.dict()
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer_ = UserSerializer(data=data)
+    if not await sync_to_async(serializer_.is_valid)():
+        return JsonResponse(serializer_.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    validated_data = dict(serializer_.validated_data)
+    password = validated_data.pop('password', None)
+    user_ = UserObject(**validated_data)
+    if password is not None:
+        user_.password = await make_password_async(password)
+
+    try:
+        await user_.asave()
+    except IntegrityError:
+        return JsonResponse(
+            {'email': ['user with this email address already exists.']},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return JsonResponse({"OK": "User created sucesfully"}, status=status.HTTP_201_CREATED)
+
+
+def stream_cursor(request):
+    """Resume cursor from the Last-Event-ID header or ?cursor=; None starts fresh"""
+    cursor = request.headers.get('Last-Event-ID') or request.GET.get('cursor')
+    if not cursor:
+        return None
+    try:
+        return int(cursor)
+    except ValueError:
+        raise ValidationError({'cursor': ['Invalid cursor']})
+
+
+@require_GET
+async def kitchen_stream(request):
+    """
+    Server-Sent Events feed of created, changed and deleted orders for
+    kitchen displays (staff only). A fresh connection starts with a
+    snapshot of the active orders; reconnects resume from Last-Event-ID.
+    """
+    try:
+        authenticated = await sync_to_async(StreamJWTAuthentication().authenticate)(request)
+        cursor = stream_cursor(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({'detail': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+    if authenticated is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'},
+                            status=status.HTTP_401_UNAUTHORIZED)
+    if not authenticated[0].is_staff:
+        return JsonResponse({'error': 'Only staff can watch the kitchen queue'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+    return EventStreamResponse(broadcaster.frames(cursor))
+
+
+def order_watch_denied(request, pk):
+    """
+    Error response if the caller may not watch order ``pk``: customers
+    authorize with the order's email, staff with their token.
+    """
+    email = request.GET.get('email')
+    if email:
+        # The payment cache already knows the owner of recently paid orders
+        cached = get_order_payment(pk)
+        if cached and cached['email'] == email:
+            return None
+        if Order.objects.filter(order_number_uuid=pk, customer_email=email).exists():
+            return None
+        return JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        authenticated = StreamJWTAuthentication().authenticate(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({'detail': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    if authenticated is None or not authenticated[0].is_staff:
+        return JsonResponse({'error': 'Email is required'}, status=status.HTTP_400_BAD_REQUEST)
+    return None
+
+
+async def watched_order(request, pk):
+    """(order uuid, cursor, None) for an allowed watch request, else (None, None, error response)"""
+    try:
+        pk = str(uuid.UUID(pk))
+        cursor = stream_cursor(request)
+    except ValueError:
+        return None, None, JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+    except ValidationError as e:
+        return None, None, JsonResponse(e.detail, status=status.HTTP_400_BAD_REQUEST)
+    denied = await sync_to_async(order_watch_denied)(request, pk)
+    return pk, cursor, denied
+
+
+@require_GET
+async def order_stream(request, pk):
+    """
+    Server-Sent Events feed of one order's status changes, authorized by
+    ?email= like the order lookup. Starts with the current state; thousands
+    of idle subscribers cost one queue each on the shared poller.
+    """
+    pk, cursor, denied = await watched_order(request, pk)
+    if denied is not None:
+        return denied
+    return EventStreamResponse(broadcaster.frames(cursor, pk))
+
+
+@require_GET
+async def order_poll(request, pk):
+    """
+    Long-poll fallback for order_stream: answers as soon as the order has
+    events after ?cursor= (immediately with the current state without
+    one), or empty after ?timeout= seconds.
+    """
+    pk, cursor, denied = await watched_order(request, pk)
+    if denied is not None:
+        return denied
+    try:
+        timeout = min(float(request.GET.get('timeout', settings.ORDER_EVENTS_LONG_POLL_TIMEOUT)),
+                      settings.ORDER_EVENTS_LONG_POLL_TIMEOUT)
+    except ValueError:
+        timeout = settings.ORDER_EVENTS_LONG_POLL_TIMEOUT
+
+    events, next_cursor = await broadcaster.poll(cursor, pk, max(timeout, 0))
+    body = b'{"cursor":%d,"events":[%s]}' % (next_cursor, b','.join(event.data for event in events))
+    return HttpResponse(body, content_type='application/json', headers={'Cache-Control': 'no-store'})
+
+
+@require_GET
+def metrics(request):
+    """Prometheus scrape endpoint for this process's request metrics"""
+    if not scrape_allowed(request):
+        raise Http404()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_GET
+def openapi_schema(request, format):
+    """
+    The OpenAPI schema, pre-rendered once per code version. Clients and
+    gateways may cache it for SCHEMA_CACHE_MAX_AGE and revalidate by ETag.
+    """
+    version, document = schema.cache.get(format)
+    etag = f'"schema-{version}-{format[1:]}"'
+    response = not_modified(request, etag) or HttpResponse(document, content_type=schema.FORMATS[format][1])
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.SCHEMA_CACHE_MAX_AGE)
+    return response
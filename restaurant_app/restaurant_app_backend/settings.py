@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -81,6 +83,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'rest_api.logs.RequestLogMiddleware',
+    'rest_api.metrics.TimingMiddleware',
+    'rest_api.querycheck.QueryCheckMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -122,12 +127,153 @@ WSGI_APPLICATION = "restaurant_app_backend.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+#
+# DB_ENGINE=sqlite (default) is meant for single-node deployments. With
+# SQLITE_WAL=1 readers no longer block on writers, commits skip a full
+# fsync, and waiting writers retry for SQLITE_BUSY_TIMEOUT seconds instead
+# of failing with "database is locked".
+#
+# DB_ENGINE=postgres needs psycopg 3. DB_POOL=1 turns on Django's psycopg
+# connection pool (psycopg[pool]); otherwise connections are kept for
+# DB_CONN_MAX_AGE seconds. Both check connection health before reuse.
+
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgres":
+    DB_POOL = os.environ.get("DB_POOL", "1") == "1"
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("DB_NAME", "restaurant"),
+            "USER": os.environ.get("DB_USER", "restaurant"),
+            "PASSWORD": os.environ.get("DB_PASSWORD", ""),
+            "HOST": os.environ.get("DB_HOST", "127.0.0.1"),
+            "PORT": os.environ.get("DB_PORT", "5432"),
+            "CONN_MAX_AGE": 0 if DB_POOL else int(os.environ.get("DB_CONN_MAX_AGE", 60)),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                "pool": {
+                    "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+                    "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 20)),
+                    "timeout": 10,
+                },
+            } if DB_POOL else {},
+        }
+    }
+else:
+    SQLITE_OPTIONS = {}
+    if os.environ.get("SQLITE_WAL", "1") == "1":
+        SQLITE_OPTIONS = {
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                "PRAGMA mmap_size=134217728;"
+                "PRAGMA temp_store=MEMORY;"
+            ),
+            "timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT", 20)),
+            # Take the write lock at BEGIN so concurrent writers queue on
+            # busy_timeout instead of deadlocking on lock upgrade
+            "transaction_mode": "IMMEDIATE",
+        }
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get("DB_NAME", BASE_DIR / "db.sqlite3"),
+            "OPTIONS": SQLITE_OPTIONS,
+        }
     }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# "menu" holds the pre-rendered menu, "shared" holds state that every
+# worker must agree on (PayU token, locks). Use "locmem" for a single
+# process, "file" or "redis" when several workers run side by side.
+
+MENU_CACHE_BACKEND = os.environ.get("MENU_CACHE_BACKEND", "locmem")
+SHARED_CACHE_BACKEND = os.environ.get("SHARED_CACHE_BACKEND", "locmem")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/1")
+
+
+def cache_backend(name, kind, max_entries=300):
+    if kind == "file":
+        return {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": BASE_DIR / ".cache" / name,
+        }
+    if kind == "redis":
+        return {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": name,
+        }
+    return {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": name,
+        "OPTIONS": {"MAX_ENTRIES": max_entries},
+    }
+
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "default",
+    },
+    "menu": cache_backend("menu", MENU_CACHE_BACKEND, max_entries=64),
+    "shared": cache_backend("shared", SHARED_CACHE_BACKEND, max_entries=10000),
+}
+
+MENU_CACHE_TIMEOUT = 60 * 60 * 24
+MENU_LOCAL_CACHE_SIZE = 8
+# Largest accepted menu/bulk/ request
+MENU_BATCH_MAX_ITEMS = 1000
+ORDER_PAYMENT_CACHE_TIMEOUT = 60 * 60
+USER_CACHE_TIMEOUT = 60
+# How long a worker trusts its cached copy of a user's token revocation
+# moment (the column is authoritative). With a per-process "shared" cache
+# this bounds how late other workers see a logout-everywhere.
+TOKEN_REVOCATION_CACHE_TIMEOUT = 60
+
+
+# Order event streams (kitchen/stream/, orders/<uuid>/events/). Each process polls the OrderEvent
+# table once per interval for all connected clients; streams end after
+# ORDER_EVENTS_STREAM_TIMEOUT and the client reconnects with Last-Event-ID.
+ORDER_EVENTS_POLL_INTERVAL = float(os.environ.get("ORDER_EVENTS_POLL_INTERVAL", 1.0))
+ORDER_EVENTS_BATCH = 200
+ORDER_EVENTS_SNAPSHOT_SIZE = 500
+ORDER_EVENTS_QUEUE_SIZE = 1000
+ORDER_EVENTS_HEARTBEAT = 15
+ORDER_EVENTS_STREAM_TIMEOUT = 5 * 60
+ORDER_EVENTS_RETRY_MS = 3000
+ORDER_EVENTS_GAP_TIMEOUT = 10
+# Longest wait of orders/<uuid>/events/poll/
+ORDER_EVENTS_LONG_POLL_TIMEOUT = 25
+
+
+# Password hashing. PASSWORD_HASHER picks the hasher for new hashes:
+# scrypt (default), argon2 (pip install argon2-cffi) or pbkdf2. The others
+# stay listed so existing hashes verify and are upgraded on the next login.
+PASSWORD_HASHER = os.environ.get("PASSWORD_HASHER", "scrypt")
+_PASSWORD_HASHERS = {
+    "scrypt": "rest_api.hashers.TunedScryptPasswordHasher",
+    "argon2": "rest_api.hashers.TunedArgon2PasswordHasher",
+    "pbkdf2": "django.contrib.auth.hashers.PBKDF2PasswordHasher",
 }
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    hasher for name, hasher in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+]
+
+# scrypt: 2**15 * 8 * 128 bytes = 32 MiB per hash
+PASSWORD_SCRYPT_N = int(os.environ.get("PASSWORD_SCRYPT_N", 2**15))
+PASSWORD_SCRYPT_R = int(os.environ.get("PASSWORD_SCRYPT_R", 8))
+PASSWORD_SCRYPT_P = int(os.environ.get("PASSWORD_SCRYPT_P", 1))
+# argon2id: memory cost in KiB
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get("PASSWORD_ARGON2_TIME_COST", 2))
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get("PASSWORD_ARGON2_MEMORY_COST", 19 * 1024))
+PASSWORD_ARGON2_PARALLELISM = int(os.environ.get("PASSWORD_ARGON2_PARALLELISM", 1))
+# Threads async views hash passwords on
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 2))
 
 
 # Password validation
@@ -173,12 +319,93 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "rest_api.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.AllowAny",
     ],
     "EXCEPTION_HANDLER": "rest_api.utils.custom_exception_handler",
+    "DEFAULT_RENDERER_CLASSES": [
+        "rest_api.metrics.TimedJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
+
+# Request instrumentation (rest_api.metrics)
+#
+# Every request is counted and timed. METRICS_SAMPLE_RATE of them are also
+# broken down into db/serialize/payu time and, with METRICS_SERVER_TIMING,
+# get a Server-Timing header. /api/v1/internal/metrics/ serves the
+# per-process totals to Prometheus: with a METRICS_TOKEN set it needs that
+# bearer token, otherwise it is disabled unless DEBUG, and then only
+# answers METRICS_ALLOWED_IPS.
+
+METRICS_SAMPLE_RATE = float(os.environ.get("METRICS_SAMPLE_RATE", 0.1))
+METRICS_SERVER_TIMING = os.environ.get("METRICS_SERVER_TIMING", "1") == "1"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+METRICS_ALLOWED_IPS = ["127.0.0.1", "::1"]
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# Repeated (N+1) and slow query detection (rest_api.querycheck)
+#
+# QUERY_CHECK is "off", "warn" (log each finding) or "strict" (raise, for
+# CI: QUERY_CHECK=strict python manage.py test). A request breaks the budget
+# with more than QUERY_CHECK_MAX_QUERIES queries, the same query shape run
+# more than QUERY_CHECK_MAX_REPEATS times, or a query over QUERY_CHECK_SLOW_MS.
+
+QUERY_CHECK = os.environ.get("QUERY_CHECK", "off")
+QUERY_CHECK_MAX_QUERIES = int(os.environ.get("QUERY_CHECK_MAX_QUERIES", 30))
+QUERY_CHECK_MAX_REPEATS = int(os.environ.get("QUERY_CHECK_MAX_REPEATS", 5))
+QUERY_CHECK_SLOW_MS = float(os.environ.get("QUERY_CHECK_SLOW_MS", 100))
+
+
+# Logging (rest_api.logs)
+#
+# One JSON object per line on stderr (LOG_FORMAT=text for a readable dev
+# format), written by a background thread so request threads never block
+# on the stream. Records carry the request's X-Request-ID, which is also
+# sent to PayU. Identical warnings/errors are let through once per
+# LOG_DEDUP_WINDOW seconds, and only LOG_SAMPLE_RATES of the access lines
+# of busy views are kept. Test runs stay quiet unless LOG_LEVEL is set.
+
+TESTING = sys.argv[1:2] == ["test"]
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "CRITICAL" if TESTING else "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_DEDUP_WINDOW = float(os.environ.get("LOG_DEDUP_WINDOW", 60))
+LOG_SAMPLE_RATES = {
+    "menu": 0.01,
+    "menu_uid": 0.01,
+    "order_poll": 0.05,
+    "metrics": 0.0,
+}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "rest_api.logs.JSONFormatter"},
+        "text": {"format": "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"},
+    },
+    "filters": {
+        "request_id": {"()": "rest_api.logs.RequestIDFilter"},
+        "sampling": {"()": "rest_api.logs.SamplingFilter", "rates": LOG_SAMPLE_RATES},
+        "dedup": {"()": "rest_api.logs.DuplicateFilter", "window": LOG_DEDUP_WINDOW},
+    },
+    "handlers": {
+        "queue": {
+            "()": "rest_api.logs.QueuedStreamHandler",
+            "formatter": LOG_FORMAT,
+            "filters": ["request_id", "sampling", "dedup"],
+        },
+    },
+    "root": {"handlers": ["queue"], "level": LOG_LEVEL},
+    "loggers": {
+        # Handled by the root logger instead of Django's console/mail_admins
+        "django": {"handlers": [], "level": LOG_LEVEL},
+        "django.server": {"handlers": ["queue"], "level": LOG_LEVEL, "propagate": False},
+    },
 }
 
 
@@ -191,12 +418,23 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
+    'TOKEN_OBTAIN_SERIALIZER': 'rest_api.serializers.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'rest_api.serializers.CachedTokenRefreshSerializer',
+    'TOKEN_BLACKLIST_SERIALIZER': 'rest_api.serializers.CachedTokenBlacklistSerializer',
 }
 
+# Blacklist lookups: per-process Bloom filter sized for this many tokens
+# (grown on demand), re-synced from the database at least this often
+TOKEN_BLACKLIST_BLOOM_CAPACITY = 100000
+TOKEN_BLACKLIST_SYNC_INTERVAL = 30
+# Only a cache shared by every worker carries logouts to the other
+# processes' filters; with per-process locmem each lookup reads the table
+TOKEN_BLACKLIST_BLOOM = SHARED_CACHE_BACKEND != "locmem"
+
 # PayU Configuration
 PAYU_POS_ID = '491521'
 
-#PAYU_SECOND_KEY = 'd2033056982ac5fecf2295341c16d54d'
+PAYU_SECOND_KEY = os.environ.get("PAYU_SECOND_KEY", 'd2033056982ac5fecf2295341c16d54d')
 PAYU_ORDER_URL = 'https://secure.snd.payu.com/api/v2_1/orders' 
 
 # PayU oAuth
@@ -205,6 +443,27 @@ PAYU_CLIENT_SECRET = '586334a614c4e5e6c7090b69692d1dad'
 PAYU_OAUTH_URL = 'https://secure.snd.payu.com/pl/standard/user/oauth/authorize'
 
 
+# Public URL of PayuNotification. When set, PayU pushes payment status
+# changes there and check_payment no longer calls PayU
+PAYU_NOTIFY_URL = os.environ.get("PAYU_NOTIFY_URL")
+
+# Tokens are treated as expired this many seconds early and refreshed in
+# the background once they enter the refresh-ahead window
+PAYU_TOKEN_EXPIRY_MARGIN = 30
+PAYU_TOKEN_REFRESH_AHEAD = 300
+
+# PayU HTTP client: pooled keep-alive session, (connect, read) timeouts in
+# seconds, retries for idempotent calls and a circuit breaker
+PAYU_POOL_SIZE = int(os.environ.get("PAYU_POOL_SIZE", 20))
+PAYU_ASYNC_POOL_SIZE = int(os.environ.get("PAYU_ASYNC_POOL_SIZE", 200))
+PAYU_CONNECT_TIMEOUT = 3.05
+PAYU_READ_TIMEOUT = 10
+PAYU_MAX_RETRIES = 2
+PAYU_RETRY_BACKOFF = 0.2
+PAYU_BREAKER_THRESHOLD = 5
+PAYU_BREAKER_RESET_TIMEOUT = 30
+
+
 FRONT_BASE_URL = 'http://localhost:8080'
 PAYU_API_URL = 'https://secure.snd.payu.com/api/v2_1'  # Sandbox
 
@@ -218,8 +477,25 @@ SWAGGER_SETTINGS = {
     },
     'USE_SESSION_AUTH': False,
     'JSON_EDITOR': True,
+    # The UIs load the pre-rendered schema instead of introspecting the API
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
 }
 
+REDOC_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
+}
+
+
+# Pre-rendered OpenAPI schema (rest_api.schema)
+#
+# Generated into SCHEMA_DIR by `manage.py generate_schema` (at build time)
+# or by the first request for a new code version. CODE_VERSION, e.g. the
+# git commit, saves hashing the sources at startup.
+
+SCHEMA_DIR = Path(os.environ.get("SCHEMA_DIR", BASE_DIR / "schema"))
+SCHEMA_CACHE_MAX_AGE = int(os.environ.get("SCHEMA_CACHE_MAX_AGE", 86400))
+CODE_VERSION = os.environ.get("CODE_VERSION")
+
 
 
 
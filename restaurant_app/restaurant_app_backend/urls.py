@@ -20,17 +20,12 @@ from django.urls import path, include, re_path
 from django.views.generic import TemplateView
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
+from rest_api.schema import API_INFO
+from rest_api.views import openapi_schema
 
+# Only renders the UI pages; they load the pre-rendered schema-json
 schema_view = get_schema_view(
-    openapi.Info(
-        title="Restaurant API",
-        default_version='v1',
-        description="API for Restaurant Application",
-        terms_of_service="https://www.restaurant.com/terms/",
-        contact=openapi.Contact(email="contact@restaurant.com"),
-        license=openapi.License(name="BSD License"),
-    ),
+    API_INFO,
     public=True,
     permission_classes=(permissions.AllowAny,),
 )
@@ -41,7 +36,7 @@ urlpatterns = [
     
     # Swagger URLs
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', 
-        schema_view.without_ui(cache_timeout=0), 
+        openapi_schema, 
         name='schema-json'),
     path('swagger/', 
         schema_view.with_ui('swagger', cache_timeout=0), 